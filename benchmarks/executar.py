@@ -0,0 +1,227 @@
+"""
+Benchmarks dos caminhos quentes do estoque (estoque/banco.py).
+
+    python benchmarks/executar.py --tamanhos 10000 100000 --saida resultado.json
+    python benchmarks/executar.py --comparar antes.json --saida depois.json
+
+Os bancos gerados ficam em --dir (padrão: pasta temporária) e são reaproveitados
+entre execuções com a mesma semente; apague-os para regerar.
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import platform
+import statistics
+import subprocess
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from estoque import banco
+from benchmarks.gerar_dados import popular_banco
+
+def medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return {"mediana_ms": round(statistics.median(tempos), 3), "min_ms": round(min(tempos), 3),
+            "max_ms": round(max(tempos), 3), "repeticoes": repeticoes}
+
+def frio(conn, funcao):
+    # mede a consulta em si, sem o cache de leitura do banco
+    def chamar():
+        banco.limpar_caches(conn)
+        funcao()
+    return chamar
+
+def _banco(diretorio, n, semente):
+    caminho = os.path.join(diretorio, f"bench_{n}_{semente}.db")
+    if not os.path.exists(caminho):
+        print(f"  gerando {caminho} ({n} linhas por tabela)…", flush=True)
+        inicio = time.perf_counter()
+        popular_banco(caminho, n, semente)
+        print(f"  gerado em {time.perf_counter() - inicio:.1f}s", flush=True)
+    return caminho
+
+def _copia_vazia(diretorio):
+    fd, caminho = tempfile.mkstemp(suffix=".db", dir=diretorio)
+    os.close(fd); os.remove(caminho)
+    return caminho
+
+def _remover(caminho):
+    for sufixo in ("", "-wal", "-shm"):
+        if os.path.exists(caminho + sufixo):
+            os.remove(caminho + sufixo)
+
+def _treeview(conn, n):
+    # preenchimento de Treeview sem mostrar janela; sem display o teste é pulado
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+        root = tk.Tk(); root.withdraw()
+    except Exception as e:
+        return {"pulado": f"Tk indisponível: {e}"}
+    tree = ttk.Treeview(root, columns=("codigo", "nome", "quantidade"), show="headings")
+    def pagina():
+        tree.delete(*tree.get_children())
+        for linha in banco.listar_produtos_pagina(conn, "produtos", limite=200):
+            tree.insert("", "end", values=linha)
+        root.update_idletasks()
+    def tabela_inteira():
+        tree.delete(*tree.get_children())
+        for linha in banco.listar_produtos(conn, "produtos"):
+            tree.insert("", "end", values=linha)
+        root.update_idletasks()
+    resultado = {"pagina_200": medir(pagina, 5)}
+    if n <= 100000:   # acima disso a carga completa leva minutos
+        resultado["tabela_inteira"] = medir(tabela_inteira, 1)
+    root.destroy()
+    return resultado
+
+def _partida_janela(caminho):
+    # do construtor até a primeira aba montada (sem esperar a página chegar do
+    # trabalhador); como as abas são montadas sob demanda, não deve crescer com n
+    try:
+        import tkinter as tk
+        root = tk.Tk(); root.withdraw(); root.destroy()
+    except Exception as e:
+        return {"pulado": f"Tk indisponível: {e}"}
+    import estoque_interface
+    def abrir():
+        root = tk.Tk(); root.withdraw()
+        app = estoque_interface.SistemaEstoque(root, caminho)
+        root.update()
+        app.db.fechar(); root.destroy()
+    return {"ate_primeira_aba": medir(abrir, 3)}
+
+def rodar(n, diretorio, semente=42):
+    caminho = _banco(diretorio, n, semente)
+    conn = banco.conectar_banco(caminho)
+    rep = 3 if n >= 1000000 else 5
+    termo = "luva nitr"
+    r = {}
+    r["listar_produtos"] = medir(frio(conn, lambda: banco.listar_produtos(conn, "produtos")), rep)
+    r["listar_produtos_filtro"] = medir(frio(conn, lambda: banco.listar_produtos(conn, "produtos", termo)), rep)
+    r["listar_produtos_pagina"] = medir(frio(conn, lambda: banco.listar_produtos_pagina(conn, "produtos", limite=200)), 20)
+    r["listar_produtos_pagina_cache"] = medir(lambda: banco.listar_produtos_pagina(conn, "produtos", limite=200), 20)
+    meio = conn.execute("SELECT nome, codigo FROM produtos ORDER BY nome, codigo LIMIT 1 OFFSET ?", (n // 2,)).fetchone()
+    r["listar_produtos_pagina_meio"] = medir(frio(conn, lambda: banco.listar_produtos_pagina(conn, "produtos", depois=meio, limite=200)), 20)
+    r["buscar_produto"] = medir(frio(conn, lambda: banco.buscar_produto(conn, "produtos", meio[1])), 20)
+    r["buscar_produto_cache"] = medir(lambda: banco.buscar_produto(conn, "produtos", meio[1]), 20)
+    r["buscar_texto"] = medir(lambda: banco.buscar_texto(conn, "produtos", termo), 20)
+    r["localizar_codigo"] = medir(lambda: banco.localizar(conn, meio[1]), 20)
+    r["localizar_nome"] = medir(lambda: banco.localizar(conn, termo), 20)
+    r["listar_quimicos"] = medir(frio(conn, lambda: banco.listar_quimicos(conn)), rep)
+    def validade_fria():
+        banco.limpar_caches(conn)
+        banco.verificar_validade_quimicos(conn)
+    r["verificar_validade_quimicos"] = medir(validade_fria, rep)
+    r["verificar_validade_quimicos_cache"] = medir(lambda: banco.verificar_validade_quimicos(conn), 20)
+    # 500 receitas × 10 componentes sorteados entre os químicos do banco
+    import random
+    sorteio = random.Random(semente)
+    quimicos = [c for (c,) in conn.execute("SELECT codigo FROM produtos_quimicos LIMIT 5000")]
+    ordem = [(f"R{i}", sorteio.choice((100, 500, 1000)),
+              [(sorteio.choice(quimicos), sorteio.uniform(0.01, 0.3), sorteio.choice(list(banco.UNIDADES_RECEITA))) for _ in range(10)])
+             for i in range(500)]
+    r["planejar_producao_5k_linhas"] = medir(lambda: banco.planejar_producao(conn, ordem), rep)
+    # delta das últimas 100 mudanças contra o log inteiro (uma inclusão por linha do banco)
+    fim = banco.ultima_alteracao(conn)
+    r["exportar_alteracoes_100"] = medir(lambda: banco.exportar_alteracoes(conn, os.devnull, fim - 100), 20)
+    r["exportar_alteracoes_tudo"] = medir(lambda: banco.exportar_alteracoes(conn, os.devnull), rep)
+    conn.close()
+
+    # escritas num banco à parte para não alterar o banco gerado
+    vazio = _copia_vazia(diretorio)
+    try:
+        conn = banco.conectar_banco(vazio)
+        contador = iter(range(10 ** 9))
+        r["inserir_produto"] = medir(lambda: banco.inserir_produto(conn, "produtos", f"X{next(contador)}", "Item", 1), 200)
+        arquivo = os.path.join(diretorio, f"bench_import_{semente}.csv")
+        with open(arquivo, "w", encoding="utf-8") as f:
+            f.write("codigo,nome,quantidade\n")
+            for i in range(10000):
+                f.write(f"I{i:06d},Item importado {i},{i % 50}\n")
+        r["importar_10k"] = medir(lambda: banco.importar_arquivo(conn, "produtos_epis", arquivo, upsert=True), 3)
+        os.remove(arquivo)
+        # manutenção com páginas livres a recuperar: metade das linhas importadas removida
+        with conn:
+            conn.execute("DELETE FROM itens WHERE categoria = 'epis' AND CAST(substr(codigo, 2) AS INTEGER) % 2 = 0")
+        r["manter_banco"] = medir(lambda: banco.manter_banco(conn, origem="benchmark"), 1)
+        conn.close()
+    finally:
+        _remover(vazio)
+
+    conn = banco.conectar_banco(caminho)
+    r["treeview"] = _treeview(conn, n)
+    conn.close()
+    r["janela"] = _partida_janela(caminho)
+
+    # partida a frio do CLI (processo novo a cada chamada, como num script de shell)
+    cli = [sys.executable, "-m", "estoque", "--db", caminho]
+    r["cli_mostrar"] = medir(lambda: subprocess.run(cli + ["mostrar", "produtos", meio[1]], cwd=RAIZ,
+                                                     stdout=subprocess.DEVNULL, check=True), 10)
+    r["cli_listar_200"] = medir(lambda: subprocess.run(cli + ["listar", "produtos", "--limite", "200"], cwd=RAIZ,
+                                                        stdout=subprocess.DEVNULL, check=True), 10)
+    return r
+
+def _commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(__file__),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _planos(resultados, prefixo=""):
+    # {"10000": {"x": {"mediana_ms": 1}}} -> {"10000/x": 1}
+    saida = {}
+    for chave, valor in resultados.items():
+        if isinstance(valor, dict) and "mediana_ms" in valor:
+            saida[prefixo + chave] = valor["mediana_ms"]
+        elif isinstance(valor, dict):
+            saida.update(_planos(valor, f"{prefixo}{chave}/"))
+    return saida
+
+def comparar(anterior, atual):
+    antes, depois = _planos(anterior["resultados"]), _planos(atual["resultados"])
+    print(f"\n{'medida':60} {'antes':>10} {'depois':>10} {'variação':>9}")
+    for chave in sorted(depois):
+        if chave in antes and antes[chave]:
+            var = (depois[chave] - antes[chave]) / antes[chave] * 100
+            alerta = "  <-- mais lento" if var > 20 else ""
+            print(f"{chave:60} {antes[chave]:10.3f} {depois[chave]:10.3f} {var:+8.1f}%{alerta}")
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmarks do Sistema de Estoque")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--dir", default=tempfile.gettempdir(), help="onde ficam os bancos gerados")
+    parser.add_argument("--saida", default="benchmark.json")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    args = parser.parse_args()
+
+    resultado = {"commit": _commit(), "data": datetime.now().isoformat(timespec="seconds"),
+                 "python": platform.python_version(), "sqlite": banco.sqlite3.sqlite_version,
+                 "semente": args.semente, "resultados": {}}
+    for n in args.tamanhos:
+        print(f"{n} linhas por tabela", flush=True)
+        resultado["resultados"][str(n)] = rodar(n, args.dir, args.semente)
+        for nome, medida in resultado["resultados"][str(n)].items():
+            if "mediana_ms" in medida:
+                print(f"  {nome:40} {medida['mediana_ms']:10.3f} ms")
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    print(f"resultados em {args.saida}")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(json.load(f), resultado)
+
+if __name__ == "__main__":
+    main()
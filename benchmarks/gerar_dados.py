@@ -0,0 +1,84 @@
+"""
+Gerador de dados sintéticos de almoxarifado para os benchmarks.
+Mesma semente -> mesmo banco, para comparar resultados entre commits.
+"""
+
+import os
+import sys
+import random
+from datetime import date, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from estoque import banco
+
+PALAVRAS = ["Luva", "Bota", "Óculos", "Capacete", "Máscara", "Protetor", "Avental", "Cinto", "Filtro", "Creme",
+            "Rótulo", "Sleeve", "Etiqueta", "Tampa", "Frasco", "Galão", "Caixa", "Fita", "Lacre", "Bombona",
+            "Nitrílica", "Látex", "Vinil", "Auricular", "Facial", "Térmica", "Impermeável", "Solar", "Branca", "Azul"]
+QUIMICOS = ["Soda Cáustica", "Ácido Cítrico", "Ácido Sulfônico", "Lauril", "Glicerina", "Essência Lavanda",
+            "Corante Azul", "Amida", "Formol", "Cloro Ativo", "Álcool Etílico", "Peróxido", "Tensoativo", "Espessante"]
+LOCAIS = [f"Galpão {g} — Rua {r}" for g in "ABC" for r in range(1, 5)]
+TAMANHO_LOTE = 10000
+
+def _nome(rnd):
+    return " ".join(rnd.sample(PALAVRAS, rnd.randint(2, 4))) + f" {rnd.randint(1, 999)}"
+
+def _produtos(rnd, prefixo, n):
+    for i in range(n):
+        # poucos itens com muito estoque, muitos com pouco
+        yield (f"{prefixo}{i:07d}", _nome(rnd), int(rnd.paretovariate(1.2) * 5))
+
+def _quimicos(rnd, n, hoje):
+    # lotes são compartilhados por vários produtos (lotes grandes são raros)
+    lotes = [f"L{(hoje - timedelta(weeks=s)).strftime('%y%W')}-{k:03d}" for s in range(104) for k in range(40)]
+    for i in range(n):
+        dens = round(rnd.uniform(0.7, 1.9), 4)
+        litros = round(rnd.lognormvariate(4, 1), 3)
+        sorteio = rnd.random()
+        if sorteio < 0.05:     # ~5% vencidos
+            validade = hoje - timedelta(days=rnd.randint(1, 365))
+        elif sorteio < 0.07:   # ~2% vencendo nos próximos dias
+            validade = hoje + timedelta(days=rnd.randint(0, banco.VALIDADE_ALERT_DIAS))
+        elif sorteio < 0.10:   # ~3% sem validade
+            validade = None
+        else:
+            validade = hoje + timedelta(days=rnd.randint(banco.VALIDADE_ALERT_DIAS + 1, 730))
+        lote = lotes[min(int(rnd.expovariate(1 / 400)), len(lotes) - 1)]
+        yield (f"Q{i:07d}", f"{rnd.choice(QUIMICOS)} {rnd.randint(1, 99)}%", dens, "kg/L", litros, round(dens * litros, 3),
+               rnd.choice(LOCAIS), lote, validade.isoformat() if validade else None)
+
+def _inserir(conn, sql, linhas):
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= TAMANHO_LOTE:
+            with conn:
+                conn.executemany(sql, lote)
+            lote = []
+    if lote:
+        with conn:
+            conn.executemany(sql, lote)
+
+def popular_banco(caminho, n, semente=42):
+    """Cria `caminho` com n linhas em cada uma das quatro tabelas."""
+    rnd = random.Random(semente)
+    hoje = date.today()
+    conn = banco.conectar_banco(caminho)
+    for tabela, prefixo in (("produtos", "P"), ("produtos_epis", "E"), ("produtos_rotulos", "R")):
+        categoria = banco.CATEGORIAS[tabela]
+        _inserir(conn, "INSERT INTO itens (categoria, codigo, nome, quantidade) VALUES (?, ?, ?, ?)",
+                 ((categoria,) + linha for linha in _produtos(rnd, prefixo, n)))
+    _inserir(conn, """INSERT INTO produtos_quimicos (codigo, nome, densidade_kg_l, unidade_origem, litros, kilos,
+                      local_armazenamento, lote, validade) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", _quimicos(rnd, n, hoje))
+    conn.execute("ANALYZE")
+    conn.close()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Gera um estoque.db sintético")
+    parser.add_argument("caminho")
+    parser.add_argument("linhas", type=int, help="linhas por tabela")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+    popular_banco(args.caminho, args.linhas, args.semente)
@@ -0,0 +1,11 @@
+"""
+Sistema de Estoque — BR Brasil
+
+    estoque.banco      SQLite: esquema, helpers, cache, importação/exportação
+    estoque.servidor   servidor HTTP/JSON
+    estoque.estresse   teste de concorrência entre processos
+    python -m estoque  linha de comando (sem Tk)
+
+A janela fica em estoque_interface.py. Este arquivo não importa nada, para que
+python -m estoque só carregue o que o comando usar.
+"""
@@ -0,0 +1,423 @@
+"""
+Linha de comando do Sistema de Estoque, sem Tk (scripts, cron, SSH).
+
+    python -m estoque listar epis --filtro luva
+    python -m estoque buscar produtos "luva nitr"
+    python -m estoque localizar E0000012
+    python -m estoque baixa epis E0000012 3
+    python -m estoque baixa epis - < leituras.txt       (uma linha por leitura: código [quantidade])
+    python -m estoque baixa quimicos Q0000003 12.5        (kg, dos lotes que vencem primeiro; vencidos só com --vencidos)
+    python -m estoque exportar quimicos - --formato jsonl | jq .
+    python -m estoque validade || enviar_alerta.sh
+    python -m estoque baixo epis || enviar_alerta.sh     (itens no ponto de reposição ou abaixo)
+    python -m estoque minimo epis - < minimos.txt        (uma linha por item: código mínimo)
+    python -m estoque planejar ordem_producao.csv     (químicos em falta; código de saída 1 se houver)
+    python -m estoque backup --comprimir                 (cópia online; guarda as BACKUP_MANTER mais novas)
+    python -m estoque manutencao --se-pendente           (cron: ANALYZE, VACUUM incremental, quick_check)
+    python -m estoque consolidar epis sp/estoque.db rj/estoque.db --saida epis.xlsx
+    python -m estoque alteracoes --desde 1200 > delta.jsonl   (só as mudanças depois do seq 1200)
+    python -m estoque sincronizar ../estacao2/estoque.db      (puxa o que mudou lá desde a última vez)
+
+A saída das listas é uma linha por item com os campos separados por TAB, sem
+cabeçalho. Erros vão para o stderr; o código de saída é 1 se algo falhou.
+"""
+
+import os
+import sys
+import sqlite3
+import argparse
+
+from .banco import (DB_FILE, COLUNAS_TABELAS, BACKUP_DIR, BACKUP_MANTER, fazer_backup, restaurar_backup, listar_backups,
+                    conectar_banco, listar_produtos_pagina, listar_quimicos_pagina, buscar_texto, localizar,
+                    buscar_produto, buscar_quimico, inserir_produto, movimentar_lote, listar_lotes, dar_entrada_lote,
+                    baixar_quimico, importar_arquivo, escrever_registros, exportar_arquivo, exportar_relatorio,
+                    verificar_validade_quimicos, planejar_producao_arquivo, definir_minimos, listar_estoque_baixo,
+                    manter_banco, manter_se_pendente, vacuum_incremental, listar_manutencoes,
+                    MANUTENCAO_INTERVALO_HORAS, COLUNAS_MANUTENCAO, consolidar_bancos, exportar_consolidado,
+                    exportar_alteracoes, podar_alteracoes, aplicar_alteracoes, ler_arquivo_alteracoes, sincronizar,
+                    listar_sincronizacoes)
+
+TABELAS = {"principal": "produtos", "epis": "produtos_epis", "rotulos": "produtos_rotulos", "quimicos": "produtos_quimicos"}
+TABELAS.update({t: t for t in COLUNAS_TABELAS})
+TAMANHO_PAGINA = 1000
+
+def _tabela(nome):
+    if nome not in TABELAS:
+        raise argparse.ArgumentTypeError(f"tabela desconhecida: {nome} (use {', '.join(TABELAS)})")
+    return TABELAS[nome]
+
+def _escrever(linha):
+    sys.stdout.write("\t".join("" if v is None else str(v) for v in linha) + "\n")
+
+def _erro(mensagem):
+    print(mensagem, file=sys.stderr)
+
+# -----------------------
+# Comandos
+# -----------------------
+def cmd_listar(conn, args):
+    # keyset página a página: memória constante mesmo sem --limite
+    restantes, depois = args.limite or None, None
+    while restantes is None or restantes > 0:
+        limite = min(TAMANHO_PAGINA, restantes or TAMANHO_PAGINA)
+        if args.tabela == "produtos_quimicos":
+            linhas = listar_quimicos_pagina(conn, args.filtro, depois=depois, limite=limite)
+        else:
+            linhas = listar_produtos_pagina(conn, args.tabela, args.filtro, depois=depois, limite=limite)
+        for linha in linhas:
+            _escrever(linha)
+        if len(linhas) < limite: break
+        depois = (linhas[-1][1], linhas[-1][0])
+        if restantes is not None: restantes -= len(linhas)
+    return 0
+
+def cmd_buscar(conn, args):
+    for linha in buscar_texto(conn, args.tabela, args.termo, args.limite):
+        _escrever(linha)
+    return 0
+
+def cmd_localizar(conn, args):
+    achados = localizar(conn, args.termo, args.limite)
+    for linha in achados:
+        _escrever(linha)
+    return 0 if achados else 1
+
+def cmd_mostrar(conn, args):
+    ok = True
+    for codigo in args.codigos:
+        linha = buscar_quimico(conn, codigo) if args.tabela == "produtos_quimicos" else buscar_produto(conn, args.tabela, codigo)
+        if linha: _escrever(linha)
+        else: _erro(f"{codigo}: não encontrado"); ok = False
+    return 0 if ok else 1
+
+def cmd_inserir(conn, args):
+    if args.tabela == "produtos_quimicos":
+        _erro("químicos têm mais campos: use python -m estoque importar quimicos ARQUIVO"); return 1
+    if not inserir_produto(conn, args.tabela, args.codigo, args.nome, args.quantidade):
+        _erro(f"{args.codigo}: código já cadastrado"); return 1
+    return 0
+
+def _leituras(arquivo):
+    # "codigo" ou "codigo<espaço/TAB>quantidade" por linha
+    for n, texto in enumerate(arquivo, start=1):
+        partes = texto.split()
+        if not partes: continue
+        try:
+            yield partes[0], int(partes[1]) if len(partes) > 1 else 1
+        except ValueError:
+            raise SystemExit(f"linha {n}: quantidade inválida: {partes[1]}")
+
+def cmd_movimentar(conn, args):
+    if args.tabela == "produtos_quimicos":
+        return _movimentar_quimico(conn, args)
+    if args.codigo == "-":
+        itens = list(_leituras(sys.stdin))
+    elif args.codigo:
+        quantidade = 1.0 if args.quantidade is None else args.quantidade   # uma leitura do código de barras
+        if not quantidade.is_integer():
+            _erro(f"quantidade inválida: {quantidade:g}"); return 1
+        itens = [(args.codigo, int(quantidade))]
+    else:
+        _erro("informe CÓDIGO [QUANTIDADE] ou - para ler do stdin"); return 1
+    r = movimentar_lote(conn, args.tabela, args.comando, itens, parcial=not args.tudo_ou_nada)
+    for codigo, quantidade, novo in r["aplicados"]:
+        _escrever((codigo, quantidade, novo))
+    for codigo, mensagem in r["erros"]:
+        _erro(f"{codigo}: {mensagem}")
+    return 1 if r["erros"] else 0
+
+def _movimentar_quimico(conn, args):
+    # químicos: quantidade em kg; a entrada é de um lote, a baixa sai por FEFO
+    # sem o padrão de 1 dos outros estoques: "baixa quimicos Q1" não pode virar 1 kg
+    if not args.codigo or args.codigo == "-" or args.quantidade is None:
+        _erro("químicos: informe CÓDIGO KG (um por vez)"); return 1
+    if args.quantidade <= 0:
+        _erro(f"{args.codigo}: quantidade inválida: {args.quantidade:g}"); return 1
+    try:
+        if args.comando == "entrada":
+            if not args.lote:
+                _erro("entrada de químico precisa de --lote"); return 1
+            dar_entrada_lote(conn, args.codigo, args.lote, args.validade, kilos=args.quantidade, local=args.local)
+            _escrever((args.codigo, args.lote, args.quantidade, buscar_quimico(conn, args.codigo)[5]))
+        else:
+            for linha in baixar_quimico(conn, args.codigo, args.quantidade, incluir_vencidos=args.vencidos):
+                _escrever((args.codigo,) + linha)
+    except ValueError as e:
+        _erro(f"{args.codigo}: {e}"); return 1
+    return 0
+
+def cmd_lotes(conn, args):
+    # lote, validade, litros, kilos, local — na ordem em que as baixas consomem
+    if not buscar_quimico(conn, args.codigo):
+        _erro(f"{args.codigo}: não encontrado"); return 1
+    for linha in listar_lotes(conn, args.codigo):
+        _escrever(linha)
+    return 0
+
+def cmd_importar(conn, args):
+    try:
+        r = importar_arquivo(conn, args.tabela, args.arquivo, args.formato, upsert=args.upsert)
+    except (OSError, ValueError) as e:
+        _erro(f"{args.arquivo}: {e}"); return 1
+    for n, mensagem in r["erros"]:
+        _erro(f"registro {n}: {mensagem}")
+    print(f"{r['gravados']} de {r['lidos']} registros gravados", file=sys.stderr)
+    return 1 if r["erros"] else 0
+
+def cmd_exportar(conn, args):
+    formato = args.formato
+    if args.arquivo == "-":
+        if formato in ("xlsx", "pdf"):
+            _erro(f"{formato} não vai para o stdout: informe um arquivo"); return 1
+        escrever_registros(conn, args.tabela, sys.stdout, formato or "csv", filtro=args.filtro)
+        return 0
+    formato = formato or os.path.splitext(args.arquivo)[1].lstrip(".").lower() or "csv"
+    if formato in ("xlsx", "pdf") or args.filtro:
+        total = exportar_relatorio(conn, "detalhe", args.arquivo, formato, tabela=args.tabela, filtro=args.filtro)
+    else:
+        total = exportar_arquivo(conn, args.tabela, args.arquivo, formato)
+    print(f"{total} registros exportados para {args.arquivo}", file=sys.stderr)
+    return 0
+
+def cmd_validade(conn, args):
+    vencidos, proximos = verificar_validade_quimicos(conn)
+    for nome, validade in vencidos:
+        _escrever(("vencido", validade, nome))
+    for nome, validade, dias in proximos:
+        _escrever((f"vence em {dias} dias", validade, nome))
+    return 1 if vencidos or proximos else 0
+
+def cmd_minimo(conn, args):
+    if args.tabela == "produtos_quimicos":
+        _erro("ponto de reposição só nos estoques (principal, epis, rotulos)"); return 1
+    if args.codigo == "-":
+        pares = list(_leituras(sys.stdin))
+    elif args.minimo is not None:
+        pares = [(args.codigo, args.minimo)]
+    else:
+        _erro("informe CÓDIGO MÍNIMO ou - para ler do stdin"); return 1
+    try:
+        faltando = definir_minimos(conn, args.tabela, pares)
+    except ValueError as e:
+        _erro(str(e)); return 1
+    for codigo in faltando:
+        _erro(f"{codigo}: não encontrado")
+    return 1 if faltando else 0
+
+def cmd_baixo(conn, args):
+    linhas = listar_estoque_baixo(conn, args.tabela)
+    for linha in linhas:
+        _escrever(linha)
+    return 1 if linhas else 0
+
+def cmd_planejar(conn, args):
+    r = planejar_producao_arquivo(conn, args.arquivo)
+    for n, mensagem in r["erros_arquivo"]:
+        _erro(f"linha {n}: {mensagem}")
+    for receita, codigo, mensagem in r["erros"]:
+        _erro(f"{receita + ': ' if receita else ''}{codigo}: {mensagem}")
+    # codigo, nome, necessário kg, disponível kg, falta kg, necessário L, disponível L
+    for linha in (r["linhas"] if args.todos else r["faltas"]):
+        _escrever(linha)
+    return 1 if r["faltas"] or r["erros"] or r["erros_arquivo"] else 0
+
+def cmd_backup(conn, args):
+    if args.listar:
+        for caminho, momento, tamanho in listar_backups(args.dir):
+            _escrever((momento, tamanho, caminho))
+        return 0
+    r = fazer_backup(conn, args.dir, comprimir=args.comprimir, manter=args.manter)
+    _escrever((r["arquivo"],))
+    _erro(f"{r['paginas']} páginas, {r['bytes']} bytes em {r['segundos']} s")
+    return 0
+
+def cmd_restaurar(conn, args):
+    try:
+        r = restaurar_backup(conn, args.arquivo, copia_antes=not args.sem_copia, diretorio=args.dir)
+    except (sqlite3.DatabaseError, OSError) as e:
+        _erro(f"{args.arquivo}: {e}"); return 1
+    if r["copia_antes"]: _erro(f"estado anterior guardado em {r['copia_antes']}")
+    _erro(f"{args.db} restaurado de {r['arquivo']} ({r['paginas']} páginas, conferido, {r['segundos']} s)")
+    return 0
+
+def cmd_manutencao(conn, args):
+    if args.historico:
+        for r in listar_manutencoes(conn, args.historico):
+            _escrever(tuple(r[c] for c in COLUNAS_MANUTENCAO))
+        return 0
+    opcoes = dict(vacuum=not args.sem_vacuum, completo=args.completo, origem="cli")
+    r = manter_se_pendente(conn, args.intervalo, **opcoes) if args.se_pendente else manter_banco(conn, **opcoes)
+    if r is None:
+        _erro(f"manutenção em dia (a última foi há menos de {args.intervalo:g} h)"); return 0
+    _escrever(tuple(r[c] for c in COLUNAS_MANUTENCAO))
+    _erro(f"{r['paginas_antes']} -> {r['paginas_depois']} páginas ({r['livres_antes']} -> {r['livres_depois']} livres), "
+          f"vacuum {r['vacuum'] or 'não'}, verificação: {r['verificacao']}, {r['segundos']} s")
+    if not vacuum_incremental(conn):
+        _erro("banco sem VACUUM incremental: rode uma vez manutencao --completo, fora do expediente")
+    return 0 if r["verificacao"] == "ok" else 1
+
+def cmd_alteracoes(conn, args):
+    if args.podar_ate is not None:
+        _erro(f"{podar_alteracoes(conn, args.podar_ate)} alterações removidas do log"); return 0
+    n, ultimo = exportar_alteracoes(conn, args.saida, args.desde, compactar=args.compactar, apenas_locais=args.locais)
+    _erro(f"{n} alterações; próxima vez use --desde {ultimo}")
+    return 0
+
+def cmd_aplicar(conn, args):
+    try:
+        r = aplicar_alteracoes(conn, ler_arquivo_alteracoes(args.arquivo), args.origem)
+    except (ValueError, KeyError, OSError) as e:
+        _erro(f"{args.arquivo}: {e} (nada foi aplicado)"); return 1
+    _erro(f"{r['aplicadas']} aplicadas, {r['puladas']} já aplicadas antes; até o seq {r['ate']}")
+    return 0
+
+def cmd_sincronizar(conn, args):
+    if not args.bancos:
+        for linha in listar_sincronizacoes(conn):
+            _escrever(linha)
+        return 0
+    falhas = 0
+    for caminho in args.bancos:
+        try:
+            r = sincronizar(conn, caminho, args.origem)
+        except (sqlite3.DatabaseError, ValueError, KeyError, OSError) as e:
+            _erro(f"{caminho}: {e}"); falhas += 1; continue
+        _erro(f"{r['origem']}: {r['aplicadas']} alterações aplicadas (até o seq {r['ate']})")
+    return 1 if falhas else 0
+
+def cmd_consolidar(args):
+    # não usa --db: lê só os bancos informados, sem alterar nenhum
+    r = consolidar_bancos(args.bancos, args.filtro)
+    for unidade, mensagem in r["erros"]:
+        _erro(f"{unidade}: {mensagem}")
+    if not r["unidades"]: return 1
+    _erro(f"unidades: {', '.join(r['unidades'])}")
+    if args.saida:
+        total = exportar_consolidado(r, args.tabela, args.saida)
+        _erro(f"{total} registros exportados para {args.saida}")
+    else:
+        for linha in (r["validade"] if args.tabela == "validade" else r["tabelas"][args.tabela][1]):
+            _escrever(linha)
+    return 1 if r["erros"] else 0
+
+# servidor (http.server) e estresse (multiprocessing) pesam na partida: só os
+# próprios comandos os importam
+def cmd_servir(args):
+    from .servidor import servir
+    servir(args.host, args.port, args.db, args.conexoes)
+    return 0
+
+def cmd_estresse(args):
+    from .estresse import estressar_banco
+    ok = estressar_banco(os.path.dirname(os.path.abspath(args.db)), args.processos, args.operacoes)
+    return 0 if ok else 1
+
+# -----------------------
+# main()
+# -----------------------
+def _argumentos():
+    parser = argparse.ArgumentParser(prog="python -m estoque", description="Sistema de Estoque — linha de comando")
+    parser.add_argument("--db", default=os.environ.get("ESTOQUE_DB", DB_FILE), help="arquivo do banco (ou ESTOQUE_DB)")
+    sub = parser.add_subparsers(dest="comando", required=True, metavar="COMANDO")
+    tabela = lambda p: p.add_argument("tabela", type=_tabela, help=", ".join(TABELAS))
+
+    p = sub.add_parser("listar", help="lista por nome (código, nome, quantidade...)"); tabela(p)
+    p.add_argument("--filtro"); p.add_argument("--limite", type=int, default=0, help="0 = todos")
+    p = sub.add_parser("buscar", help="busca por relevância no nome/código"); tabela(p)
+    p.add_argument("termo"); p.add_argument("--limite", type=int, default=50)
+    p = sub.add_parser("localizar", help="código ou nome em todos os estoques (tabela, código, nome, quantidade)")
+    p.add_argument("termo"); p.add_argument("--limite", type=int, default=50)
+    p = sub.add_parser("mostrar", help="mostra itens pelo código"); tabela(p)
+    p.add_argument("codigos", nargs="+", metavar="CODIGO")
+    p = sub.add_parser("inserir", help="cadastra um produto"); tabela(p)
+    p.add_argument("codigo"); p.add_argument("nome"); p.add_argument("quantidade", type=int, nargs="?", default=0)
+    for tipo in ("baixa", "entrada"):
+        p = sub.add_parser(tipo, help=f"{tipo} de um item, ou de um lote lido do stdin (-)"); tabela(p)
+        p.add_argument("codigo", nargs="?")
+        p.add_argument("quantidade", type=float, nargs="?", help="padrão 1; nos químicos (kg) é obrigatória")
+        p.add_argument("--tudo-ou-nada", action="store_true", help="não grava nada se alguma linha falhar")
+        if tipo == "entrada":
+            p.add_argument("--lote", help="químicos: lote recebido"); p.add_argument("--validade"); p.add_argument("--local")
+        else:
+            p.add_argument("--vencidos", action="store_true", help="químicos: baixa também de lotes vencidos")
+    p = sub.add_parser("lotes", help="lotes de um químico, na ordem de saída (FEFO)")
+    p.add_argument("codigo")
+    p = sub.add_parser("importar", help="importa CSV / JSON / JSON Lines"); tabela(p)
+    p.add_argument("arquivo"); p.add_argument("--formato", choices=("csv", "json"))
+    p.add_argument("--upsert", action="store_true", help="atualiza os códigos já cadastrados")
+    p = sub.add_parser("exportar", help="exporta CSV / JSON / JSON Lines / XLSX / PDF"); tabela(p)
+    p.add_argument("arquivo", nargs="?", default="-", help="- = stdout (padrão)")
+    p.add_argument("--formato", choices=("csv", "json", "jsonl", "xlsx", "pdf")); p.add_argument("--filtro")
+    sub.add_parser("validade", help="químicos vencidos ou vencendo (código de saída 1 se houver)")
+    p = sub.add_parser("minimo", help="define o ponto de reposição (0 = sem alerta)"); tabela(p)
+    p.add_argument("codigo", help="- = lê \"código mínimo\" por linha do stdin"); p.add_argument("minimo", type=int, nargs="?")
+    p = sub.add_parser("baixo", help="itens no ponto de reposição ou abaixo (código de saída 1 se houver)")
+    p.add_argument("tabela", type=_tabela, nargs="?", help="padrão: todos os estoques")
+    p = sub.add_parser("planejar", help="confere uma ordem de produção (receita, volume_l, codigo, quantidade, unidade) contra os químicos")
+    p.add_argument("arquivo", help="CSV / JSON, uma linha por componente; unidades: kg/L, g/L, L/L, mL/L, %%")
+    p.add_argument("--todos", action="store_true", help="lista todos os químicos, não só os em falta")
+    p = sub.add_parser("backup", help="cópia de segurança online (API de backup do SQLite), com rodízio")
+    p.add_argument("--dir", default=BACKUP_DIR); p.add_argument("--comprimir", action="store_true", help="grava .db.gz")
+    p.add_argument("--manter", type=int, default=BACKUP_MANTER, help="quantas cópias guardar")
+    p.add_argument("--listar", action="store_true", help="lista as cópias existentes")
+    p = sub.add_parser("restaurar", help="confere uma cópia e restaura o banco a partir dela")
+    p.add_argument("arquivo"); p.add_argument("--dir", default=BACKUP_DIR, help="onde guardar a cópia do estado atual")
+    p.add_argument("--sem-copia", action="store_true", help="não guarda o estado atual antes de restaurar")
+    p = sub.add_parser("manutencao", help="quick_check, ANALYZE e VACUUM incremental; código de saída 1 se a verificação falhar")
+    p.add_argument("--se-pendente", action="store_true", help="só roda se a última passada tiver mais de --intervalo horas")
+    p.add_argument("--intervalo", type=float, default=MANUTENCAO_INTERVALO_HORAS, help="horas (padrão: ESTOQUE_MANUTENCAO_HORAS ou 24)")
+    p.add_argument("--sem-vacuum", action="store_true", help="só verificação e estatísticas")
+    p.add_argument("--completo", action="store_true",
+                   help="VACUUM completo; converte banco antigo para o incremental (reescreve o arquivo; segura a escrita até terminar)")
+    p.add_argument("--historico", type=int, nargs="?", const=30, metavar="N", help="lista as N últimas passadas")
+    p = sub.add_parser("alteracoes", help="mudanças (JSON Lines) depois de um seq, para o ERP ou outra estação")
+    p.add_argument("--desde", type=int, default=0, help="último seq já lido (0 = tudo)")
+    p.add_argument("--compactar", action="store_true", help="só a última mudança de cada item")
+    p.add_argument("--locais", action="store_true", help="só as feitas aqui, sem as recebidas de outros bancos")
+    p.add_argument("--saida", default="-", help="- = stdout (padrão)")
+    p.add_argument("--podar-ate", type=int, metavar="SEQ", help="apaga do log as mudanças até SEQ, já lidas por todos")
+    p = sub.add_parser("aplicar", help="aplica um arquivo de alterações numa transação só")
+    p.add_argument("arquivo", help="JSON Lines de `alteracoes`; - = stdin")
+    p.add_argument("--origem", help="nome de quem gerou: guarda até onde já foi aplicado e pula o repetido")
+    p = sub.add_parser("sincronizar", help="puxa as mudanças feitas em outro banco desde a última vez (sem BANCO: mostra as marcas)")
+    p.add_argument("bancos", nargs="*", metavar="BANCO")
+    p.add_argument("--origem", help="nome da origem (padrão: o da unidade, como no consolidar)")
+    p = sub.add_parser("consolidar", help="junta a tabela (ou a validade) de vários bancos, com uma coluna por unidade")
+    p.add_argument("tabela", type=lambda t: t if t == "validade" else _tabela(t), help=", ".join(TABELAS) + ", validade")
+    p.add_argument("bancos", nargs="+", metavar="BANCO"); p.add_argument("--filtro")
+    p.add_argument("--saida", help="grava CSV / XLSX / PDF em vez de escrever no stdout")
+    p = sub.add_parser("servir", help="servidor HTTP/JSON")
+    p.add_argument("--host", default="127.0.0.1"); p.add_argument("--port", type=int, default=8080)
+    p.add_argument("--conexoes", type=int, default=4)
+    p = sub.add_parser("estresse", help="testa escrita concorrente num banco temporário ao lado de --db")
+    p.add_argument("--processos", type=int, default=4); p.add_argument("--operacoes", type=int, default=500)
+    return parser
+
+COMANDOS = {"listar": cmd_listar, "buscar": cmd_buscar, "localizar": cmd_localizar, "mostrar": cmd_mostrar, "inserir": cmd_inserir,
+            "baixa": cmd_movimentar, "entrada": cmd_movimentar, "importar": cmd_importar,
+            "exportar": cmd_exportar, "validade": cmd_validade, "planejar": cmd_planejar, "lotes": cmd_lotes,
+            "minimo": cmd_minimo, "baixo": cmd_baixo,
+            "backup": cmd_backup, "restaurar": cmd_restaurar, "manutencao": cmd_manutencao, "alteracoes": cmd_alteracoes, "aplicar": cmd_aplicar,
+            "sincronizar": cmd_sincronizar}
+
+def main(argv=None):
+    args = _argumentos().parse_args(argv)
+    if args.comando == "servir": return cmd_servir(args)
+    if args.comando == "estresse": return cmd_estresse(args)
+    if args.comando == "consolidar": return _sem_pipe_quebrado(cmd_consolidar, args)
+    conn = conectar_banco(args.db)
+    try:
+        return _sem_pipe_quebrado(COMANDOS[args.comando], conn, args)
+    finally:
+        conn.close()
+
+def _sem_pipe_quebrado(comando, *args):
+    try:
+        return comando(*args)
+    except BrokenPipeError:
+        # `| head` fechou a saída: o resto vai para o devnull, inclusive o flush final
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2409 @@
+"""
+Camada de banco do Sistema de Estoque (SQLite), sem Tk.
+
+Usada pela janela (estoque_interface.py), pelo servidor HTTP e pela linha de
+comando (python -m estoque). Para a linha de comando abrir rápido, os módulos
+pesados (csv, zipfile, cProfile...) são importados nas funções que os usam.
+"""
+
+import sqlite3
+import re
+import json
+import os
+import sys
+import time
+import functools
+import threading
+import zlib
+from datetime import datetime, date, timedelta
+from contextlib import contextmanager
+from collections import OrderedDict
+
+DB_FILE = "estoque.db"
+VALIDADE_ALERT_DIAS = 10
+
+# WAL deixa leitores e escritor trabalharem ao mesmo tempo, mas exige que todos os
+# processos estejam na mesma máquina que o arquivo. Com o banco numa pasta de rede
+# use ESTOQUE_JOURNAL_MODE=DELETE.
+JOURNAL_MODE = os.environ.get("ESTOQUE_JOURNAL_MODE", "WAL")
+BUSY_TIMEOUT_MS = 5000
+CACHE_KB = 16000
+MMAP_BYTES = 128 * 1024 * 1024
+TENTATIVAS_ESCRITA = 6
+
+# -----------------------
+# Banco
+# -----------------------
+class Conexao(sqlite3.Connection):
+    # os caches por conexão (CacheLeitura, verificar_validade_quimicos) ficam presos
+    # à própria conexão: somem junto com ela, e uma conexão nova nunca herda o cache
+    # de outra (como podia acontecer numa tabela global por id(conn) reaproveitado)
+    cache_leitura = None
+    cache_validade = None
+
+def limpar_caches(conn):
+    # depois de uma escrita que passou por baixo do cache (restauração de backup)
+    if isinstance(conn, Conexao): conn.cache_leitura = conn.cache_validade = None
+
+def conectar_banco(path=DB_FILE, check_same_thread=True):
+    # conexão de escrita: transações começam com BEGIN IMMEDIATE, então duas
+    # escritas concorrentes esperam na fila do busy_timeout em vez de dar deadlock
+    novo = not os.path.exists(path) or os.path.getsize(path) == 0
+    conn = sqlite3.connect(path, check_same_thread=check_same_thread, isolation_level="IMMEDIATE", factory=Conexao)
+    # só vale antes da primeira tabela (e antes do WAL); bancos antigos mudam no
+    # primeiro manter_banco
+    if novo: conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    configurar_conexao(conn)
+    # cria/atualiza o esquema; num banco já na versão atual não faz nada
+    migrar_banco(conn)
+    return conn
+
+def conectar_leitura(path=DB_FILE, check_same_thread=True):
+    # conexão só de leitura (query_only); em WAL não bloqueia nem é bloqueada pela
+    # escrita. O esquema precisa já ter sido criado por conectar_banco.
+    conn = sqlite3.connect(path, check_same_thread=check_same_thread, factory=Conexao)
+    configurar_conexao(conn, leitura=True)
+    return conn
+
+def configurar_conexao(conn, leitura=False):
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    modo = JOURNAL_MODE
+    if not leitura:
+        # o modo fica gravado no arquivo; quando já está em WAL isto não faz nada
+        modo = conn.execute(f"PRAGMA journal_mode = {JOURNAL_MODE}").fetchone()[0]
+    # com WAL, NORMAL só arrisca o último commit numa queda de energia (sem corromper)
+    conn.execute(f"PRAGMA synchronous = {'NORMAL' if str(modo).upper() == 'WAL' else 'FULL'}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_BYTES}")
+    if leitura:
+        conn.execute("PRAGMA query_only = 1")
+    if RASTREAR_SQL:
+        conn.set_trace_callback(metricas.rastreador())
+
+def _banco_ocupado(erro):
+    texto = str(erro).lower()
+    return "locked" in texto or "busy" in texto
+
+def com_retentativa(funcao):
+    # repete a escrita quando o banco continua travado depois do busy_timeout
+    # (troca de turno, outro PC importando), com espera exponencial e jitter
+    @functools.wraps(funcao)
+    def envolvida(*args, **kwargs):
+        espera = 0.05
+        for tentativa in range(TENTATIVAS_ESCRITA):
+            try:
+                return funcao(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not _banco_ocupado(e) or tentativa == TENTATIVAS_ESCRITA - 1:
+                    raise
+                import random
+                time.sleep(espera * (1 + random.random()))
+                espera *= 2
+    return envolvida
+
+def _criar_tabelas(conn):
+    # tabelas de estoques
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS produtos (
+            codigo TEXT PRIMARY KEY,
+            nome TEXT NOT NULL,
+            quantidade INTEGER NOT NULL
+        )""")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS produtos_epis (
+            codigo TEXT PRIMARY KEY,
+            nome TEXT NOT NULL,
+            quantidade INTEGER NOT NULL
+        )""")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS produtos_rotulos (
+            codigo TEXT PRIMARY KEY,
+            nome TEXT NOT NULL,
+            quantidade INTEGER NOT NULL
+        )""")
+    # cria a tabela produtos_quimicos com colunas mínimas — as colunas completas
+    # serão garantidas pela função de correção automática (sem popup).
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS produtos_quimicos (
+            codigo TEXT PRIMARY KEY,
+            nome TEXT NOT NULL
+        )""")
+
+# -----------------------
+# Instrumentação
+# -----------------------
+# Contagem de comandos SQL (set_trace_callback) e histogramas de latência das
+# funções de banco, atualizações de lista e janelas. Aparece em Relatórios.
+#   ESTOQUE_METRICAS=0      desliga tudo
+#   ESTOQUE_METRICAS=sql    também conta os comandos SQL; o trace roda a cada comando
+#                           (e a cada linha de um executemany), então deixa importações
+#                           ~60% mais lentas e fica desligado por padrão
+#   ESTOQUE_PERFIL_MS=300   grava um cProfile (pasta ESTOQUE_PERFIL_DIR) de toda
+#                           chamada medida que passar de 300 ms
+INSTRUMENTAR = os.environ.get("ESTOQUE_METRICAS", "1") != "0"
+RASTREAR_SQL = os.environ.get("ESTOQUE_METRICAS", "").lower() == "sql"
+PERFIL_LENTO_MS = float(os.environ.get("ESTOQUE_PERFIL_MS", "0") or 0)
+PERFIL_DIR = os.environ.get("ESTOQUE_PERFIL_DIR", "perfis")
+FAIXAS_MS = (0.25, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+MAX_COMANDOS_SQL = 500
+
+_RE_LITERAIS_SQL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_RE_LISTAS_SQL = re.compile(r"\bIN\s*\((?:\s*\?\s*,)+\s*\?\s*\)", re.IGNORECASE)
+_RE_ESPACOS = re.compile(r"\s+")
+_RE_PRIMEIRO_LITERAL = re.compile(r"'|\b\d")
+
+def normalizar_sql(sql):
+    # o trace recebe o SQL com os valores já substituídos; volta a "?" para
+    # agrupar as execuções do mesmo comando
+    sql = _RE_LITERAIS_SQL.sub("?", sql)
+    return _RE_ESPACOS.sub(" ", _RE_LISTAS_SQL.sub("IN (?)", sql)).strip()
+
+class Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.desde = _agora_iso()
+        self._tempos = {}    # (categoria, nome) -> [chamadas, total_ms, max_ms, [contagem por faixa]]
+        self._comandos = []  # um dict sql normalizado -> execuções por conexão rastreada
+        self.perfis = []     # (nome, ms, arquivo)
+
+    def registrar(self, categoria, nome, ms):
+        with self._lock:
+            dado = self._tempos.get((categoria, nome))
+            if dado is None:
+                dado = self._tempos[(categoria, nome)] = [0, 0.0, 0.0, [0] * (len(FAIXAS_MS) + 1)]
+            dado[0] += 1; dado[1] += ms; dado[2] = max(dado[2], ms)
+            faixa = 0
+            while faixa < len(FAIXAS_MS) and ms > FAIXAS_MS[faixa]: faixa += 1
+            dado[3][faixa] += 1
+
+    def rastreador(self):
+        # callback de set_trace_callback para uma conexão. Linhas "-- ..." são comandos
+        # internos de triggers e do FTS5, e cada trigger disparado repete o texto do
+        # comando que o disparou: ambos são ignorados para contar só o que foi pedido.
+        # Num executemany o texto muda a cada linha só depois do primeiro valor; enquanto
+        # o começo for igual ao do comando anterior, reaproveita a normalização dele.
+        # A contagem fica num dict só desta conexão (usada por uma thread só), sem lock.
+        contagem = {}
+        ultimo = {"sql": None, "prefixo": None, "normalizado": None}
+        def rastrear(sql):
+            if sql.startswith("--") or sql == ultimo["sql"]: return
+            literal = _RE_PRIMEIRO_LITERAL.search(sql)
+            prefixo = sql[:literal.start()] if literal else sql
+            if prefixo != ultimo["prefixo"]:
+                normalizado = normalizar_sql(sql)
+                if normalizado not in contagem and len(contagem) >= MAX_COMANDOS_SQL:
+                    normalizado = "(outros)"
+                ultimo["prefixo"] = prefixo; ultimo["normalizado"] = normalizado
+            ultimo["sql"] = sql
+            chave = ultimo["normalizado"]
+            contagem[chave] = contagem.get(chave, 0) + 1
+        with self._lock:
+            self._comandos.append(contagem)
+        return rastrear
+
+    def limpar(self):
+        with self._lock:
+            self._tempos.clear(); self.perfis.clear()
+            for contagem in self._comandos: contagem.clear()
+            self.desde = _agora_iso()
+
+    def resumo(self):
+        """Dicionário serializável em JSON com tempos, histogramas e comandos SQL."""
+        with self._lock:
+            tempos = [(cat, nome, list(d[:3]), list(d[3])) for (cat, nome), d in self._tempos.items()]
+            total = {}
+            for contagem in self._comandos:
+                for sql, n in contagem.copy().items():
+                    total[sql] = total.get(sql, 0) + n
+            comandos = sorted(total.items(), key=lambda c: -c[1])
+            perfis = list(self.perfis)
+        saida = []
+        for cat, nome, (chamadas, total, maximo), faixas in sorted(tempos, key=lambda t: -t[2][1]):
+            saida.append({"categoria": cat, "nome": nome, "chamadas": chamadas, "total_ms": round(total, 3),
+                          "media_ms": round(total / chamadas, 3), "max_ms": round(maximo, 3),
+                          "p50_ms": _percentil(faixas, 0.50, maximo), "p95_ms": _percentil(faixas, 0.95, maximo),
+                          "histograma": {(f"<= {lim}" if i < len(FAIXAS_MS) else f"> {FAIXAS_MS[-1]}"): n
+                                         for i, (lim, n) in enumerate(zip(FAIXAS_MS + (None,), faixas)) if n}})
+        return {"desde": self.desde, "gerado": _agora_iso(), "tempos": saida,
+                "sql": [{"comando": sql, "execucoes": n} for sql, n in comandos],
+                "perfis": [{"nome": n, "ms": round(ms, 3), "arquivo": a} for n, ms, a in perfis]}
+
+    def exportar_json(self, caminho):
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump(self.resumo(), f, ensure_ascii=False, indent=2)
+
+def _agora_iso():
+    return datetime.now().isoformat(timespec="seconds")
+
+def _percentil(faixas, fracao, maximo):
+    # limite superior da faixa onde cai o percentil (o histograma não guarda valores)
+    alvo = fracao * sum(faixas); acumulado = 0
+    for i, n in enumerate(faixas):
+        acumulado += n
+        if acumulado >= alvo and n:
+            return FAIXAS_MS[i] if i < len(FAIXAS_MS) else round(maximo, 3)
+    return 0
+
+metricas = Metricas()
+_perfil_local = threading.local()
+
+@contextmanager
+def medir(categoria, nome):
+    if not INSTRUMENTAR:
+        yield; return
+    # só o bloco mais externo de cada thread é perfilado (o cProfile não aninha)
+    perfil = None
+    if PERFIL_LENTO_MS > 0 and not getattr(_perfil_local, "ativo", False):
+        import cProfile
+        perfil = cProfile.Profile(); _perfil_local.ativo = True; perfil.enable()
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - inicio) * 1000
+        if perfil is not None:
+            perfil.disable(); _perfil_local.ativo = False
+            if ms >= PERFIL_LENTO_MS:
+                _gravar_perfil(perfil, nome, ms)
+        metricas.registrar(categoria, nome, ms)
+
+def _gravar_perfil(perfil, nome, ms):
+    os.makedirs(PERFIL_DIR, exist_ok=True)
+    seguro = re.sub(r"[^\w.-]+", "_", nome)[-80:]
+    arquivo = os.path.join(PERFIL_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{seguro}-{int(ms)}ms.prof")
+    perfil.dump_stats(arquivo)
+    with metricas._lock:
+        metricas.perfis.append((nome, ms, arquivo))
+
+def _medido(categoria, funcao):
+    @functools.wraps(funcao)
+    def envolvida(*args, **kwargs):
+        with medir(categoria, funcao.__name__):
+            return funcao(*args, **kwargs)
+    return envolvida
+
+# @medido nas funções de banco, @medido_interface nas janelas
+medido = functools.partial(_medido, "banco")
+medido_interface = functools.partial(_medido, "interface")
+
+def registrar_desde(categoria, nome, inicio):
+    # intervalos que começam num callback e terminam em outro (clique -> trabalhador -> Tk)
+    if INSTRUMENTAR:
+        metricas.registrar(categoria, nome, (time.perf_counter() - inicio) * 1000)
+
+def nome_funcao(funcao):
+    return getattr(funcao, "__qualname__", repr(funcao)).replace("SistemaEstoque.", "").replace(".<locals>", "")
+
+# -----------------------
+# Corrigir colunas ausentes 
+# -----------------------
+def corrigir_tabela_quimicos_silencioso(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='produtos_quimicos';")
+    if not cur.fetchone():
+        return
+    colunas_necessarias = {
+        "densidade_kg_l": "REAL",
+        "unidade_origem": "TEXT",
+        "litros": "REAL",
+        "kilos": "REAL",
+        "local_armazenamento": "TEXT",
+        "lote": "TEXT",
+        "validade": "TEXT"
+    }
+    cur.execute("PRAGMA table_info(produtos_quimicos);")
+    existentes = [r[1] for r in cur.fetchall()]
+    adicionadas = []
+    for nome_col, tipo_col in colunas_necessarias.items():
+        if nome_col not in existentes:
+            cur.execute(f"ALTER TABLE produtos_quimicos ADD COLUMN {nome_col} {tipo_col};")
+            adicionadas.append(nome_col)
+    if adicionadas:
+        # sem messagebox — apenas log no terminal (stderr: o stdout do CLI é dado)
+        print("Banco atualizado automaticamente. Colunas adicionadas:", ", ".join(adicionadas), file=sys.stderr)
+
+# -----------------------
+# Cache de leitura
+# -----------------------
+# Fica entre a interface e o SQL: linhas por (tabela, codigo) num LRU limitado e o
+# resultado de cada listagem (filtro + página). As escritas destes helpers atualizam
+# a linha afetada e, só quando ela pode ter mudado de posição ou de filtro, descartam
+# as listagens da tabela. Commits de outras conexões/processos (PRAGMA data_version)
+# e escritas desta conexão que não passam pelo cache (total_changes) limpam tudo.
+CACHE_LINHAS = 5000
+CACHE_LISTAGENS = 64
+
+class CacheLeitura:
+    def __init__(self, conn):
+        self.conn = conn
+        self.linhas = OrderedDict()     # (tabela, codigo) -> linha, ou None se não existe
+        self.listagens = OrderedDict()  # (tabela, consulta, args) -> linhas
+        self._versao = None             # (data_version, total_changes) do conteúdo guardado
+        self.alteracoes = None          # lista de (tabela, codigo, antes, depois) quando alguém acompanha
+
+    def _versao_atual(self):
+        return (self.conn.execute("PRAGMA data_version").fetchone()[0], self.conn.total_changes)
+
+    def validar(self):
+        versao = self._versao_atual()
+        if versao != self._versao:
+            self.linhas.clear(); self.listagens.clear()
+            self._versao = versao
+
+    @contextmanager
+    def escrita(self):
+        # envolve uma escrita que o chamador vai refletir com alterar(); commits desta
+        # conexão não mudam o data_version, então basta acompanhar o total_changes
+        self.validar()
+        yield
+        self._versao = (self._versao[0], self.conn.total_changes)
+
+    def linha(self, tabela, codigo, ler):
+        self.validar()
+        chave = (tabela, codigo)
+        if chave in self.linhas:
+            self.linhas.move_to_end(chave)
+            return self.linhas[chave]
+        linha = ler()
+        self._guardar(chave, linha)
+        return linha
+
+    def _guardar(self, chave, linha):
+        self.linhas[chave] = linha
+        self.linhas.move_to_end(chave)
+        while len(self.linhas) > CACHE_LINHAS:
+            self.linhas.popitem(last=False)
+
+    def listagem(self, tabela, consulta, args, ler):
+        self.validar()
+        chave = (tabela, consulta, args)
+        if chave in self.listagens:
+            self.listagens.move_to_end(chave)
+            return list(self.listagens[chave])
+        linhas = ler()
+        if len(linhas) <= CACHE_LINHAS:  # a lista inteira de uma tabela grande não fica em memória
+            self.listagens[chave] = linhas
+            while len(self.listagens) > CACHE_LISTAGENS:
+                self.listagens.popitem(last=False)
+        return list(linhas)
+
+    def alterar(self, tabela, codigo, antes, depois):
+        # write-through da linha (depois=None: removida). Se código, nome ou outra
+        # coluna da busca mudou, a linha pode ter entrado/saído/mudado de lugar nas
+        # listagens, que são descartadas; senão é trocada nelas mesmas.
+        if self.alteracoes is not None:
+            self.alteracoes.append((tabela, codigo, antes, depois))
+        self._guardar((tabela, codigo), depois)
+        indices = [COLUNAS_TABELAS[tabela].index(c) for c in COLUNAS_BUSCA[tabela]]
+        if antes is None or depois is None or any(antes[i] != depois[i] for i in indices):
+            for chave in [c for c in self.listagens if c[0] == tabela]:
+                del self.listagens[chave]
+            return
+        for chave, linhas in self.listagens.items():
+            if chave[0] != tabela: continue
+            for i, linha in enumerate(linhas):
+                if linha[0] == codigo: linhas[i] = depois
+
+def cache_leitura(conn):
+    # numa conexão que não é Conexao (sqlite3.connect direto) o cache não persiste
+    cache = getattr(conn, "cache_leitura", None)
+    if cache is None:
+        cache = CacheLeitura(conn)
+        if isinstance(conn, Conexao): conn.cache_leitura = cache
+    return cache
+
+# -----------------------
+# Helpers estoques
+# -----------------------
+# Os três estoques ficam na tabela itens, separados pela categoria; produtos,
+# produtos_epis e produtos_rotulos viraram views (ver _unificar_itens). Fora do
+# SQL os estoques continuam sendo chamados pelo nome antigo (`tabela`).
+CATEGORIAS = {"produtos": "principal", "produtos_epis": "epis", "produtos_rotulos": "rotulos"}
+TABELAS_CATEGORIAS = {categoria: tabela for tabela, categoria in CATEGORIAS.items()}
+
+def _categoria(tabela):
+    if tabela not in CATEGORIAS:
+        raise ValueError(f"tabela inválida: {tabela}")
+    return CATEGORIAS[tabela]
+
+def _fonte(tabela):
+    # (tabela SQL, condições, parâmetros) das linhas de `tabela`. A categoria vai
+    # como parâmetro: o SQLite escolhe o índice parcial pelo valor ligado.
+    if tabela in CATEGORIAS:
+        return "itens", ["categoria = ?"], [CATEGORIAS[tabela]]
+    if tabela in COLUNAS_TABELAS:
+        return tabela, [], []
+    raise ValueError(f"tabela inválida: {tabela}")
+
+@medido
+@com_retentativa
+def inserir_produto(conn, tabela, codigo, nome, quantidade, usuario=None):
+    cache = cache_leitura(conn)
+    try:
+        with cache.escrita(), conn:
+            conn.execute("INSERT INTO itens (categoria, codigo, nome, quantidade) VALUES (?, ?, ?, ?)",
+                         (_categoria(tabela), codigo, nome, quantidade))
+            if quantidade:
+                _registrar_movimento(conn, tabela, codigo, "entrada", quantidade, usuario)
+    except sqlite3.IntegrityError:
+        return False
+    cache.alterar(tabela, codigo, None, (codigo, nome, quantidade))
+    return True
+
+@medido
+def listar_produtos(conn, tabela, filtro=None):
+    def ler():
+        cond, params = ["categoria = ?"], [_categoria(tabela)]
+        if filtro:
+            c, p = _filtro_busca(conn, tabela, filtro)
+            cond.append(c); params += p
+        return conn.execute(f"SELECT codigo, nome, quantidade FROM itens WHERE {' AND '.join(cond)} ORDER BY nome, codigo",
+                            params).fetchall()
+    return cache_leitura(conn).listagem(tabela, "lista", (filtro,), ler)
+
+def _listar_pagina(conn, tabela, colunas, filtro, depois, antes, limite):
+    # paginação keyset por (nome, codigo): depois/antes é a chave da última/primeira
+    # linha já exibida, então cada página custa O(limite) e não O(tabela)
+    origem, cond, params = _fonte(tabela)
+    if filtro:
+        c, p = _filtro_busca(conn, tabela, filtro)
+        cond.append(c); params += p
+    if depois is not None:
+        cond.append("(nome, codigo) > (?, ?)"); params += list(depois)
+    elif antes is not None:
+        cond.append("(nome, codigo) < (?, ?)"); params += list(antes)
+    ordem = "DESC" if depois is None and antes is not None else "ASC"
+    sql = f"SELECT {colunas} FROM {origem}" + (" WHERE " + " AND ".join(cond) if cond else "")
+    sql += f" ORDER BY nome {ordem}, codigo {ordem} LIMIT ?"
+    rows = conn.execute(sql, params + [limite]).fetchall()
+    if ordem == "DESC":
+        rows.reverse()
+    return rows
+
+@medido
+def listar_produtos_pagina(conn, tabela, filtro=None, depois=None, antes=None, limite=200):
+    args = (filtro, tuple(depois) if depois else None, tuple(antes) if antes else None, limite)
+    return cache_leitura(conn).listagem(tabela, "pagina", args, lambda: _listar_pagina(
+        conn, tabela, "codigo, nome, quantidade", filtro, depois, antes, limite))
+
+def _ler_produto(conn, tabela, codigo):
+    return conn.execute("SELECT codigo, nome, quantidade FROM itens WHERE categoria = ? AND codigo = ?",
+                        (_categoria(tabela), codigo)).fetchone()
+
+@medido
+def buscar_produto(conn, tabela, codigo):
+    return cache_leitura(conn).linha(tabela, codigo, lambda: _ler_produto(conn, tabela, codigo))
+
+@medido
+@com_retentativa
+def atualizar_produto(conn, tabela, codigo, nome=None, quantidade=None, usuario=None, minimo=None):
+    # mudar a quantidade por aqui fica registrado como "ajuste" na movimentação;
+    # minimo é o ponto de reposição (ver estoque_baixo)
+    cache = cache_leitura(conn)
+    with cache.escrita(), conn:
+        antes = _ler_produto(conn, tabela, codigo)
+        if quantidade is not None:
+            _registrar_ajuste(conn, tabela, codigo, quantidade, usuario)
+        categoria = _categoria(tabela)
+        if nome is not None and quantidade is not None:
+            conn.execute("UPDATE itens SET nome=?, quantidade=? WHERE categoria=? AND codigo=?", (nome, quantidade, categoria, codigo))
+        elif nome is not None:
+            conn.execute("UPDATE itens SET nome=? WHERE categoria=? AND codigo=?", (nome, categoria, codigo))
+        elif quantidade is not None:
+            conn.execute("UPDATE itens SET quantidade=? WHERE categoria=? AND codigo=?", (quantidade, categoria, codigo))
+        if minimo is not None:
+            conn.execute("UPDATE itens SET minimo=? WHERE categoria=? AND codigo=?", (minimo, categoria, codigo))
+        depois = _ler_produto(conn, tabela, codigo)
+    cache.alterar(tabela, codigo, antes, depois)
+
+@medido
+@com_retentativa
+def remover_produto(conn, tabela, codigo, usuario=None):
+    cache = cache_leitura(conn)
+    with cache.escrita(), conn:
+        antes = _ler_produto(conn, tabela, codigo)
+        _registrar_ajuste(conn, tabela, codigo, 0, usuario)
+        conn.execute("DELETE FROM itens WHERE categoria=? AND codigo=?", (_categoria(tabela), codigo))
+    cache.alterar(tabela, codigo, antes, None)
+
+# -----------------------
+# Helpers formulação (químicos)
+# -----------------------
+def converter_para_kg_por_l(dens_val, unidade):
+    # conversões simples; internamente armazenamos kg/L
+    if unidade == "kg/L": return dens_val
+    if unidade == "g/cm³": return dens_val
+    if unidade == "kg/m³": return dens_val * 0.001
+    return dens_val
+
+@medido
+@com_retentativa
+def inserir_quimico(conn, codigo, nome, densidade_kg_l, unidade_origem, litros, kilos, local, lote, validade):
+    cache = cache_leitura(conn)
+    try:
+        with cache.escrita(), conn:
+            conn.execute("""
+                INSERT INTO produtos_quimicos
+                (codigo, nome, densidade_kg_l, unidade_origem, litros, kilos, local_armazenamento, lote, validade)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (codigo, nome, densidade_kg_l, unidade_origem, litros, kilos, local, lote, normalizar_validade(validade)))
+            depois = _ler_quimico(conn, codigo)
+    except sqlite3.IntegrityError:
+        return False
+    cache.alterar("produtos_quimicos", codigo, None, depois)
+    return True
+
+def _ler_quimico(conn, codigo):
+    return conn.execute("""SELECT codigo, nome, densidade_kg_l, unidade_origem, litros, kilos, local_armazenamento, lote, validade
+                           FROM produtos_quimicos WHERE codigo = ?""", (codigo,)).fetchone()
+
+@medido
+def buscar_quimico(conn, codigo):
+    return cache_leitura(conn).linha("produtos_quimicos", codigo, lambda: _ler_quimico(conn, codigo))
+
+@medido
+def listar_quimicos(conn, filtro=None):
+    def ler():
+        cur = conn.cursor()
+        base = """SELECT codigo, nome, densidade_kg_l, unidade_origem, litros, kilos, local_armazenamento, lote, validade
+                  FROM produtos_quimicos"""
+        if filtro:
+            cond, params = _filtro_busca(conn, "produtos_quimicos", filtro)
+            base += f" WHERE {cond} ORDER BY nome, codigo"
+            cur.execute(base, params)
+        else:
+            base += " ORDER BY nome, codigo"
+            cur.execute(base)
+        return cur.fetchall()
+    return cache_leitura(conn).listagem("produtos_quimicos", "lista", (filtro,), ler)
+
+@medido
+def listar_quimicos_pagina(conn, filtro=None, depois=None, antes=None, limite=200):
+    args = (filtro, tuple(depois) if depois else None, tuple(antes) if antes else None, limite)
+    return cache_leitura(conn).listagem("produtos_quimicos", "pagina", args, lambda: _listar_pagina(
+        conn, "produtos_quimicos",
+        "codigo, nome, densidade_kg_l, unidade_origem, litros, kilos, local_armazenamento, lote, validade",
+        filtro, depois, antes, limite))
+
+@medido
+@com_retentativa
+def atualizar_quimico(conn, codigo, nome=None, densidade=None, unidade=None, litros=None, kilos=None, local=None, lote=None, validade=None):
+    cache = cache_leitura(conn)
+    with cache.escrita(), conn:
+        antes = _ler_quimico(conn, codigo)
+        # só as colunas informadas, num UPDATE só: com vários lotes, os triggers de
+        # lotes_quimicos só barram a edição se ela mudar quantidades, lote, validade ou local.
+        # Texto vazio em local, lote ou validade apaga o campo.
+        informados = {c: v for c, v in (("nome", nome), ("densidade_kg_l", densidade), ("unidade_origem", unidade),
+                                        ("litros", litros), ("kilos", kilos), ("local_armazenamento", local),
+                                        ("lote", lote), ("validade", validade)) if v is not None}
+        for c in ("local_armazenamento", "lote", "validade"):
+            if c in informados: informados[c] = informados[c] or None
+        if informados.get("validade"): informados["validade"] = normalizar_validade(informados["validade"])
+        if informados:
+            conn.execute(f"UPDATE produtos_quimicos SET {', '.join(f'{c} = ?' for c in informados)} WHERE codigo = ?",
+                         (*informados.values(), codigo))
+        depois = _ler_quimico(conn, codigo)
+    cache.alterar("produtos_quimicos", codigo, antes, depois)
+
+@medido
+@com_retentativa
+def remover_quimico(conn, codigo):
+    cache = cache_leitura(conn)
+    with cache.escrita(), conn:
+        antes = _ler_quimico(conn, codigo)
+        conn.execute("DELETE FROM produtos_quimicos WHERE codigo = ?", (codigo,))
+    cache.alterar("produtos_quimicos", codigo, antes, None)
+
+# -----------------------
+# Lotes de químicos (FEFO)
+# -----------------------
+# Cada químico pode ter vários lotes (lotes_quimicos), e as baixas consomem primeiro
+# o que vence primeiro. Em produtos_quimicos, litros/kilos passam a ser a soma dos
+# lotes e lote/validade/local os do próximo lote a sair, mantidos por trigger, então
+# listas, relatórios e o planejamento continuam lendo uma linha por químico.
+# Com um lote só, editar o químico edita o lote; com vários, as quantidades só
+# mudam pelos lotes (o trigger recusa a edição direta).
+_PRIMEIRO_LOTE = """(SELECT {coluna} FROM lotes_quimicos WHERE codigo = {codigo}
+                     ORDER BY kilos <= 0, validade IS NULL, validade, id LIMIT 1)"""
+
+def _projecao_lotes(codigo):
+    # colunas de produtos_quimicos -> expressão calculada a partir dos lotes
+    soma = "(SELECT TOTAL({coluna}) FROM lotes_quimicos WHERE codigo = {codigo})"
+    return {"litros": soma.format(coluna="litros", codigo=codigo), "kilos": soma.format(coluna="kilos", codigo=codigo),
+            **{c: _PRIMEIRO_LOTE.format(coluna=c, codigo=codigo) for c in ("lote", "validade", "local_armazenamento")}}
+
+def _criar_lotes(conn):
+    # passo de migração: um lote por químico com o que já estava cadastrado
+    conn.execute("""
+        CREATE TABLE lotes_quimicos (
+            id INTEGER PRIMARY KEY,
+            codigo TEXT NOT NULL,
+            lote TEXT,
+            validade TEXT,
+            litros REAL NOT NULL DEFAULT 0,
+            kilos REAL NOT NULL DEFAULT 0,
+            local_armazenamento TEXT,
+            UNIQUE (codigo, lote)
+        )""")
+    conn.execute("""INSERT INTO lotes_quimicos (codigo, lote, validade, litros, kilos, local_armazenamento)
+                    SELECT codigo, lote, validade, COALESCE(litros, 0), COALESCE(kilos, 0), local_armazenamento FROM produtos_quimicos
+                    WHERE COALESCE(kilos, 0) > 0 OR COALESCE(litros, 0) > 0 OR lote IS NOT NULL OR validade IS NOT NULL""")
+    # FEFO: lotes de um código por validade; alertas: só lotes com saldo, por validade
+    conn.execute("CREATE INDEX idx_lotes_quimicos_codigo_validade ON lotes_quimicos(codigo, validade)")
+    conn.execute("CREATE INDEX idx_lotes_quimicos_validade ON lotes_quimicos(validade) WHERE kilos > 0")
+    for evento, codigos in (("INSERT", "new.codigo"), ("UPDATE", "old.codigo, new.codigo"), ("DELETE", "old.codigo")):
+        sets = ", ".join(f"{c} = {e}" for c, e in _projecao_lotes("produtos_quimicos.codigo").items())
+        conn.execute(f"""CREATE TRIGGER lotes_quimicos_{evento.lower()} AFTER {evento} ON lotes_quimicos BEGIN
+                         UPDATE produtos_quimicos SET {sets} WHERE codigo IN ({codigos}); END""")
+    projecao = _projecao_lotes("new.codigo")
+    diferente = " OR ".join(f"new.{c} IS NOT {e}" for c, e in projecao.items())
+    colunas = "lote, validade, litros, kilos, local_armazenamento"
+    novos = "new.lote, new.validade, COALESCE(new.litros, 0), COALESCE(new.kilos, 0), new.local_armazenamento"
+    conn.execute(f"""CREATE TRIGGER produtos_quimicos_lotes_inserir AFTER INSERT ON produtos_quimicos
+                     WHEN COALESCE(new.kilos, 0) > 0 OR COALESCE(new.litros, 0) > 0 OR new.lote IS NOT NULL OR new.validade IS NOT NULL
+                     BEGIN INSERT INTO lotes_quimicos (codigo, {colunas}) VALUES (new.codigo, {novos}); END""")
+    conn.execute(f"""CREATE TRIGGER produtos_quimicos_lotes_conferir BEFORE UPDATE OF {colunas} ON produtos_quimicos
+                     WHEN (SELECT COUNT(*) FROM lotes_quimicos WHERE codigo = new.codigo) > 1 AND ({diferente})
+                     BEGIN SELECT RAISE(ABORT, 'químico com vários lotes: altere as quantidades pelos lotes'); END""")
+    # com um lote (ou nenhum), a edição do químico vai para o lote; o trigger de
+    # lotes_quimicos não volta a disparar este (recursive_triggers fica desligado)
+    conn.execute(f"""CREATE TRIGGER produtos_quimicos_lotes_alterar AFTER UPDATE OF {colunas} ON produtos_quimicos
+                     WHEN (SELECT COUNT(*) FROM lotes_quimicos WHERE codigo = new.codigo) <= 1 AND ({diferente}) BEGIN
+                     UPDATE lotes_quimicos SET lote = new.lote, validade = new.validade, litros = COALESCE(new.litros, 0),
+                            kilos = COALESCE(new.kilos, 0), local_armazenamento = new.local_armazenamento WHERE codigo = new.codigo;
+                     INSERT INTO lotes_quimicos (codigo, {colunas}) SELECT new.codigo, {novos}
+                     WHERE NOT EXISTS (SELECT 1 FROM lotes_quimicos WHERE codigo = new.codigo)
+                       AND (COALESCE(new.kilos, 0) > 0 OR COALESCE(new.litros, 0) > 0 OR new.lote IS NOT NULL OR new.validade IS NOT NULL);
+                     END""")
+    conn.execute("""CREATE TRIGGER produtos_quimicos_lotes_remover AFTER DELETE ON produtos_quimicos
+                    BEGIN DELETE FROM lotes_quimicos WHERE codigo = old.codigo; END""")
+
+@medido
+def listar_lotes(conn, codigo):
+    # na ordem em que as baixas consomem (FEFO; vencidos só com incluir_vencidos); lotes zerados por último
+    return conn.execute("""SELECT lote, validade, litros, kilos, local_armazenamento FROM lotes_quimicos WHERE codigo = ?
+                           ORDER BY kilos <= 0, validade IS NULL, validade, id""", (codigo,)).fetchall()
+
+@medido
+@com_retentativa
+def dar_entrada_lote(conn, codigo, lote, validade=None, kilos=None, litros=None, local=None):
+    """Recebe um lote do químico; o mesmo lote recebido de novo soma no existente.
+    Informe kilos ou litros: o outro sai da densidade do químico."""
+    cache = cache_leitura(conn)
+    with cache.escrita(), conn:
+        antes = _ler_quimico(conn, codigo)
+        if antes is None:
+            raise ValueError("químico não cadastrado")
+        densidade = antes[2]
+        if kilos is None and litros is None: raise ValueError("informe kilos ou litros")
+        if kilos is None: kilos = litros * (densidade or 0)
+        if litros is None: litros = kilos / densidade if densidade else 0
+        kilos, litros = round(kilos, 6), round(litros, 6)
+        if kilos < 0 or litros < 0: raise ValueError("quantidade inválida")
+        conn.execute("""INSERT INTO lotes_quimicos (codigo, lote, validade, litros, kilos, local_armazenamento) VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (codigo, lote) DO UPDATE SET litros = litros + excluded.litros, kilos = kilos + excluded.kilos,
+                            validade = COALESCE(excluded.validade, validade),
+                            local_armazenamento = COALESCE(excluded.local_armazenamento, local_armazenamento)""",
+                     (codigo, lote or None, normalizar_validade(validade), litros, kilos, local or None))
+        depois = _ler_quimico(conn, codigo)
+    cache.alterar("produtos_quimicos", codigo, antes, depois)
+
+@medido
+@com_retentativa
+def baixar_quimico(conn, codigo, kilos, incluir_vencidos=False):
+    """Baixa `kilos` do químico, dos lotes que vencem primeiro (FEFO), numa transação.
+    Lotes vencidos ficam de fora, a menos que `incluir_vencidos`. Os litros de cada
+    lote caem na mesma proporção. ValueError se o saldo não cobre.
+    Devolve [(lote, validade, kilos baixados, kilos que sobraram no lote)]."""
+    if kilos <= 0:
+        raise ValueError("quantidade inválida")
+    cache = cache_leitura(conn)
+    with cache.escrita(), conn:
+        conn.execute("BEGIN IMMEDIATE")  # trava antes de ler, como movimentar_lote
+        antes = _ler_quimico(conn, codigo)
+        if antes is None:
+            raise ValueError("químico não cadastrado")
+        hoje = date.today().isoformat()
+        lotes = conn.execute("""SELECT id, lote, validade, litros, kilos FROM lotes_quimicos WHERE codigo = ? AND kilos > 0
+                                ORDER BY validade IS NULL, validade, id""", (codigo,)).fetchall()
+        vencidos = [l for l in lotes if l[2] is not None and l[2] < hoje]
+        if not incluir_vencidos:
+            lotes = [l for l in lotes if l not in vencidos]
+        disponivel = sum(l[4] for l in lotes)
+        if disponivel + 1e-9 < kilos:
+            fora = "" if incluir_vencidos or not vencidos else f"; {sum(l[4] for l in vencidos):.3f} kg em lotes vencidos, fora da baixa"
+            raise ValueError(f"saldo insuficiente (atual {disponivel:.3f} kg{fora})")
+        restante, alocacao, novos = kilos, [], []
+        for id_lote, lote, validade, litros_lote, kilos_lote in lotes:
+            if restante <= 1e-9: break
+            tirar = min(kilos_lote, restante); restante -= tirar
+            sobra = round(kilos_lote - tirar, 6)
+            novos.append((sobra, round(litros_lote * sobra / kilos_lote, 6), id_lote))
+            alocacao.append((lote, validade, round(tirar, 6), sobra))
+        conn.executemany("UPDATE lotes_quimicos SET kilos = ?, litros = ? WHERE id = ?", novos)
+        depois = _ler_quimico(conn, codigo)
+    cache.alterar("produtos_quimicos", codigo, antes, depois)
+    return alocacao
+
+# -----------------------
+# Planejamento de produção (receitas × estoque de químicos)
+# -----------------------
+# Uma ordem de produção é uma lista de formulações (receita, volume em litros,
+# componentes por litro de produto). As linhas são reduzidas numa passada a dois
+# totais por químico — litros e kg — e um único SELECT traz densidade e saldo de
+# todos os químicos envolvidos; a conversão para kg e a falta saem desses totais,
+# então o custo não depende de quantas receitas usam o mesmo químico. A redução
+# fica num laço Python de propósito: ~4 ms para 10 mil linhas de componente,
+# contra ~37 ms só para ler essas linhas do CSV (ler_formulacoes).
+# unidade do componente -> (fator para L ou kg por litro de produto, é volume?)
+UNIDADES_RECEITA = {"kg/L": (1.0, False), "g/L": (0.001, False), "L/L": (1.0, True), "mL/L": (0.001, True), "%": (0.01, True)}
+
+def somar_formulacoes(formulacoes):
+    """[(receita, volume_l, [(codigo, quantidade, unidade)])] -> ({codigo: [litros, kg]}, erros).
+    "%" é volume/volume; os erros são [(receita, codigo, mensagem)]."""
+    totais, erros = {}, []
+    for receita, volume, componentes in formulacoes:
+        for codigo, quantidade, unidade in componentes:
+            fator = UNIDADES_RECEITA.get(unidade)
+            if fator is None: erros.append((receita, codigo, f"unidade inválida: {unidade}")); continue
+            if quantidade < 0 or volume < 0: erros.append((receita, codigo, "quantidade inválida")); continue
+            total = totais.get(codigo)
+            if total is None: total = totais[codigo] = [0.0, 0.0]
+            total[0 if fator[1] else 1] += volume * quantidade * fator[0]
+    return totais, erros
+
+@medido
+def planejar_producao(conn, formulacoes):
+    """Confere o consumo de químicos de várias formulações contra o estoque.
+    Devolve {"linhas": [(codigo, nome, necessario_kg, disponivel_kg, falta_kg, necessario_l, disponivel_l)],
+    "faltas": as linhas com falta_kg > 0, "erros": [(receita, codigo, mensagem)]}."""
+    totais, erros = somar_formulacoes(formulacoes)
+    # lista de códigos num parâmetro só (json_each): sem limite de variáveis nem lotes de IN
+    estoque = {linha[0]: linha for linha in conn.execute(
+        """SELECT codigo, nome, densidade_kg_l, COALESCE(kilos, litros * densidade_kg_l, 0), COALESCE(litros, kilos / densidade_kg_l, 0)
+           FROM produtos_quimicos WHERE codigo IN (SELECT value FROM json_each(?))""", (json.dumps(list(totais)),))}
+    linhas = []
+    for codigo, (litros, kg) in totais.items():
+        if codigo not in estoque:
+            erros.append((None, codigo, "químico não cadastrado")); continue
+        _, nome, densidade, disponivel, disponivel_l = estoque[codigo]
+        if litros and not densidade:
+            erros.append((None, codigo, "químico sem densidade: não dá para converter litros em kg")); continue
+        necessario = kg + litros * (densidade or 0)
+        falta = round(max(necessario - disponivel, 0.0), 3)
+        linhas.append((codigo, nome, round(necessario, 3), round(disponivel, 3), falta,
+                       round(necessario / densidade, 3) if densidade else None, round(disponivel_l or 0, 3)))
+    linhas.sort(key=lambda l: (l[1], l[0]))
+    return {"linhas": linhas, "faltas": [l for l in linhas if l[4] > 0], "erros": erros}
+
+def ler_formulacoes(caminho, formato=None):
+    """CSV / JSON com uma linha por componente: receita, volume_l, codigo, quantidade, unidade.
+    As linhas da mesma receita e volume formam uma formulação. Devolve (formulacoes, erros)."""
+    formato = formato or ("csv" if caminho.lower().endswith(".csv") else "json")
+    formulacoes, erros = {}, []
+    with open(caminho, "r", encoding="utf-8-sig", newline="") as f:
+        for n, registro in _ler_registros(f, formato):
+            r = {str(k).strip().lower(): v for k, v in registro.items() if k is not None}
+            try:
+                chave = (str(r.get("receita") or "").strip(), float(str(r.get("volume_l", r.get("volume"))).replace(",", ".")))
+                componente = (str(r["codigo"]).strip(), float(str(r["quantidade"]).replace(",", ".")),
+                              str(r.get("unidade") or "kg/L").strip())
+            except KeyError as e:
+                erros.append((n, f"falta a coluna {e}")); continue
+            except ValueError as e:
+                erros.append((n, f"número inválido: {e}")); continue
+            formulacoes.setdefault(chave, []).append(componente)
+    return [(receita, volume, componentes) for (receita, volume), componentes in formulacoes.items()], erros
+
+@medido
+def planejar_producao_arquivo(conn, caminho, formato=None):
+    # ler_formulacoes + planejar_producao; as linhas ilegíveis vão em "erros_arquivo": [(linha, mensagem)]
+    formulacoes, erros = ler_formulacoes(caminho, formato)
+    resultado = planejar_producao(conn, formulacoes)
+    resultado["erros_arquivo"] = erros
+    return resultado
+
+# -----------------------
+# Busca (índice FTS5)
+# -----------------------
+# colunas indexadas por tabela; o índice usa a tabela original como conteúdo
+# (external content) e é mantido por triggers, então não duplica os dados. Os três
+# estoques compartilham um índice só, itens_fts, sobre a tabela itens.
+COLUNAS_BUSCA = {
+    "produtos": ("codigo", "nome"),
+    "produtos_epis": ("codigo", "nome"),
+    "produtos_rotulos": ("codigo", "nome"),
+    "produtos_quimicos": ("codigo", "nome", "lote", "local_armazenamento"),
+}
+
+def _criar_fts(conn, tabela, colunas, rowid="rowid"):
+    # tabela FTS5 + triggers para `tabela`; False se o SQLite não tiver FTS5
+    fts = f"{tabela}_fts"
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name=?", (fts,)).fetchone():
+        return True
+    cols = ", ".join(colunas)
+    novos = ", ".join(f"new.{c}" for c in colunas)
+    velhos = ", ".join(f"old.{c}" for c in colunas)
+    mudou = " OR ".join(f"old.{c} IS NOT new.{c}" for c in colunas)
+    try:
+        conn.execute("SAVEPOINT indice_busca")
+        conn.execute(f"""CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{tabela}', content_rowid='{rowid}',
+                         tokenize='unicode61 remove_diacritics 2', prefix='2 3')""")
+        conn.execute(f"""CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tabela} BEGIN
+                         INSERT INTO {fts}(rowid, {cols}) VALUES (new.{rowid}, {novos}); END""")
+        conn.execute(f"""CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tabela} BEGIN
+                         INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.{rowid}, {velhos}); END""")
+        conn.execute(f"""CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {tabela} WHEN {mudou} BEGIN
+                         INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.{rowid}, {velhos});
+                         INSERT INTO {fts}(rowid, {cols}) VALUES (new.{rowid}, {novos}); END""")
+        conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+        conn.execute("RELEASE indice_busca")
+        return True
+    except sqlite3.OperationalError as e:
+        conn.execute("ROLLBACK TO indice_busca"); conn.execute("RELEASE indice_busca")
+        print("Índice de busca indisponível:", e, file=sys.stderr)
+        return False
+
+def criar_indice_busca(conn):
+    # passo de migração: um índice por tabela original; se o SQLite não tiver
+    # FTS5 a busca continua funcionando com LIKE
+    for tabela, colunas in COLUNAS_BUSCA.items():
+        if not _criar_fts(conn, tabela, colunas):
+            return
+
+def _nome_fts(tabela):
+    return "itens_fts" if tabela in CATEGORIAS else f"{tabela}_fts"
+
+def _tem_indice_busca(conn, tabela):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name=?", (_nome_fts(tabela),)).fetchone() is not None
+
+def _consulta_fts(termo):
+    # cada palavra vira um prefixo ("agua"* "5"*), todas obrigatórias
+    return " ".join(f'"{t}"*' for t in re.findall(r"\w+", termo))
+
+def _filtro_busca(conn, tabela, filtro):
+    # condição WHERE (e parâmetros) para o filtro digitado na barra de busca
+    consulta = _consulta_fts(filtro)
+    if consulta and _tem_indice_busca(conn, tabela):
+        fts = _nome_fts(tabela)
+        return f"rowid IN (SELECT rowid FROM {fts} WHERE {fts} MATCH ?)", [consulta]
+    chave = f"%{filtro}%"
+    return "(codigo LIKE ? OR nome LIKE ?)", [chave, chave]
+
+@medido
+def buscar_texto(conn, tabela, termo, limite=50):
+    # busca por prefixo ordenada por relevância (bm25); devolve as mesmas colunas
+    # de listar_produtos / listar_quimicos
+    colunas = COLUNAS_TABELAS[tabela]
+    consulta = _consulta_fts(termo)
+    if not consulta:
+        return []
+    origem, cond, params = _fonte(tabela)
+    if not _tem_indice_busca(conn, tabela):
+        c, p = _filtro_busca(conn, tabela, termo)
+        return conn.execute(f"SELECT {', '.join(colunas)} FROM {origem} WHERE {' AND '.join(cond + [c])} ORDER BY nome, codigo LIMIT ?",
+                            params + p + [limite]).fetchall()
+    fts = _nome_fts(tabela)
+    cols = ", ".join(f"t.{c}" for c in colunas)
+    cond = "".join(f" AND t.{c}" for c in cond)
+    return conn.execute(f"""SELECT {cols} FROM {fts} f JOIN {origem} t ON t.rowid = f.rowid
+                            WHERE {fts} MATCH ?{cond} ORDER BY f.rank LIMIT ?""", [consulta] + params + [limite]).fetchall()
+
+@medido
+def localizar(conn, termo, limite=50):
+    """Procura `termo` em todos os estoques numa consulta só: primeiro o código
+    exato (índice único de itens e chave dos químicos), depois nome/código por
+    prefixo nos índices de busca. Devolve [(tabela, codigo, nome, quantidade)];
+    nos químicos a quantidade é em kg."""
+    termo = termo.strip()
+    consulta = _consulta_fts(termo)
+    if not termo:
+        return []
+    partes = ["SELECT 0 AS ordem, 0 AS rank, categoria, codigo, nome, quantidade FROM itens WHERE codigo = :termo",
+              "SELECT 0, 0, 'quimicos', codigo, nome, kilos FROM produtos_quimicos WHERE codigo = :termo"]
+    if consulta and _tem_indice_busca(conn, "produtos") and _tem_indice_busca(conn, "produtos_quimicos"):
+        partes += ["""SELECT 1, f.rank, i.categoria, i.codigo, i.nome, i.quantidade FROM itens_fts f
+                      JOIN itens i ON i.id = f.rowid WHERE itens_fts MATCH :consulta AND i.codigo <> :termo""",
+                   """SELECT 1, f.rank, 'quimicos', q.codigo, q.nome, q.kilos FROM produtos_quimicos_fts f
+                      JOIN produtos_quimicos q ON q.rowid = f.rowid WHERE produtos_quimicos_fts MATCH :consulta AND q.codigo <> :termo"""]
+    else:
+        partes += ["SELECT 1, 0, categoria, codigo, nome, quantidade FROM itens WHERE codigo <> :termo AND (codigo LIKE :chave OR nome LIKE :chave)",
+                   "SELECT 1, 0, 'quimicos', codigo, nome, kilos FROM produtos_quimicos WHERE codigo <> :termo AND (codigo LIKE :chave OR nome LIKE :chave)"]
+    cur = conn.execute(" UNION ALL ".join(partes) + " ORDER BY ordem, rank, nome, codigo LIMIT :limite",
+                       {"termo": termo, "consulta": consulta, "chave": f"%{termo}%", "limite": limite})
+    return [(TABELAS_CATEGORIAS.get(cat, "produtos_quimicos"), codigo, nome, qtd) for _, _, cat, codigo, nome, qtd in cur]
+
+# -----------------------
+# Validade (verificação)
+# -----------------------
+def normalizar_validade(validade):
+    # validade é gravada sempre como YYYY-MM-DD (ordenável como texto, serve para
+    # consultas por faixa no índice); vazio vira NULL, texto irreconhecível fica como está
+    if validade is None:
+        return None
+    texto = str(validade).strip()
+    if not texto:
+        return None
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y"):
+        try:
+            return datetime.strptime(texto, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return texto
+
+def _preparar_validade(conn):
+    # passo de migração: normaliza as validades já gravadas e cria o contador de
+    # versão de produtos_quimicos (incrementado por trigger a cada escrita)
+    for codigo, validade in conn.execute("SELECT codigo, validade FROM produtos_quimicos WHERE validade IS NOT NULL").fetchall():
+        nova = normalizar_validade(validade)
+        if nova != validade:
+            conn.execute("UPDATE produtos_quimicos SET validade=? WHERE codigo=?", (nova, codigo))
+    conn.execute("CREATE TABLE IF NOT EXISTS versoes_tabelas (tabela TEXT PRIMARY KEY, versao INTEGER NOT NULL)")
+    conn.execute("INSERT OR IGNORE INTO versoes_tabelas (tabela, versao) VALUES ('produtos_quimicos', 0)")
+    for evento in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f"""CREATE TRIGGER IF NOT EXISTS versao_produtos_quimicos_{evento.lower()} AFTER {evento} ON produtos_quimicos
+                         BEGIN UPDATE versoes_tabelas SET versao = versao + 1 WHERE tabela = 'produtos_quimicos'; END""")
+
+def _versao_tabela(conn, tabela):
+    row = conn.execute("SELECT versao FROM versoes_tabelas WHERE tabela=?", (tabela,)).fetchone()
+    return row[0] if row else None
+
+_RE_DATA = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def tag_validade(validade, hoje=None):
+    # "vencido" / "proximo" / "" comparando o texto ISO, sem strptime por linha
+    if not validade or not _RE_DATA.fullmatch(validade):
+        return ""
+    hoje = hoje or date.today()
+    if validade < hoje.isoformat():
+        return "vencido"
+    if validade <= (hoje + timedelta(days=VALIDADE_ALERT_DIAS)).isoformat():
+        return "proximo"
+    return ""
+
+@medido
+def verificar_validade_quimicos(conn):
+    # vencidos/próximos via faixas no índice de validade; o resultado fica em cache
+    # até alguma escrita em produtos_quimicos (qualquer processo) ou a virada do dia
+    hoje = date.today()
+    chave = (hoje, _versao_tabela(conn, "produtos_quimicos"))
+    # conn.cache_validade: ((dia, versão de produtos_quimicos), resultado)
+    entrada = getattr(conn, "cache_validade", None)
+    if entrada and entrada[0] == chave and chave[1] is not None:
+        return entrada[1]
+    hoje_iso = hoje.isoformat()
+    limite = (hoje + timedelta(days=VALIDADE_ALERT_DIAS)).isoformat()
+    # por lote com saldo, com o lote junto do nome; CROSS JOIN fixa os lotes por fora,
+    # para a faixa de datas sair do índice parcial de validade e não de uma varredura
+    nome = "q.nome || COALESCE(' — lote ' || l.lote, '')"
+    vencidos = conn.execute(f"""SELECT {nome}, l.validade FROM lotes_quimicos l CROSS JOIN produtos_quimicos q ON q.codigo = l.codigo
+                                WHERE l.kilos > 0 AND l.validade < ? AND l.validade <> '' AND julianday(l.validade) IS NOT NULL
+                                ORDER BY l.validade""", (hoje_iso,)).fetchall()
+    proximos = conn.execute(f"""SELECT {nome}, l.validade, CAST(julianday(l.validade) - julianday(?) AS INTEGER)
+                                FROM lotes_quimicos l CROSS JOIN produtos_quimicos q ON q.codigo = l.codigo
+                                WHERE l.kilos > 0 AND l.validade BETWEEN ? AND ? AND julianday(l.validade) IS NOT NULL
+                                ORDER BY l.validade""", (hoje_iso, hoje_iso, limite)).fetchall()
+    resultado = (vencidos, proximos)
+    if isinstance(conn, Conexao): conn.cache_validade = (chave, resultado)
+    return resultado
+
+# -----------------------
+# Ponto de reposição (estoque baixo)
+# -----------------------
+# Cada item pode ter um mínimo (itens.minimo; 0 = sem ponto de reposição). Os itens
+# com quantidade <= mínimo ficam em estoque_baixo, mantida por trigger a cada
+# inclusão, baixa, ajuste ou remoção, então ler a lista de críticos não varre os
+# estoques: é uma tabela com só esses itens. `desde` é quando o item ficou crítico
+# (não muda enquanto ele continua abaixo do mínimo).
+def _criar_estoque_baixo(conn):
+    # passo de migração
+    conn.execute("ALTER TABLE itens ADD COLUMN minimo INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX idx_itens_minimo ON itens(categoria, codigo) WHERE minimo > 0")
+    conn.execute("""
+        CREATE TABLE estoque_baixo (
+            item_id INTEGER PRIMARY KEY,
+            categoria TEXT NOT NULL,
+            codigo TEXT NOT NULL,
+            nome TEXT NOT NULL,
+            quantidade INTEGER NOT NULL,
+            minimo INTEGER NOT NULL,
+            desde TEXT NOT NULL
+        )""")
+    critico = lambda l: f"({l}.minimo > 0 AND {l}.quantidade <= {l}.minimo)"
+    agora = "strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')"
+    conn.execute(f"""CREATE TRIGGER itens_baixo_inserir AFTER INSERT ON itens WHEN {critico('new')} BEGIN
+                     INSERT INTO estoque_baixo VALUES (new.id, new.categoria, new.codigo, new.nome, new.quantidade, new.minimo, {agora}); END""")
+    conn.execute(f"""CREATE TRIGGER itens_baixo_alterar AFTER UPDATE OF categoria, codigo, nome, quantidade, minimo ON itens
+                     WHEN {critico('old')} OR {critico('new')} BEGIN
+                     DELETE FROM estoque_baixo WHERE item_id = old.id AND NOT {critico('new')};
+                     INSERT INTO estoque_baixo SELECT new.id, new.categoria, new.codigo, new.nome, new.quantidade, new.minimo, {agora}
+                     WHERE {critico('new')}
+                     ON CONFLICT (item_id) DO UPDATE SET categoria = excluded.categoria, codigo = excluded.codigo, nome = excluded.nome,
+                         quantidade = excluded.quantidade, minimo = excluded.minimo; END""")
+    conn.execute(f"""CREATE TRIGGER itens_baixo_remover AFTER DELETE ON itens WHEN {critico('old')} BEGIN
+                     DELETE FROM estoque_baixo WHERE item_id = old.id; END""")
+    # o mínimo também vai para o log de alterações (sincronização entre estações)
+    _triggers_alteracoes(conn, "itens", COLUNAS_TABELAS["produtos"] + ("minimo",))
+
+@medido
+@com_retentativa
+def definir_minimos(conn, tabela, minimos):
+    """Grava o ponto de reposição de vários itens: [(codigo, minimo)] ou {codigo: minimo};
+    0 tira o item do alerta. Devolve os códigos que não existem na tabela."""
+    pares = list(minimos.items() if isinstance(minimos, dict) else minimos)
+    if any(m is None or m < 0 for _, m in pares):
+        raise ValueError("mínimo inválido")
+    categoria, faltando = _categoria(tabela), []
+    cache = cache_leitura(conn)
+    # as linhas do cache (código, nome, quantidade) não mudam com o mínimo
+    with cache.escrita(), conn:
+        for codigo, minimo in pares:
+            cur = conn.execute("UPDATE itens SET minimo = ? WHERE categoria = ? AND codigo = ?", (minimo, categoria, codigo))
+            if not cur.rowcount: faltando.append(codigo)
+    return faltando
+
+def definir_minimo(conn, tabela, codigo, minimo):
+    return not definir_minimos(conn, tabela, [(codigo, minimo)])
+
+@medido
+def listar_minimos(conn, tabela):
+    # {codigo: minimo} dos itens com ponto de reposição (pelo índice parcial)
+    return dict(conn.execute("SELECT codigo, minimo FROM itens WHERE categoria = ? AND minimo > 0", (_categoria(tabela),)))
+
+@medido
+def listar_estoque_baixo(conn, tabela=None):
+    """[(tabela, codigo, nome, quantidade, minimo, desde)] dos itens no ponto de
+    reposição ou abaixo, dos mais críticos (menor quantidade / mínimo) para os menos."""
+    sql = "SELECT categoria, codigo, nome, quantidade, minimo, desde FROM estoque_baixo"
+    params = ()
+    if tabela:
+        sql += " WHERE categoria = ?"; params = (_categoria(tabela),)
+    linhas = conn.execute(sql + " ORDER BY CAST(quantidade AS REAL) / minimo, nome", params).fetchall()
+    return [(TABELAS_CATEGORIAS[l[0]],) + l[1:] for l in linhas]
+
+# -----------------------
+# Movimentações (entrada / baixa / ajuste) e saldos
+# -----------------------
+# movimentacoes é somente inclusão; quantidade é o delta com sinal e saldo é o
+# saldo do item logo depois do movimento
+TIPOS_MOVIMENTO = ("entrada", "baixa", "ajuste")
+SNAPSHOT_INTERVALO_DIAS = 1
+# fotos com mais de SNAPSHOT_MANTER_DIAS ficam só a primeira de cada mês (que inclui
+# a de abertura): o saldo numa data antiga continua exato, só soma mais movimentos
+SNAPSHOT_MANTER_DIAS = 90
+
+def _usuario_atual():
+    try:
+        import getpass
+        return getpass.getuser()
+    except Exception:
+        return None
+
+def _agora():
+    return datetime.now().isoformat(timespec="seconds")
+
+def _criar_movimentacoes(conn):
+    # passo de migração: razão de movimentos + fotos periódicas dos saldos
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS movimentacoes (
+            id INTEGER PRIMARY KEY,
+            tabela TEXT NOT NULL,
+            codigo TEXT NOT NULL,
+            tipo TEXT NOT NULL CHECK (tipo IN ('entrada', 'baixa', 'ajuste')),
+            quantidade INTEGER NOT NULL,
+            saldo INTEGER NOT NULL,
+            usuario TEXT,
+            momento TEXT NOT NULL
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_movimentacoes_item ON movimentacoes(tabela, codigo, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_movimentacoes_momento ON movimentacoes(momento)")
+    for evento in ("UPDATE", "DELETE"):
+        conn.execute(f"""CREATE TRIGGER IF NOT EXISTS movimentacoes_sem_{evento.lower()} BEFORE {evento} ON movimentacoes
+                         BEGIN SELECT RAISE(ABORT, 'movimentacoes é somente inclusão'); END""")
+    # cada foto guarda o último movimento já incluído, então saldo em uma data =
+    # foto mais recente antes dela + movimentos posteriores à foto
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS snapshots_saldo (
+            id INTEGER PRIMARY KEY,
+            momento TEXT NOT NULL,
+            ultimo_movimento INTEGER NOT NULL
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_saldo_momento ON snapshots_saldo(momento)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS saldos_snapshot (
+            snapshot_id INTEGER NOT NULL,
+            tabela TEXT NOT NULL,
+            codigo TEXT NOT NULL,
+            quantidade INTEGER NOT NULL,
+            PRIMARY KEY (snapshot_id, tabela, codigo)
+        ) WITHOUT ROWID""")
+    # saldo de abertura: tudo que já existia antes da movimentação
+    _gravar_snapshot(conn)
+
+def _registrar_movimento(conn, tabela, codigo, tipo, delta, usuario=None):
+    # chamada dentro da transação do UPDATE: lê o saldo já atualizado
+    conn.execute("""INSERT INTO movimentacoes (tabela, codigo, tipo, quantidade, saldo, usuario, momento)
+                    SELECT ?, codigo, ?, ?, quantidade, ?, ? FROM itens WHERE categoria = ? AND codigo = ?""",
+                 (tabela, tipo, delta, usuario or _usuario_atual(), _agora(), _categoria(tabela), codigo))
+
+def _registrar_ajuste(conn, tabela, codigo, nova_quantidade, usuario=None):
+    # chamada ANTES do UPDATE, na mesma transação: o INSERT já pega o lock de
+    # escrita, então o saldo anterior lido aqui não muda até o commit
+    conn.execute("""INSERT INTO movimentacoes (tabela, codigo, tipo, quantidade, saldo, usuario, momento)
+                    SELECT ?, codigo, 'ajuste', ? - quantidade, ?, ?, ? FROM itens
+                    WHERE categoria = ? AND codigo = ? AND quantidade <> ?""",
+                 (tabela, nova_quantidade, nova_quantidade, usuario or _usuario_atual(), _agora(), _categoria(tabela), codigo,
+                  nova_quantidade))
+
+@medido
+@com_retentativa
+def movimentar_estoque(conn, tabela, codigo, tipo, quantidade, usuario=None):
+    """Aplica entrada/baixa de `quantidade` (> 0) de forma atômica e registra o
+    movimento. Devolve o novo saldo, ou None se o produto não existe ou (baixa)
+    o saldo é insuficiente — a checagem é feita no próprio UPDATE."""
+    if tipo not in ("entrada", "baixa") or quantidade <= 0:
+        raise ValueError("movimento inválido")
+    cache = cache_leitura(conn)
+    categoria = _categoria(tabela)
+    with cache.escrita(), conn:
+        if tipo == "baixa":
+            cur = conn.execute("UPDATE itens SET quantidade = quantidade - ? WHERE categoria = ? AND codigo = ? AND quantidade >= ?",
+                               (quantidade, categoria, codigo, quantidade))
+        else:
+            cur = conn.execute("UPDATE itens SET quantidade = quantidade + ? WHERE categoria = ? AND codigo = ?",
+                               (quantidade, categoria, codigo))
+        if cur.rowcount == 0:
+            return None
+        _registrar_movimento(conn, tabela, codigo, tipo, -quantidade if tipo == "baixa" else quantidade, usuario)
+        depois = _ler_produto(conn, tabela, codigo)
+    cache.alterar(tabela, codigo, depois, depois)  # só a quantidade mudou
+    return depois[2]
+
+def baixar_estoque(conn, tabela, codigo, quantidade, usuario=None):
+    return movimentar_estoque(conn, tabela, codigo, "baixa", quantidade, usuario)
+
+def dar_entrada_estoque(conn, tabela, codigo, quantidade, usuario=None):
+    return movimentar_estoque(conn, tabela, codigo, "entrada", quantidade, usuario)
+
+MAX_VARIAVEIS_SQL = 500  # códigos por SELECT ... IN (...) (o SQLite antigo aceita até 999)
+
+def somar_itens(itens):
+    # [(codigo, quantidade)] -> {codigo: total}, na ordem da primeira leitura
+    fila = {}
+    for codigo, quantidade in itens:
+        fila[codigo] = fila.get(codigo, 0) + quantidade
+    return fila
+
+@medido
+@com_retentativa
+def movimentar_lote(conn, tabela, tipo, itens, usuario=None, parcial=True):
+    """Entrada/baixa de vários itens numa transação só (leitor de código de barras).
+    `itens` é [(codigo, quantidade)] ou {codigo: quantidade}; códigos repetidos são
+    somados. Os saldos são conferidos com a escrita já travada e as linhas válidas
+    gravadas com executemany. parcial=False não grava nada se alguma linha falhar.
+    Devolve {"aplicados": [(codigo, quantidade, novo_saldo)], "erros": [(codigo, mensagem)]}."""
+    if tipo not in ("entrada", "baixa"):
+        raise ValueError("movimento inválido")
+    categoria = _categoria(tabela)
+    fila = somar_itens(itens.items() if isinstance(itens, dict) else itens)
+    resultado = {"aplicados": [], "erros": []}
+    validos = {}
+    for codigo, quantidade in fila.items():
+        if quantidade <= 0: resultado["erros"].append((codigo, "quantidade inválida"))
+        else: validos[codigo] = quantidade
+    cache = cache_leitura(conn)
+    alteracoes = []
+    with cache.escrita(), conn:
+        conn.execute("BEGIN IMMEDIATE")  # trava antes de ler: o saldo conferido é o que será baixado
+        atuais = {}
+        codigos = list(validos)
+        for i in range(0, len(codigos), MAX_VARIAVEIS_SQL):
+            parte = codigos[i:i + MAX_VARIAVEIS_SQL]
+            for linha in conn.execute(f"""SELECT codigo, nome, quantidade FROM itens
+                                          WHERE categoria = ? AND codigo IN ({', '.join('?' * len(parte))})""",
+                                      [categoria] + parte):
+                atuais[linha[0]] = linha
+        for codigo, quantidade in validos.items():
+            antes = atuais.get(codigo)
+            if antes is None:
+                resultado["erros"].append((codigo, "código não cadastrado"))
+            elif tipo == "baixa" and antes[2] < quantidade:
+                resultado["erros"].append((codigo, f"saldo insuficiente (atual {antes[2]})"))
+            else:
+                novo = antes[2] - quantidade if tipo == "baixa" else antes[2] + quantidade
+                alteracoes.append((antes, (antes[0], antes[1], novo)))
+                resultado["aplicados"].append((codigo, quantidade, novo))
+        if resultado["erros"] and not parcial:
+            resultado["aplicados"] = []
+            return resultado
+        sinal = -1 if tipo == "baixa" else 1
+        conn.executemany("UPDATE itens SET quantidade = ? WHERE categoria = ? AND codigo = ?",
+                         [(novo, categoria, codigo) for codigo, _, novo in resultado["aplicados"]])
+        momento, usuario = _agora(), usuario or _usuario_atual()
+        conn.executemany("""INSERT INTO movimentacoes (tabela, codigo, tipo, quantidade, saldo, usuario, momento)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                         [(tabela, codigo, tipo, sinal * qtd, novo, usuario, momento) for codigo, qtd, novo in resultado["aplicados"]])
+    for antes, depois in alteracoes:
+        cache.alterar(tabela, antes[0], antes, depois)
+    return resultado
+
+@medido
+def listar_movimentacoes(conn, tabela, codigo, limite=200):
+    return conn.execute("""SELECT momento, tipo, quantidade, saldo, usuario FROM movimentacoes
+                           WHERE tabela = ? AND codigo = ? ORDER BY id DESC LIMIT ?""", (tabela, codigo, limite)).fetchall()
+
+def _gravar_snapshot(conn):
+    ultimo = conn.execute("SELECT COALESCE(MAX(id), 0) FROM movimentacoes").fetchone()[0]
+    snap = conn.execute("INSERT INTO snapshots_saldo (momento, ultimo_movimento) VALUES (?, ?)", (_agora(), ultimo)).lastrowid
+    # pelos nomes antigos (views depois de _unificar_itens): o passo de migração
+    # _criar_movimentacoes também chama esta função, antes de a tabela itens existir
+    for tabela in ("produtos", "produtos_epis", "produtos_rotulos"):
+        conn.execute(f"INSERT INTO saldos_snapshot (snapshot_id, tabela, codigo, quantidade) SELECT ?, ?, codigo, quantidade FROM {tabela}",
+                     (snap, tabela))
+    return snap
+
+def _podar_snapshots(conn, manter_dias):
+    limite = (datetime.now() - timedelta(days=manter_dias)).isoformat(timespec="seconds")
+    velhas = """SELECT id FROM snapshots_saldo WHERE momento < ?
+                AND id NOT IN (SELECT MIN(id) FROM snapshots_saldo GROUP BY substr(momento, 1, 7))"""
+    conn.execute(f"DELETE FROM saldos_snapshot WHERE snapshot_id IN ({velhas})", (limite,))
+    return conn.execute(f"DELETE FROM snapshots_saldo WHERE id IN ({velhas})", (limite,)).rowcount
+
+@medido
+@com_retentativa
+def registrar_snapshot_saldos(conn, intervalo_dias=SNAPSHOT_INTERVALO_DIAS, manter_dias=SNAPSHOT_MANTER_DIAS):
+    # tira uma foto dos saldos se a última tiver mais de intervalo_dias, e na mesma
+    # transação poda as antigas (ver SNAPSHOT_MANTER_DIAS); devolve o id ou None
+    with conn:
+        ultima = conn.execute("SELECT MAX(momento) FROM snapshots_saldo").fetchone()[0]
+        if ultima and ultima > (datetime.now() - timedelta(days=intervalo_dias)).isoformat(timespec="seconds"):
+            return None
+        snap = _gravar_snapshot(conn)
+        _podar_snapshots(conn, manter_dias)
+        return snap
+
+def _snapshot_ate(conn, momento):
+    return conn.execute("SELECT id, ultimo_movimento FROM snapshots_saldo WHERE momento <= ? ORDER BY momento DESC LIMIT 1",
+                        (momento,)).fetchone() or (None, 0)
+
+@medido
+def saldo_em(conn, tabela, codigo, momento):
+    # saldo do item no instante `momento` (texto ISO): foto + movimentos seguintes
+    snap, ultimo = _snapshot_ate(conn, momento)
+    base = 0
+    if snap is not None:
+        row = conn.execute("SELECT quantidade FROM saldos_snapshot WHERE snapshot_id=? AND tabela=? AND codigo=?",
+                           (snap, tabela, codigo)).fetchone()
+        base = row[0] if row else 0
+    delta = conn.execute("""SELECT COALESCE(SUM(quantidade), 0) FROM movimentacoes
+                            WHERE tabela = ? AND codigo = ? AND id > ? AND momento <= ?""",
+                         (tabela, codigo, ultimo, momento)).fetchone()[0]
+    return base + delta
+
+@medido
+def estoque_em(conn, tabela, momento):
+    # [(codigo, saldo)] de toda a tabela no instante `momento`, sem itens zerados
+    snap, ultimo = _snapshot_ate(conn, momento)
+    return conn.execute("""
+        SELECT codigo, SUM(q) FROM (
+            SELECT codigo, quantidade AS q FROM saldos_snapshot WHERE snapshot_id = ? AND tabela = ?
+            UNION ALL
+            SELECT codigo, quantidade FROM movimentacoes WHERE tabela = ? AND id > ? AND momento <= ?
+        ) GROUP BY codigo HAVING SUM(q) <> 0 ORDER BY codigo""", (snap, tabela, tabela, ultimo, momento)).fetchall()
+
+# -----------------------
+# Importação / exportação em lote
+# -----------------------
+COLUNAS_TABELAS = {
+    "produtos": ("codigo", "nome", "quantidade"),
+    "produtos_epis": ("codigo", "nome", "quantidade"),
+    "produtos_rotulos": ("codigo", "nome", "quantidade"),
+    "produtos_quimicos": ("codigo", "nome", "densidade_kg_l", "unidade_origem", "litros", "kilos",
+                          "local_armazenamento", "lote", "validade"),
+}
+# nomes alternativos aceitos no cabeçalho do CSV / chaves do JSON
+_ALIASES_COLUNAS = {"local": "local_armazenamento", "densidade": "densidade_kg_l", "unidade": "unidade_origem", "qtd": "quantidade"}
+TAMANHO_LOTE_IMPORTACAO = 1000
+
+def _objetos_json(arquivo, bloco=1 << 16):
+    # lê um array JSON (ou JSON Lines) objeto a objeto, sem carregar o arquivo inteiro
+    dec = json.JSONDecoder()
+    buf, pos, fim = "", 0, False
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,[]":
+            pos += 1
+        if pos == len(buf):
+            if fim: return
+            buf, pos = arquivo.read(bloco), 0
+            fim = not buf
+            continue
+        try:
+            obj, pos_fim = dec.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if fim: raise
+            mais = arquivo.read(bloco)
+            fim = not mais
+            buf, pos = buf[pos:] + mais, 0
+            continue
+        yield obj
+        pos = pos_fim
+
+def _ler_registros(arquivo, formato):
+    # gera (número do registro, dict) — no CSV o número é a linha do arquivo
+    if formato == "csv":
+        import csv
+        leitor = csv.DictReader(arquivo)
+        for registro in leitor:
+            yield leitor.line_num, registro
+    else:
+        for n, registro in enumerate(_objetos_json(arquivo), start=1):
+            yield n, registro
+
+def _converter_registro(tabela, registro):
+    # dict lido do arquivo -> tupla na ordem de COLUNAS_TABELAS; ValueError se inválido
+    if not isinstance(registro, dict):
+        raise ValueError("registro não é um objeto")
+    r = {_ALIASES_COLUNAS.get(k.strip().lower(), k.strip().lower()): v for k, v in registro.items() if k}
+    vazio = lambda v: v is None or str(v).strip() == ""
+    codigo, nome = r.get("codigo"), r.get("nome")
+    if vazio(codigo) or vazio(nome):
+        raise ValueError("código e nome são obrigatórios")
+    codigo, nome = str(codigo).strip(), str(nome).strip()
+    if tabela != "produtos_quimicos":
+        try:
+            qtd = int(float(r.get("quantidade")))
+        except (TypeError, ValueError):
+            raise ValueError(f"quantidade inválida: {r.get('quantidade')!r}")
+        if qtd < 0:
+            raise ValueError("quantidade negativa")
+        return (codigo, nome, qtd)
+    num = {}
+    for col in ("densidade_kg_l", "litros", "kilos"):
+        try:
+            num[col] = None if vazio(r.get(col)) else float(str(r.get(col)).replace(",", "."))
+        except ValueError:
+            raise ValueError(f"{col} inválido: {r.get(col)!r}")
+    if num["densidade_kg_l"] is None or num["litros"] is None:
+        raise ValueError("densidade e litros são obrigatórios")
+    if num["kilos"] is None:
+        num["kilos"] = num["densidade_kg_l"] * num["litros"]
+    texto = lambda col: None if vazio(r.get(col)) else str(r.get(col)).strip()
+    # unidade vazia fica None: no insert vira "kg/L", no upsert mantém a atual
+    return (codigo, nome, num["densidade_kg_l"], texto("unidade_origem"), num["litros"], num["kilos"],
+            texto("local_armazenamento"), texto("lote"), normalizar_validade(r.get("validade")))
+
+@com_retentativa
+def _gravar_lote(conn, comandos, lote, erros):
+    # comandos: [(sql, params(linha))] aplicados em ordem a cada linha. Um
+    # executemany por comando, tudo numa transação; se o lote falhar, refaz linha
+    # a linha para saber exatamente quais registros deram erro. Os erros só vão
+    # para `erros` no fim, para a retentativa não duplicá-los
+    try:
+        with conn:
+            for sql, params in comandos:
+                conn.executemany(sql, [params(linha) for _, linha in lote])
+        return len(lote)
+    except sqlite3.DatabaseError as e:
+        if _banco_ocupado(e): raise
+    gravados, falhas = 0, []
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for n, linha in lote:
+            conn.execute("SAVEPOINT linha")
+            try:
+                for sql, params in comandos:
+                    conn.execute(sql, params(linha))
+                conn.execute("RELEASE linha"); gravados += 1
+            except sqlite3.IntegrityError as e:
+                conn.execute("ROLLBACK TO linha"); conn.execute("RELEASE linha")
+                falhas.append((n, "código já cadastrado" if "UNIQUE" in str(e) else str(e)))
+    erros.extend(falhas)
+    return gravados
+
+def _comandos_importacao(tabela, upsert, usuario):
+    colunas = COLUNAS_TABELAS[tabela]
+    if tabela == "produtos_quimicos":
+        valores = ", ".join("COALESCE(?, 'kg/L')" if c == "unidade_origem" else "?" for c in colunas)
+        sql = f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({valores})"
+        conflito, params = "codigo", lambda linha: linha
+    else:
+        categoria = _categoria(tabela)
+        sql = "INSERT INTO itens (categoria, codigo, nome, quantidade) VALUES (?, ?, ?, ?)"
+        conflito, params = "codigo, categoria", lambda linha: (categoria,) + tuple(linha)
+    if upsert:
+        # campo vazio no arquivo mantém o valor atual
+        # (a unidade vai de novo como parâmetro: excluded já traz o "kg/L" do insert)
+        sql += f" ON CONFLICT({conflito}) DO UPDATE SET " + ", ".join(
+            f"{c}=COALESCE(?, {c})" if c == "unidade_origem" else f"{c}=COALESCE(excluded.{c}, {c})" for c in colunas[1:])
+        if tabela == "produtos_quimicos":
+            params = lambda linha: linha + (linha[3],)
+    comandos = [(sql, params)]
+    if tabela == "produtos_quimicos":
+        return comandos
+    # estoques com quantidade: a importação também entra na movimentação
+    momento = _agora()
+    if upsert:
+        # antes do upsert, para ainda enxergar o saldo anterior
+        mov = """INSERT INTO movimentacoes (tabela, codigo, tipo, quantidade, saldo, usuario, momento)
+                 SELECT ?, ?, 'ajuste', delta, ?, ?, ? FROM
+                 (SELECT ? - COALESCE((SELECT quantidade FROM itens WHERE categoria = ? AND codigo = ?), 0) AS delta) WHERE delta <> 0"""
+        return [(mov, lambda l: (tabela, l[0], l[2], usuario, momento, l[2], categoria, l[0]))] + comandos
+    mov = """INSERT INTO movimentacoes (tabela, codigo, tipo, quantidade, saldo, usuario, momento)
+             SELECT ?, ?, 'entrada', ?, ?, ?, ? WHERE ? <> 0"""
+    return comandos + [(mov, lambda l: (tabela, l[0], l[2], l[2], usuario, momento, l[2]))]
+
+@medido
+def importar_arquivo(conn, tabela, caminho, formato=None, upsert=False, tamanho_lote=TAMANHO_LOTE_IMPORTACAO, usuario=None):
+    """Importa CSV / JSON / JSON Lines em `tabela`, em lotes de `tamanho_lote`.
+    upsert=True atualiza os códigos já existentes (campos vazios mantêm o valor
+    atual); senão eles viram erro.
+    Devolve {"lidos", "gravados", "erros": [(registro, mensagem), ...]}."""
+    formato = formato or ("csv" if caminho.lower().endswith(".csv") else "json")
+    comandos = _comandos_importacao(tabela, upsert, usuario or _usuario_atual())
+    resultado = {"lidos": 0, "gravados": 0, "erros": []}
+    lote = []
+    with open(caminho, "r", encoding="utf-8-sig", newline="") as f:
+        for n, registro in _ler_registros(f, formato):
+            resultado["lidos"] += 1
+            try:
+                lote.append((n, _converter_registro(tabela, registro)))
+            except ValueError as e:
+                resultado["erros"].append((n, str(e)))
+            if len(lote) >= tamanho_lote:
+                resultado["gravados"] += _gravar_lote(conn, comandos, lote, resultado["erros"]); lote = []
+    if lote:
+        resultado["gravados"] += _gravar_lote(conn, comandos, lote, resultado["erros"])
+    resultado["erros"].sort()
+    return resultado
+
+def importar_estoque_json_legado(conn, caminho="estoque.json", tabela="produtos", upsert=False):
+    # arquivo do SistemaDeEstoqueSimples: lista de {"codigo", "nome", "quantidade", "preco"};
+    # preco não existe no banco e é ignorado
+    return importar_arquivo(conn, tabela, caminho, formato="json", upsert=upsert)
+
+def _consultar_tabela(conn, tabela, colunas, filtro=None):
+    # cursor com `colunas` de toda a tabela (ou só o que passa no filtro), por nome
+    origem, cond, params = _fonte(tabela)
+    if filtro:
+        c, p = _filtro_busca(conn, tabela, filtro)
+        cond.append(c); params += p
+    sql = f"SELECT {', '.join(colunas)} FROM {origem}" + (" WHERE " + " AND ".join(cond) if cond else "")
+    return conn.execute(sql + " ORDER BY nome, codigo", params)
+
+@medido
+def exportar_arquivo(conn, tabela, caminho, formato=None, progresso=None):
+    formato = formato or ("csv" if caminho.lower().endswith(".csv") else
+                          "jsonl" if caminho.lower().endswith(".jsonl") else "json")
+    with open(caminho, "w", encoding="utf-8", newline="") as f:
+        return escrever_registros(conn, tabela, f, formato, progresso)
+
+def escrever_registros(conn, tabela, f, formato="csv", progresso=None, filtro=None):
+    # percorre o cursor linha a linha (sem fetchall), memória constante; devolve o total.
+    # `f` é um arquivo texto já aberto (o CLI passa sys.stdout)
+    colunas = COLUNAS_TABELAS[tabela]
+    cur = _contar(_consultar_tabela(conn, tabela, colunas, filtro), progresso)
+    total = 0
+    if formato == "csv":
+        import csv
+        w = csv.writer(f)
+        w.writerow(colunas)
+        for linha in cur:
+            w.writerow(linha); total += 1
+    else:
+        if formato == "json": f.write("[")
+        for linha in cur:
+            obj = json.dumps(dict(zip(colunas, linha)), ensure_ascii=False)
+            if formato == "json":
+                f.write(("\n" if total == 0 else ",\n") + obj)
+            else:
+                f.write(obj + "\n")
+            total += 1
+        if formato == "json": f.write("\n]\n")
+    return total
+
+# -----------------------
+# Relatórios (agregados no SQL, exportação CSV / XLSX / PDF)
+# -----------------------
+# Os agregados saem prontos do SQLite; o detalhe é lido do cursor linha a linha e
+# escrito direto no arquivo, então a memória não cresce com o tamanho do relatório.
+RELATORIOS = {
+    "totais": "Totais por tabela",
+    "locais": "Químicos por local de armazenamento",
+    "lotes": "Químicos por lote",
+    "validade": "Químicos por faixa de validade",
+    "detalhe": "Listagem completa",
+}
+# (rótulo, limite em dias até o vencimento); as faixas fora daqui são tratadas no CASE
+FAIXAS_VALIDADE = (("vencido", -1), (f"até {VALIDADE_ALERT_DIAS} dias", VALIDADE_ALERT_DIAS),
+                   ("até 30 dias", 30), ("até 90 dias", 90))
+PROGRESSO_A_CADA = 5000
+
+def consultar_relatorio(conn, relatorio, tabela=None, filtro=None):
+    """Devolve (titulo, colunas, cursor); quem chama percorre o cursor."""
+    if relatorio == "totais":
+        # uma parte por categoria (cada uma no seu índice parcial), inclusive as vazias
+        partes = ["SELECT ?, COUNT(*), SUM(quantidade), NULL, NULL FROM itens WHERE categoria = ?"] * len(CATEGORIAS)
+        partes.append("SELECT 'produtos_quimicos', COUNT(*), NULL, ROUND(SUM(litros), 3), ROUND(SUM(kilos), 3) FROM produtos_quimicos")
+        params = [v for par in CATEGORIAS.items() for v in par]
+        return RELATORIOS[relatorio], ("tabela", "itens", "unidades", "litros", "kilos"), conn.execute(" UNION ALL ".join(partes), params)
+    if relatorio in ("locais", "lotes"):
+        coluna = "local_armazenamento" if relatorio == "locais" else "lote"
+        cur = conn.execute(f"""SELECT COALESCE({coluna}, '(sem {"local" if relatorio == "locais" else "lote"})'), COUNT(*),
+                                      ROUND(SUM(litros), 3), ROUND(SUM(kilos), 3), MIN(validade)
+                               FROM produtos_quimicos GROUP BY {coluna} ORDER BY SUM(kilos) DESC, 1""")
+        return RELATORIOS[relatorio], (coluna, "itens", "litros", "kilos", "validade_mais_proxima"), cur
+    if relatorio == "validade":
+        # julianday(validade) é NULL para o que normalizar_validade não conseguiu ler
+        casos = " ".join(f"WHEN julianday(validade) - julianday(:hoje) <= {dias} THEN {i}"
+                         for i, (_, dias) in enumerate(FAIXAS_VALIDADE))
+        n = len(FAIXAS_VALIDADE)
+        rotulos = " ".join(f"WHEN {i} THEN '{r}'" for i, (r, _) in enumerate(FAIXAS_VALIDADE))
+        cur = conn.execute(f"""SELECT CASE faixa {rotulos} WHEN {n} THEN 'mais de {FAIXAS_VALIDADE[-1][1]} dias'
+                                      WHEN {n + 1} THEN 'sem validade' ELSE 'data inválida' END,
+                                      COUNT(*), ROUND(SUM(litros), 3), ROUND(SUM(kilos), 3)
+                               FROM (SELECT litros, kilos,
+                                            CASE WHEN validade IS NULL OR validade = '' THEN {n + 1}
+                                                 WHEN julianday(validade) IS NULL THEN {n + 2}
+                                                 {casos} ELSE {n} END AS faixa
+                                     FROM produtos_quimicos)
+                               GROUP BY faixa ORDER BY faixa""", {"hoje": date.today().isoformat()})
+        return RELATORIOS[relatorio], ("faixa", "itens", "litros", "kilos"), cur
+    if relatorio == "detalhe":
+        if tabela not in COLUNAS_TABELAS:
+            raise ValueError(f"tabela inválida: {tabela}")
+        colunas = COLUNAS_TABELAS[tabela]
+        return f"{RELATORIOS[relatorio]} — {tabela}", colunas, _consultar_tabela(conn, tabela, colunas, filtro)
+    raise ValueError(f"relatório desconhecido: {relatorio}")
+
+@medido
+def ler_relatorio(conn, relatorio, tabela=None, limite=1000):
+    # para mostrar na tela: os agregados têm poucas linhas
+    titulo, colunas, cur = consultar_relatorio(conn, relatorio, tabela)
+    return titulo, colunas, cur.fetchmany(limite)
+
+@medido
+def resumo_tabela(conn, tabela):
+    # totais de uma tabela para o cabeçalho da janela de relatório
+    _, colunas, cur = consultar_relatorio(conn, "totais")
+    resumo = next(dict(zip(colunas, linha)) for linha in cur if linha[0] == tabela)
+    if tabela == "produtos_quimicos":
+        resumo["validade"] = [(faixa, itens) for faixa, itens, _, _ in consultar_relatorio(conn, "validade")[2]]
+    return resumo
+
+def _contar(linhas, progresso):
+    # repassa as linhas avisando progresso(total) de tempos em tempos
+    total = 0
+    for linha in linhas:
+        yield linha
+        total += 1
+        if progresso and total % PROGRESSO_A_CADA == 0: progresso(total)
+
+def _escrever_csv(caminho, titulo, colunas, linhas):
+    total = 0
+    import csv
+    with open(caminho, "w", encoding="utf-8-sig", newline="") as f:  # BOM: o Excel abre acentuado
+        w = csv.writer(f)
+        w.writerow(colunas)
+        for linha in linhas:
+            w.writerow(linha); total += 1
+    return total
+
+_RE_XML_INVALIDO = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+MAX_LINHAS_XLSX = 1048576
+
+def _escapar_xml(texto):
+    # o mesmo que xml.sax.saxutils.escape, que importa urllib.request (~20 ms)
+    return texto.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def _celula_xlsx(valor):
+    if valor is None: return "<c/>"
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f"<c><v>{valor!r}</v></c>"
+    texto = _escapar_xml(_RE_XML_INVALIDO.sub("", str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+def _escrever_xlsx(caminho, titulo, colunas, linhas):
+    # planilha mínima (uma aba, strings inline) escrita em fluxo dentro do zip
+    import zipfile
+    aba = _escapar_xml(re.sub(r"[\[\]:*?/\\]", " ", titulo)[:31])
+    with zipfile.ZipFile(caminho, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("[Content_Types].xml",
+                   '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                   '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                   '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                   '<Default Extension="xml" ContentType="application/xml"/>'
+                   '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                   '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                   '</Types>')
+        z.writestr("_rels/.rels",
+                   '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                   '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                   '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+                   '</Relationships>')
+        z.writestr("xl/workbook.xml",
+                   '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                   '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                   'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                   f'<sheets><sheet name="{aba}" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        z.writestr("xl/_rels/workbook.xml.rels",
+                   '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                   '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                   '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+                   '</Relationships>')
+        total = 0
+        with z.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as f:
+            f.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            bloco = ["<row>" + "".join(_celula_xlsx(c) for c in colunas) + "</row>"]
+            for linha in linhas:
+                total += 1
+                if total >= MAX_LINHAS_XLSX:
+                    raise ValueError(f"o XLSX aceita no máximo {MAX_LINHAS_XLSX - 1} linhas; exporte em CSV")
+                bloco.append("<row>" + "".join(_celula_xlsx(c) for c in linha) + "</row>")
+                if len(bloco) >= 1000:
+                    f.write("".join(bloco).encode("utf-8")); bloco = []
+            f.write(("".join(bloco) + "</sheetData></worksheet>").encode("utf-8"))
+    return total
+
+PDF_PAGINA = (842, 595)  # A4 paisagem, em pontos
+PDF_MARGEM = 30
+PDF_FONTE = 7
+
+def _texto_pdf(valor, largura):
+    # Helvetica tem em média ~0,5 em por caractere; corta o que não cabe na coluna
+    if valor is None: texto = ""
+    elif isinstance(valor, float): texto = f"{valor:.3f}"
+    else: texto = str(valor)
+    maximo = max(1, int(largura / (PDF_FONTE * 0.5)) - 1)
+    if len(texto) > maximo: texto = texto[:maximo - 1] + "…"
+    texto = texto.encode("cp1252", "replace")
+    return texto.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+def _escrever_pdf(caminho, titulo, colunas, linhas):
+    # PDF 1.4 mínimo com Helvetica: cada página é gravada assim que fica cheia, e só
+    # os offsets dos objetos ficam em memória
+    largura, altura = PDF_PAGINA
+    util = largura - 2 * PDF_MARGEM
+    pesos = [3 if c == "nome" else 1 for c in colunas]
+    larguras = [util * p / sum(pesos) for p in pesos]
+    passo = PDF_FONTE + 3
+    por_pagina = int((altura - 2 * PDF_MARGEM - 3 * passo) / passo)
+    gerado = datetime.now().strftime("%d/%m/%Y %H:%M")
+    with open(caminho, "wb") as f:
+        offsets = {}
+        def objeto(numero, corpo):
+            offsets[numero] = f.tell()
+            f.write(b"%d 0 obj\n" % numero + corpo + b"\nendobj\n")
+        def linha_pdf(valores, y, negrito=False):
+            partes, x = [], PDF_MARGEM
+            for valor, larg in zip(valores, larguras):
+                partes.append(b"BT /F%d %d Tf %.1f %.1f Td (%s) Tj ET" % (2 if negrito else 1, PDF_FONTE, x, y, _texto_pdf(valor, larg)))
+                x += larg
+            return b"\n".join(partes)
+        paginas = []
+        def gravar_pagina(corpo):
+            numero = 5 + 2 * len(paginas)
+            topo = altura - PDF_MARGEM
+            cabecalho = [b"BT /F2 10 Tf %d %d Td (%s) Tj ET" % (PDF_MARGEM, topo, _texto_pdf(titulo, util / 2)),
+                         b"BT /F1 %d Tf %d %d Td (%s) Tj ET" % (PDF_FONTE, largura - PDF_MARGEM - 120, topo,
+                                                               _texto_pdf(f"{gerado} — página {len(paginas) + 1}", 120)),
+                         linha_pdf(colunas, topo - 2 * passo, negrito=True)]
+            conteudo = zlib.compress(b"\n".join(cabecalho + corpo))
+            objeto(numero, b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(conteudo) + conteudo + b"\nendstream")
+            objeto(numero + 1, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R "
+                               b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> >>" % (largura, altura, numero))
+            paginas.append(numero + 1)
+        f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        objeto(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        objeto(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        objeto(4, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+        total, corpo = 0, []
+        for linha in linhas:
+            corpo.append(linha_pdf(linha, altura - PDF_MARGEM - (3 + len(corpo)) * passo))
+            total += 1
+            if len(corpo) >= por_pagina:
+                gravar_pagina(corpo); corpo = []
+        if corpo or not paginas:
+            gravar_pagina(corpo)
+        objeto(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % p for p in paginas), len(paginas)))
+        inicio_xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (max(offsets) + 1))
+        for numero in range(1, max(offsets) + 1):
+            f.write(b"%010d 00000 n \n" % offsets[numero])
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (max(offsets) + 1, inicio_xref))
+    return total
+
+ESCRITORES_RELATORIO = {"csv": _escrever_csv, "xlsx": _escrever_xlsx, "pdf": _escrever_pdf}
+
+@medido
+def exportar_relatorio(conn, relatorio, caminho, formato=None, tabela=None, filtro=None, progresso=None):
+    """Grava o relatório em CSV, XLSX ou PDF (pela extensão se formato=None);
+    progresso(linhas) é chamado a cada PROGRESSO_A_CADA linhas. Devolve o total."""
+    formato = (formato or os.path.splitext(caminho)[1].lstrip(".") or "csv").lower()
+    if formato not in ESCRITORES_RELATORIO:
+        raise ValueError(f"formato não suportado: {formato}")
+    titulo, colunas, cur = consultar_relatorio(conn, relatorio, tabela, filtro)
+    return ESCRITORES_RELATORIO[formato](caminho, titulo, colunas, _contar(cur, progresso))
+
+# -----------------------
+# Consolidação (bancos de várias unidades)
+# -----------------------
+# Cada unidade tem o seu estoque.db. A matriz abre os arquivos só para leitura
+# (mode=ro: não cria arquivo, não migra, não bloqueia a escrita da unidade em WAL),
+# lê cada um numa thread — o sqlite3 solta o GIL durante a consulta — e junta os
+# cursores por código, em blocos, com uma coluna de quantidade por unidade.
+MAX_BANCOS_PARALELOS = 8
+
+def nome_unidade(caminho):
+    # "sp.db" -> "sp"; ".../sp/estoque.db" -> "sp" (a pasta diz mais que o nome padrão)
+    base = os.path.splitext(os.path.basename(caminho))[0]
+    if base == os.path.splitext(DB_FILE)[0]:
+        return os.path.basename(os.path.dirname(os.path.abspath(caminho))) or base
+    return base
+
+def conectar_somente_leitura(path, check_same_thread=True):
+    from urllib.parse import quote
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"arquivo não encontrado: {path}")
+    conn = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True, check_same_thread=check_same_thread,
+                           factory=Conexao)
+    try:
+        # sem escrita não dá para migrar: vale qualquer versão que já tenha o que a leitura usa
+        versao = conn.execute("PRAGMA user_version").fetchone()[0]
+        if versao < VERSAO_MINIMA_LEITURA:
+            raise sqlite3.DatabaseError(f"banco na versão {versao} (a leitura precisa da {VERSAO_MINIMA_LEITURA} ou mais nova): "
+                                        "abra-o uma vez no sistema da unidade para atualizar")
+        if versao > len(MIGRACOES):
+            raise sqlite3.DatabaseError(f"banco na versão {versao}, mais nova que a deste sistema ({len(MIGRACOES)}): "
+                                        "atualize o sistema que está consolidando")
+        configurar_conexao(conn, leitura=True)
+    except:
+        conn.close()
+        raise
+    return conn
+
+# colunas lidas de cada unidade: código, nome e o que é somado por código
+COLUNAS_CONSOLIDACAO = {**{t: ("codigo", "nome", "quantidade") for t in CATEGORIAS},
+                        "produtos_quimicos": ("codigo", "nome", "litros", "kilos", "validade")}
+BLOCO_CONSOLIDACAO = 2000
+
+def _ler_unidade(caminho, filtro, indice, unidades, juntos, trava):
+    # percorre o cursor de cada tabela em blocos e junta direto em `juntos`
+    # ({tabela: {codigo: [nome, valores da unidade 0, ...]}}); a trava só cobre a
+    # junção do bloco, a leitura no SQLite continua em paralelo. Devolve a validade.
+    conn = conectar_somente_leitura(caminho, check_same_thread=False)
+    try:
+        for tabela, colunas in COLUNAS_CONSOLIDACAO.items():
+            cur = _consultar_tabela(conn, tabela, colunas, filtro)
+            destino = juntos[tabela]
+            while True:
+                bloco = cur.fetchmany(BLOCO_CONSOLIDACAO)
+                if not bloco: break
+                with trava:
+                    for linha in bloco:
+                        item = destino.get(linha[0])
+                        if item is None:
+                            item = destino[linha[0]] = [linha[1]] + [None] * unidades
+                        item[indice + 1] = linha[2] if tabela in CATEGORIAS else linha[2:]
+        return verificar_validade_quimicos(conn)
+    finally:
+        conn.close()
+
+@medido
+def consolidar_bancos(caminhos, filtro=None, max_paralelo=MAX_BANCOS_PARALELOS):
+    """Lê os estoques e a validade de vários bancos e junta tudo por código.
+
+    Devolve {"unidades": [nome...], "erros": [(unidade, mensagem)],
+    "tabelas": {tabela: (colunas, linhas)}, "validade": [(unidade, situação, validade, nome)]}.
+    Um banco que não abre vira erro e os demais são consolidados assim mesmo."""
+    from concurrent.futures import ThreadPoolExecutor
+    nomes = [nome_unidade(c) for c in caminhos]
+    # duas pastas com o mesmo nome: desambigua pelo índice
+    nomes = [n if nomes.count(n) == 1 else f"{n} ({i + 1})" for i, n in enumerate(nomes)]
+    juntos, trava = {t: {} for t in COLUNAS_CONSOLIDACAO}, threading.Lock()
+    unidades, validades, lidas, erros = [], [], [], []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_paralelo, len(caminhos)))) as pool:
+        futuros = [pool.submit(_ler_unidade, c, filtro, i, len(caminhos), juntos, trava) for i, c in enumerate(caminhos)]
+        for i, (nome, futuro) in enumerate(zip(nomes, futuros)):
+            try:
+                validades.append(futuro.result()); unidades.append(nome); lidas.append(i + 1)
+            except (sqlite3.Error, OSError) as e:
+                erros.append((nome, str(e)))
+    # só as colunas das unidades lidas até o fim (uma que falhou no meio pode ter juntado parte)
+    colunas_lidas = lambda juntos: ((codigo, item[0], [item[i] for i in lidas]) for codigo, item in juntos.items())
+    tabelas = {}
+    for tabela in CATEGORIAS:
+        linhas = [(codigo, nome, sum(q or 0 for q in qtds), *qtds)
+                  for codigo, nome, qtds in colunas_lidas(juntos[tabela]) if any(q is not None for q in qtds)]
+        tabelas[tabela] = (("codigo", "nome", "total") + tuple(unidades), sorted(linhas, key=lambda l: (l[1], l[0])))
+    # químicos: soma litros e kilos, a coluna por unidade é em kg e a validade é a mais próxima
+    linhas = []
+    for codigo, nome, partes in colunas_lidas(juntos["produtos_quimicos"]):
+        presentes = [p for p in partes if p is not None]
+        if not presentes: continue
+        validades_item = [p[2] for p in presentes if p[2]]
+        linhas.append((codigo, nome, round(sum(p[0] or 0 for p in presentes), 3), round(sum(p[1] or 0 for p in presentes), 3),
+                       min(validades_item) if validades_item else None, *(p and p[1] for p in partes)))
+    tabelas["produtos_quimicos"] = (("codigo", "nome", "litros", "kilos", "validade") + tuple(f"{u} (kg)" for u in unidades),
+                                    sorted(linhas, key=lambda l: (l[1], l[0])))
+    validade = []
+    for unidade, (vencidos, proximos) in zip(unidades, validades):
+        validade += [(unidade, "vencido", v, nome) for nome, v in vencidos]
+        validade += [(unidade, f"vence em {dias} dias", v, nome) for nome, v, dias in proximos]
+    validade.sort(key=lambda l: (l[2], l[0], l[3]))
+    return {"unidades": unidades, "erros": erros, "tabelas": tabelas, "validade": validade}
+
+def exportar_consolidado(consolidado, tabela, caminho, formato=None, progresso=None):
+    # tabela="validade" exporta a lista de vencidos/a vencer de todas as unidades
+    formato = (formato or os.path.splitext(caminho)[1].lstrip(".") or "csv").lower()
+    if formato not in ESCRITORES_RELATORIO:
+        raise ValueError(f"formato não suportado: {formato}")
+    if tabela == "validade":
+        colunas, linhas = ("unidade", "situacao", "validade", "nome"), consolidado["validade"]
+    else:
+        colunas, linhas = consolidado["tabelas"][tabela]
+    titulo = f"Consolidado — {tabela} — {', '.join(consolidado['unidades'])}"
+    return ESCRITORES_RELATORIO[formato](caminho, titulo, colunas, _contar(linhas, progresso))
+
+# -----------------------
+# Cópias de segurança (API de backup do SQLite)
+# -----------------------
+# A cópia é feita pela API de backup, BACKUP_PAGINAS páginas por passo: cada passo
+# lê um instantâneo consistente e solta o banco em seguida, então quem escreve não
+# fica parado esperando a cópia inteira (copiar o arquivo pode pegar uma transação
+# no meio). Se outra conexão escreve durante a cópia, o SQLite recomeça do início;
+# depois de BACKUP_MAX_REINICIOS recomeços a cópia é feita num passo só.
+BACKUP_DIR = os.environ.get("ESTOQUE_BACKUP_DIR", "backups")
+BACKUP_MANTER = 14
+BACKUP_PAGINAS = 256
+BACKUP_MAX_REINICIOS = 3
+_RE_BACKUP = re.compile(r"-(\d{8}-\d{6})(?:-(\d+))?\.db(?:\.gz)?$")
+
+class _CopiaReiniciada(Exception):
+    pass
+
+def _caminho_banco(conn):
+    return conn.execute("PRAGMA database_list").fetchone()[2] or DB_FILE
+
+def _copiar_paginas(origem, destino, progresso=None):
+    # devolve o total de páginas copiadas
+    estado = {"restante": None, "reinicios": 0, "total": 0}
+    def passo(status, restante, total):
+        if estado["restante"] is not None and restante > estado["restante"]:
+            estado["reinicios"] += 1
+            if estado["reinicios"] > BACKUP_MAX_REINICIOS: raise _CopiaReiniciada()
+        estado["restante"], estado["total"] = restante, total
+        if progresso: progresso(total - restante, total)
+    try:
+        origem.backup(destino, pages=BACKUP_PAGINAS, progress=passo)
+    except _CopiaReiniciada:
+        origem.backup(destino)
+    return destino.execute("PRAGMA page_count").fetchone()[0]
+
+def listar_backups(diretorio=BACKUP_DIR, base=None):
+    """[(caminho, momento, bytes)] do mais novo para o mais antigo; base filtra pelo nome do banco."""
+    if not os.path.isdir(diretorio):
+        return []
+    achados = []
+    for nome in os.listdir(diretorio):
+        m = _RE_BACKUP.search(nome)
+        if m and (base is None or nome[:m.start()] == base):
+            caminho = os.path.join(diretorio, nome)
+            momento = datetime.strptime(m.group(1), "%Y%m%d-%H%M%S").isoformat(" ")
+            achados.append((momento, int(m.group(2) or 0), caminho, os.path.getsize(caminho)))
+    return [(caminho, momento, tamanho) for momento, _, caminho, tamanho in sorted(achados, reverse=True)]
+
+@medido
+def fazer_backup(conn, diretorio=BACKUP_DIR, comprimir=False, manter=BACKUP_MANTER, progresso=None):
+    """Copia o banco de `conn` para diretorio/<banco>-AAAAMMDD-HHMMSS.db (ou .db.gz),
+    confere a cópia (quick_check) e apaga as mais antigas além de `manter`.
+    progresso(paginas_copiadas, total) é chamado a cada passo.
+    Devolve {"arquivo", "paginas", "bytes", "segundos"}."""
+    inicio = time.perf_counter()
+    base = os.path.splitext(os.path.basename(_caminho_banco(conn)))[0]
+    os.makedirs(diretorio, exist_ok=True)
+    prefixo, n = os.path.join(diretorio, f"{base}-{datetime.now():%Y%m%d-%H%M%S}"), 0
+    arquivo = prefixo + ".db"
+    while any(os.path.exists(arquivo + sufixo) for sufixo in ("", ".gz", ".tmp")):  # dois backups no mesmo segundo
+        n += 1; arquivo = f"{prefixo}-{n}.db"
+    temporario = arquivo + ".tmp"
+    destino = sqlite3.connect(temporario)
+    try:
+        paginas = _copiar_paginas(conn, destino, progresso)
+        # a cópia herda o modo WAL da origem; num arquivo avulso o journal comum basta
+        destino.execute("PRAGMA journal_mode = DELETE")
+        verificacao = destino.execute("PRAGMA quick_check").fetchone()[0]
+        if verificacao != "ok":
+            raise sqlite3.DatabaseError(f"cópia corrompida: {verificacao}")
+    except:
+        destino.close(); os.remove(temporario)
+        raise
+    destino.close()
+    if comprimir:
+        import gzip, shutil
+        arquivo += ".gz"
+        with open(temporario, "rb") as origem, gzip.open(arquivo, "wb", compresslevel=6) as saida:
+            shutil.copyfileobj(origem, saida, 1 << 20)
+        os.remove(temporario)
+    else:
+        os.replace(temporario, arquivo)
+    for antigo, _, _ in listar_backups(diretorio, base)[manter:]:
+        os.remove(antigo)
+    return {"arquivo": arquivo, "paginas": paginas, "bytes": os.path.getsize(arquivo),
+            "segundos": round(time.perf_counter() - inicio, 3)}
+
+def _conferir_banco(conn):
+    # cópia legível, íntegra e de uma versão que migrar_banco sabe atualizar
+    verificacao = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    if verificacao != "ok":
+        raise sqlite3.DatabaseError(f"banco corrompido: {verificacao}")
+    versao = conn.execute("PRAGMA user_version").fetchone()[0]
+    if versao > len(MIGRACOES):
+        raise sqlite3.DatabaseError(f"banco de uma versão mais nova do sistema ({versao})")
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'produtos_quimicos'").fetchone():
+        raise sqlite3.DatabaseError("o arquivo não é um banco do estoque")
+
+@medido
+def restaurar_backup(conn, arquivo, copia_antes=True, diretorio=BACKUP_DIR, progresso=None):
+    """Substitui o conteúdo do banco de `conn` pela cópia `arquivo` (.db ou .db.gz).
+    A cópia é conferida (integrity_check) antes de tocar no banco; com copia_antes
+    o estado atual vira um backup antes de ser sobrescrito. Outras conexões abertas
+    passam a ver o conteúdo restaurado no próximo comando.
+    Devolve {"arquivo", "copia_antes", "paginas", "segundos"}."""
+    inicio = time.perf_counter()
+    temporario = None
+    if arquivo.endswith(".gz"):
+        import gzip, shutil, tempfile
+        fd, temporario = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(_caminho_banco(conn))))
+        with os.fdopen(fd, "wb") as saida, gzip.open(arquivo, "rb") as entrada:
+            shutil.copyfileobj(entrada, saida, 1 << 20)
+    elif not os.path.exists(arquivo):
+        raise FileNotFoundError(f"arquivo não encontrado: {arquivo}")
+    versao_antes = _versao_tabela(conn, "produtos_quimicos") or 0
+    try:
+        origem = sqlite3.connect(temporario or arquivo)
+        try:
+            _conferir_banco(origem)
+            anterior = fazer_backup(conn, diretorio)["arquivo"] if copia_antes else None
+            paginas = _copiar_paginas(origem, conn, progresso)
+        finally:
+            origem.close()
+    finally:
+        if temporario: os.remove(temporario)
+    # a cópia entrou por baixo do cache desta conexão (as outras percebem pelo data_version)
+    limpar_caches(conn)
+    _conferir_banco(conn)
+    migrar_banco(conn)  # uma cópia de versão anterior sobe para a atual
+    # o contador de produtos_quimicos voltou ao da cópia e poderia repetir uma versão
+    # que outra conexão já guardou em cache (verificar_validade_quimicos): segue adiante
+    with conn:
+        conn.execute("UPDATE versoes_tabelas SET versao = MAX(versao, ?) + 1 WHERE tabela = 'produtos_quimicos'", (versao_antes,))
+    return {"arquivo": arquivo, "copia_antes": anterior, "paginas": paginas, "segundos": round(time.perf_counter() - inicio, 3)}
+
+# -----------------------
+# Alterações (captura de mudanças e sincronização)
+# -----------------------
+# Triggers em itens, produtos_quimicos e lotes_quimicos gravam cada inclusão,
+# alteração e remoção em alteracoes, com um seq crescente (AUTOINCREMENT: não se
+# repete nem depois de podar). Quem consome guarda o último seq que leu e pede só
+# o que veio depois, então exportar ou sincronizar custa o número de mudanças, não
+# o tamanho das tabelas. Os triggers ignoram UPDATEs que não mudam nada, então
+# aplicar de volta uma mudança que veio do outro lado não gera eco.
+#   dados      a linha como ficou (em remover, a linha que saiu), em JSON
+#   origem     NULL para mudanças feitas aqui; o nome da origem para as aplicadas
+#              de fora (sincronizar só puxa as locais do outro banco)
+OPERACOES_ALTERACAO = ("inserir", "alterar", "remover")
+_COLUNAS_LOTE = ("codigo", "lote", "validade", "litros", "kilos", "local_armazenamento")
+
+def _fontes_alteracoes():
+    # tabela física -> (nome publicado em função da linha, chave, colunas de dados)
+    casos = " ".join(f"WHEN '{categoria}' THEN '{tabela}'" for tabela, categoria in CATEGORIAS.items())
+    return {
+        "itens": (lambda l: f"CASE {l}.categoria {casos} END", lambda l: f"{l}.codigo", COLUNAS_TABELAS["produtos"]),
+        "produtos_quimicos": (lambda l: "'produtos_quimicos'", lambda l: f"{l}.codigo", COLUNAS_TABELAS["produtos_quimicos"]),
+        "lotes_quimicos": (lambda l: "'lotes_quimicos'", lambda l: f"json_array({l}.codigo, {l}.lote)", _COLUNAS_LOTE),
+    }
+
+def _criar_alteracoes(conn):
+    # passo de migração: o log começa com uma inclusão por linha existente, então
+    # ler desde 0 sempre reconstrói o estado inteiro
+    conn.execute("""
+        CREATE TABLE alteracoes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tabela TEXT NOT NULL,
+            chave TEXT NOT NULL,
+            operacao TEXT NOT NULL CHECK (operacao IN ('inserir', 'alterar', 'remover')),
+            dados TEXT NOT NULL,
+            momento TEXT NOT NULL,
+            origem TEXT
+        )""")
+    # compactação (última mudança de cada chave)
+    conn.execute("CREATE INDEX idx_alteracoes_chave ON alteracoes(tabela, chave, seq)")
+    # até onde já foi aplicado o que veio de cada origem
+    conn.execute("""
+        CREATE TABLE sincronizacao (
+            origem TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL,
+            momento TEXT NOT NULL
+        )""")
+    for fisica, (_, _, colunas) in _fontes_alteracoes().items():
+        _triggers_alteracoes(conn, fisica, colunas, semear=True)
+
+def _triggers_alteracoes(conn, fisica, colunas, semear=False):
+    # (re)cria os três triggers de `fisica` registrando `colunas` em dados
+    nome, chave, _ = _fontes_alteracoes()[fisica]
+    agora = "strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')"
+    registrar = "INSERT INTO alteracoes (tabela, chave, operacao, dados, momento)"
+    dados = lambda l: "json_object(" + ", ".join(f"'{c}', {l}.{c}" for c in colunas) + ")"
+    if semear:
+        conn.execute(f"{registrar} SELECT {nome('t')}, {chave('t')}, 'inserir', {dados('t')}, {agora} FROM {fisica} t ORDER BY rowid")
+    mudou = " OR ".join(f"old.{c} IS NOT new.{c}" for c in colunas + (("categoria",) if fisica == "itens" else ()))
+    mesma_chave = f"{nome('old')} IS {nome('new')} AND {chave('old')} IS {chave('new')}"
+    for evento in ("inserir", "alterar", "remover"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {fisica}_alteracoes_{evento}")
+    conn.execute(f"""CREATE TRIGGER {fisica}_alteracoes_inserir AFTER INSERT ON {fisica} BEGIN
+                     {registrar} VALUES ({nome('new')}, {chave('new')}, 'inserir', {dados('new')}, {agora}); END""")
+    # trocar o código (ou a categoria) é remover a chave antiga e incluir a nova
+    conn.execute(f"""CREATE TRIGGER {fisica}_alteracoes_alterar AFTER UPDATE ON {fisica} WHEN {mudou} BEGIN
+                     {registrar} SELECT {nome('old')}, {chave('old')}, 'remover', {dados('old')}, {agora} WHERE NOT ({mesma_chave});
+                     {registrar} VALUES ({nome('new')}, {chave('new')}, CASE WHEN {mesma_chave} THEN 'alterar' ELSE 'inserir' END,
+                                         {dados('new')}, {agora}); END""")
+    conn.execute(f"""CREATE TRIGGER {fisica}_alteracoes_remover AFTER DELETE ON {fisica} BEGIN
+                     {registrar} VALUES ({nome('old')}, {chave('old')}, 'remover', {dados('old')}, {agora}); END""")
+
+def ultima_alteracao(conn):
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM alteracoes").fetchone()[0]
+
+def ler_alteracoes(conn, desde=0, compactar=False, apenas_locais=False, ate=None):
+    """Gera as mudanças com seq > `desde` (e <= `ate`), em ordem, como dicts. `compactar`
+    deixa só a última de cada (tabela, chave); `apenas_locais` pula as que vieram de fora."""
+    cond, params = ["a.seq > ?"], [desde]
+    if ate is not None:
+        cond.append("a.seq <= ?"); params.append(ate)
+    if compactar:
+        cond.append("NOT EXISTS (SELECT 1 FROM alteracoes b WHERE b.tabela = a.tabela AND b.chave = a.chave AND b.seq > a.seq)")
+    if apenas_locais:
+        cond.append("a.origem IS NULL")
+    cursor = conn.execute(f"""SELECT seq, tabela, chave, operacao, dados, momento FROM alteracoes a
+                              WHERE {' AND '.join(cond)} ORDER BY seq""", params)
+    for seq, tabela, chave, operacao, dados, momento in cursor:
+        yield {"seq": seq, "tabela": tabela, "chave": chave, "operacao": operacao, "dados": json.loads(dados), "momento": momento}
+
+@medido
+def exportar_alteracoes(conn, caminho, desde=0, compactar=False, apenas_locais=False):
+    """Grava as mudanças depois de `desde` em JSON Lines (uma por linha).
+    Devolve (quantidade, último seq exportado — o `desde` da próxima vez)."""
+    n, ultimo = 0, desde
+    f = sys.stdout if caminho == "-" else open(caminho, "w", encoding="utf-8", newline="\n")
+    try:
+        for registro in ler_alteracoes(conn, desde, compactar, apenas_locais):
+            f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            n += 1; ultimo = registro["seq"]
+    finally:
+        if f is not sys.stdout: f.close()
+    return n, ultimo
+
+def ler_arquivo_alteracoes(caminho):
+    f = sys.stdin if caminho == "-" else open(caminho, encoding="utf-8")
+    try:
+        for numero, linha in enumerate(f, 1):
+            if not linha.strip(): continue
+            try:
+                yield json.loads(linha)
+            except ValueError as e:
+                raise ValueError(f"linha {numero}: {e}") from None
+    finally:
+        if f is not sys.stdin: f.close()
+
+def _aplicar_item(conn, tabela, operacao, dados, usuario):
+    categoria, codigo = _categoria(tabela), dados["codigo"]
+    if operacao == "remover":
+        _registrar_ajuste(conn, tabela, codigo, 0, usuario)
+        conn.execute("DELETE FROM itens WHERE categoria = ? AND codigo = ?", (categoria, codigo))
+    elif _ler_produto(conn, tabela, codigo) is None:
+        conn.execute("INSERT INTO itens (categoria, codigo, nome, quantidade, minimo) VALUES (?, ?, ?, ?, ?)",
+                     (categoria, codigo, dados["nome"], dados["quantidade"], dados.get("minimo") or 0))
+        if dados["quantidade"]:
+            _registrar_movimento(conn, tabela, codigo, "entrada", dados["quantidade"], usuario)
+    else:
+        _registrar_ajuste(conn, tabela, codigo, dados["quantidade"], usuario)
+        # sem "minimo" (log de antes do ponto de reposição) o mínimo daqui fica
+        conn.execute("UPDATE itens SET nome = ?, quantidade = ?, minimo = COALESCE(?, minimo) WHERE categoria = ? AND codigo = ?",
+                     (dados["nome"], dados["quantidade"], dados.get("minimo"), categoria, codigo))
+
+def _aplicar_quimico(conn, operacao, dados):
+    # só o cadastro: as quantidades, o lote e a validade vêm dos registros de
+    # lotes_quimicos e aqui são só recalculados (os lotes podem ter chegado antes)
+    if operacao == "remover":
+        conn.execute("DELETE FROM produtos_quimicos WHERE codigo = ?", (dados["codigo"],))
+        return
+    conn.execute("""INSERT INTO produtos_quimicos (codigo, nome, densidade_kg_l, unidade_origem) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (codigo) DO UPDATE SET nome = excluded.nome, densidade_kg_l = excluded.densidade_kg_l,
+                        unidade_origem = excluded.unidade_origem""",
+                 (dados["codigo"], dados["nome"], dados.get("densidade_kg_l"), dados.get("unidade_origem")))
+    sets = ", ".join(f"{c} = {e}" for c, e in _projecao_lotes("produtos_quimicos.codigo").items())
+    conn.execute(f"UPDATE produtos_quimicos SET {sets} WHERE codigo = ?", (dados["codigo"],))
+
+def _aplicar_lote(conn, operacao, dados):
+    # o trigger de lotes_quimicos recalcula o químico
+    codigo, lote = dados["codigo"], dados.get("lote")
+    if operacao == "remover":
+        conn.execute("DELETE FROM lotes_quimicos WHERE codigo = ? AND lote IS ?", (codigo, lote))
+        return
+    valores = (dados.get("validade"), dados.get("litros") or 0, dados.get("kilos") or 0, dados.get("local_armazenamento"))
+    atual = conn.execute("SELECT id FROM lotes_quimicos WHERE codigo = ? AND lote IS ?", (codigo, lote)).fetchone()
+    if atual:
+        conn.execute("UPDATE lotes_quimicos SET validade = ?, litros = ?, kilos = ?, local_armazenamento = ? WHERE id = ?",
+                     valores + (atual[0],))
+    else:
+        conn.execute("INSERT INTO lotes_quimicos (codigo, lote, validade, litros, kilos, local_armazenamento) VALUES (?, ?, ?, ?, ?, ?)",
+                     (codigo, lote) + valores)
+
+@medido
+def aplicar_alteracoes(conn, registros, origem=None):
+    """Aplica mudanças lidas de outro banco (ler_alteracoes / arquivo JSON Lines)
+    numa transação só (sem retentativa: `registros` pode ser um gerador). Com
+    `origem`, o que já foi aplicado dela (seq até a marca em sincronizacao) é
+    pulado e a marca avança. As quantidades dos estoques que mudarem entram na
+    movimentação como ajuste do usuário "sync:<origem>"."""
+    usuario = f"sync:{origem or 'arquivo'}"
+    aplicadas = puladas = 0
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        marca = conn.execute("SELECT seq FROM sincronizacao WHERE origem = ?", (origem,)).fetchone() if origem else None
+        marca = ultimo = marca[0] if marca else 0
+        antes = ultima_alteracao(conn)
+        for registro in registros:
+            seq, tabela, operacao, dados = registro.get("seq"), registro.get("tabela"), registro.get("operacao"), registro.get("dados")
+            if origem and seq is not None and seq <= marca:
+                puladas += 1; continue
+            if operacao not in OPERACOES_ALTERACAO or not isinstance(dados, dict) or "codigo" not in dados:
+                raise ValueError(f"alteração inválida (seq {seq})")
+            if tabela in CATEGORIAS: _aplicar_item(conn, tabela, operacao, dados, usuario)
+            elif tabela == "produtos_quimicos": _aplicar_quimico(conn, operacao, dados)
+            elif tabela == "lotes_quimicos": _aplicar_lote(conn, operacao, dados)
+            else: raise ValueError(f"tabela inválida: {tabela} (seq {seq})")
+            aplicadas += 1
+            if seq is not None: ultimo = max(ultimo, seq)
+        if origem:
+            # o que estas mudanças gravaram aqui fica marcado, para não voltar à origem
+            conn.execute("UPDATE alteracoes SET origem = ? WHERE seq > ?", (origem, antes))
+            conn.execute("""INSERT INTO sincronizacao (origem, seq, momento) VALUES (?, ?, ?)
+                            ON CONFLICT (origem) DO UPDATE SET seq = excluded.seq, momento = excluded.momento""",
+                         (origem, ultimo, _agora()))
+    return {"aplicadas": aplicadas, "puladas": puladas, "ate": ultimo, "registradas": ultima_alteracao(conn) - antes}
+
+@medido
+def sincronizar(conn, outro_caminho, origem=None):
+    """Puxa do outro banco (só leitura) as mudanças feitas lá desde a última vez.
+    Para sincronizar duas estações, cada uma puxa da outra."""
+    origem = origem or nome_unidade(outro_caminho)
+    marca = conn.execute("SELECT seq FROM sincronizacao WHERE origem = ?", (origem,)).fetchone()
+    outro = conectar_somente_leitura(outro_caminho)
+    try:
+        # o fim é lido antes: o que chegar lá durante a leitura fica para a próxima
+        fim = ultima_alteracao(outro)
+        resultado = aplicar_alteracoes(conn, ler_alteracoes(outro, marca[0] if marca else 0, apenas_locais=True, ate=fim), origem)
+    finally:
+        outro.close()
+    # as mudanças de lá que vieram daqui foram puladas, mas a marca passa por elas
+    with conn:
+        conn.execute("UPDATE sincronizacao SET seq = MAX(seq, ?) WHERE origem = ?", (fim, origem))
+    return dict(resultado, origem=origem, ate=max(resultado["ate"], fim))
+
+def listar_sincronizacoes(conn):
+    return conn.execute("SELECT origem, seq, momento FROM sincronizacao ORDER BY origem").fetchall()
+
+@medido
+@com_retentativa
+def podar_alteracoes(conn, ate_seq):
+    # depois que todos os consumidores passaram de `ate_seq`
+    with conn:
+        return conn.execute("DELETE FROM alteracoes WHERE seq <= ?", (ate_seq,)).rowcount
+
+# -----------------------
+# Manutenção (estatísticas, VACUUM incremental, verificação)
+# -----------------------
+# Uma passada de manter_banco: quick_check; ANALYZE com analysis_limit (o planejador
+# ganha estatísticas sem varrer tabelas grandes inteiras); e, se a verificação deu
+# ok, PRAGMA incremental_vacuum devolvendo ao sistema até MANUTENCAO_PAGINAS páginas
+# livres deixadas pelas remoções. Cada passada fica registrada em manutencoes
+# (páginas e páginas livres antes/depois, tempo de cada etapa).
+# O VACUUM incremental só existe com auto_vacuum=INCREMENTAL: bancos novos já nascem
+# assim (conectar_banco). Um banco antigo só é convertido por um VACUUM completo
+# pedido explicitamente (completo=True, manutencao --completo), fora do expediente:
+# ele reescreve o arquivo inteiro e segura a escrita até terminar, o que as outras
+# estações e o coletor não aguentam esperar. Sem isso a passada só verifica e analisa.
+#   ESTOQUE_MANUTENCAO_HORAS=24   intervalo para manter_se_pendente (cron, janela ociosa)
+MANUTENCAO_INTERVALO_HORAS = float(os.environ.get("ESTOQUE_MANUTENCAO_HORAS", 24))
+MANUTENCAO_PAGINAS = 5000       # por passada; o que sobrar fica para a próxima
+MANUTENCAO_LIMITE_ANALYZE = 1000
+
+def _criar_manutencoes(conn):
+    # passo de migração
+    conn.execute("""
+        CREATE TABLE manutencoes (
+            id INTEGER PRIMARY KEY,
+            inicio TEXT NOT NULL,
+            segundos REAL NOT NULL,
+            paginas_antes INTEGER NOT NULL,
+            livres_antes INTEGER NOT NULL,
+            paginas_depois INTEGER NOT NULL,
+            livres_depois INTEGER NOT NULL,
+            tamanho_pagina INTEGER NOT NULL,
+            vacuum TEXT,
+            verificacao TEXT NOT NULL,
+            etapas TEXT,
+            origem TEXT
+        )""")
+
+def _paginas(conn):
+    return tuple(conn.execute(f"PRAGMA {p}").fetchone()[0] for p in ("page_count", "freelist_count", "page_size"))
+
+def _reconstruir_fts_rowid(conn):
+    # o VACUUM completo pode renumerar o rowid de tabelas sem INTEGER PRIMARY KEY
+    # (produtos_quimicos); os índices FTS que apontam para esse rowid são refeitos
+    for (nome,) in conn.execute("""SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%fts5%'
+                                   AND sql LIKE '%content_rowid=''rowid''%'""").fetchall():
+        with conn:
+            conn.execute(f"INSERT INTO {nome}({nome}) VALUES ('rebuild')")
+
+@medido
+def manter_banco(conn, vacuum=True, completo=False, paginas=MANUTENCAO_PAGINAS, origem=None):
+    """Verifica, atualiza as estatísticas e recupera páginas livres (ver acima).
+    `completo` faz um VACUUM completo (e converte um banco antigo para o VACUUM
+    incremental). Devolve o registro gravado em manutencoes."""
+    inicio, momento = time.perf_counter(), _agora()
+    paginas_antes, livres_antes, tamanho = _paginas(conn)
+    etapas = {}
+    def etapa(nome, funcao):
+        t = time.perf_counter()
+        resultado = funcao()
+        etapas[nome] = round(time.perf_counter() - t, 3)
+        return resultado
+    erros = etapa("quick_check", lambda: [r[0] for r in conn.execute("PRAGMA quick_check(20)")])
+    verificacao = "ok" if erros == ["ok"] else "; ".join(erros)
+    def analisar():
+        conn.execute(f"PRAGMA analysis_limit = {MANUTENCAO_LIMITE_ANALYZE}")
+        conn.execute("ANALYZE")
+    etapa("analyze", analisar)
+    modo = None
+    if vacuum and verificacao == "ok":  # num banco com defeito, só o relatório
+        if completo:
+            def vacuum_completo():
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")  # vale a partir deste VACUUM
+                conn.execute("VACUUM")
+                _reconstruir_fts_rowid(conn)
+                conn.executescript("PRAGMA incremental_vacuum")  # as páginas que a reconstrução soltou
+            etapa("vacuum", vacuum_completo); modo = "completo"
+        elif livres_antes and vacuum_incremental(conn):
+            # executescript roda o pragma até o fim (execute liberaria uma página só)
+            etapa("vacuum", lambda: conn.executescript(f"PRAGMA incremental_vacuum({int(paginas)})")); modo = "incremental"
+        if modo and JOURNAL_MODE.upper() == "WAL":
+            # o arquivo só encolhe quando as páginas saem do WAL
+            etapa("checkpoint", lambda: conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone())
+    paginas_depois, livres_depois, _ = _paginas(conn)
+    registro = {"inicio": momento, "segundos": round(time.perf_counter() - inicio, 3), "paginas_antes": paginas_antes,
+                "livres_antes": livres_antes, "paginas_depois": paginas_depois, "livres_depois": livres_depois,
+                "tamanho_pagina": tamanho, "vacuum": modo, "verificacao": verificacao, "etapas": json.dumps(etapas), "origem": origem}
+    with conn:
+        conn.execute(f"INSERT INTO manutencoes ({', '.join(registro)}) VALUES ({', '.join('?' * len(registro))})", tuple(registro.values()))
+    return registro
+
+def vacuum_incremental(conn):
+    # False num banco criado antes do auto_vacuum (ver manter_banco)
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+COLUNAS_MANUTENCAO = ("inicio", "segundos", "paginas_antes", "livres_antes", "paginas_depois", "livres_depois",
+                      "tamanho_pagina", "vacuum", "verificacao", "etapas", "origem")
+
+@medido
+def listar_manutencoes(conn, limite=30):
+    # as mais recentes primeiro, como dicts
+    cur = conn.execute(f"SELECT {', '.join(COLUNAS_MANUTENCAO)} FROM manutencoes ORDER BY id DESC LIMIT ?", (limite,))
+    return [dict(zip(COLUNAS_MANUTENCAO, linha)) for linha in cur]
+
+def manutencao_pendente(conn, intervalo_horas=MANUTENCAO_INTERVALO_HORAS):
+    ultima = conn.execute("SELECT MAX(inicio) FROM manutencoes").fetchone()[0]
+    return ultima is None or ultima <= (datetime.now() - timedelta(hours=intervalo_horas)).isoformat(timespec="seconds")
+
+def manter_se_pendente(conn, intervalo_horas=MANUTENCAO_INTERVALO_HORAS, **kwargs):
+    # para agendamento (cron, janela ociosa): None se a última passada é recente
+    return manter_banco(conn, **kwargs) if manutencao_pendente(conn, intervalo_horas) else None
+
+# -----------------------
+# Migrações (PRAGMA user_version)
+# -----------------------
+def _criar_indices(conn):
+    # índices das consultas quentes: ORDER BY nome / keyset (nome, codigo) em todas
+    # as tabelas e os filtros de validade, lote e local dos químicos
+    for tabela in ("produtos", "produtos_epis", "produtos_rotulos", "produtos_quimicos"):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_nome ON {tabela}(nome, codigo)")
+    for coluna in ("validade", "lote", "local_armazenamento"):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_produtos_quimicos_{coluna} ON produtos_quimicos({coluna})")
+
+def _unificar_itens(conn):
+    # produtos, produtos_epis e produtos_rotulos (idênticas) viram a tabela itens
+    # com uma coluna categoria. Índices parciais por categoria para as listas por
+    # nome; o índice único começa pelo código, então também resolve "em qual
+    # estoque está este código" (localizar). Os nomes antigos ficam como views
+    # atualizáveis, para consultas e planilhas de fora continuarem funcionando.
+    conn.execute("""
+        CREATE TABLE itens (
+            id INTEGER PRIMARY KEY,
+            categoria TEXT NOT NULL,
+            codigo TEXT NOT NULL,
+            nome TEXT NOT NULL,
+            quantidade INTEGER NOT NULL,
+            UNIQUE (codigo, categoria)
+        )""")
+    for tabela, categoria in CATEGORIAS.items():
+        conn.execute(f"INSERT INTO itens (categoria, codigo, nome, quantidade) SELECT ?, codigo, nome, quantidade FROM {tabela} ORDER BY rowid",
+                     (categoria,))
+        conn.execute(f"DROP TABLE IF EXISTS {tabela}_fts")  # os triggers saem junto com a tabela
+        conn.execute(f"DROP TABLE {tabela}")
+        conn.execute(f"CREATE INDEX idx_itens_{categoria}_nome ON itens(nome, codigo) WHERE categoria = '{categoria}'")
+        conn.execute(f"CREATE VIEW {tabela} AS SELECT codigo, nome, quantidade FROM itens WHERE categoria = '{categoria}'")
+        conn.execute(f"""CREATE TRIGGER {tabela}_inserir INSTEAD OF INSERT ON {tabela} BEGIN
+                         INSERT INTO itens (categoria, codigo, nome, quantidade) VALUES ('{categoria}', new.codigo, new.nome, new.quantidade); END""")
+        conn.execute(f"""CREATE TRIGGER {tabela}_alterar INSTEAD OF UPDATE ON {tabela} BEGIN
+                         UPDATE itens SET codigo = new.codigo, nome = new.nome, quantidade = new.quantidade
+                         WHERE categoria = '{categoria}' AND codigo = old.codigo; END""")
+        conn.execute(f"""CREATE TRIGGER {tabela}_remover INSTEAD OF DELETE ON {tabela} BEGIN
+                         DELETE FROM itens WHERE categoria = '{categoria}' AND codigo = old.codigo; END""")
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'produtos_quimicos_fts'").fetchone():
+        _criar_fts(conn, "itens", ("codigo", "nome"), rowid="id")
+
+# cada passo roda uma única vez, em ordem; o número da versão é a posição na lista.
+# Nunca altere um passo já publicado — acrescente um novo no fim.
+MIGRACOES = [
+    _criar_tabelas,
+    corrigir_tabela_quimicos_silencioso,
+    _criar_indices,
+    criar_indice_busca,
+    _preparar_validade,
+    _criar_movimentacoes,
+    _unificar_itens,
+    _criar_lotes,
+    _criar_alteracoes,
+    _criar_estoque_baixo,
+    _criar_manutencoes,
+]
+# a consolidação (conectar_somente_leitura) lê bancos a partir do passo que criou
+# lotes_quimicos; os seguintes só acrescentam tabelas que ela não usa
+VERSAO_MINIMA_LEITURA = MIGRACOES.index(_criar_lotes) + 1
+
+def migrar_banco(conn):
+    versao = conn.execute("PRAGMA user_version").fetchone()[0]
+    for numero in range(versao + 1, len(MIGRACOES) + 1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # outra conexão pode ter aplicado o passo enquanto esta esperava a trava
+            if conn.execute("PRAGMA user_version").fetchone()[0] < numero:
+                MIGRACOES[numero - 1](conn)
+                conn.execute(f"PRAGMA user_version = {numero}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
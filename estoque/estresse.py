@@ -0,0 +1,80 @@
+"""
+Teste de concorrência entre processos (python -m estoque estresse, ou
+estoque_interface.py --estresse).
+"""
+
+import os
+import time
+import random
+import sqlite3
+import tempfile
+import multiprocessing
+
+from .banco import conectar_banco, inserir_produto, listar_produtos_pagina, movimentar_estoque
+
+def _estresse_processo(caminho, numero, operacoes, itens):
+    # um "PC": mistura de baixas, entradas e leituras no mesmo arquivo. Devolve os
+    # erros de lock e quanto cada código mudou pelo que as chamadas confirmaram
+    conn = conectar_banco(caminho)
+    rnd = random.Random(numero)
+    erros, liquido = 0, {}
+    for _ in range(operacoes):
+        codigo = f"E{rnd.randrange(itens):03d}"
+        try:
+            r = rnd.random()
+            if r < 0.9:
+                tipo, qtd = ("baixa" if r < 0.45 else "entrada"), rnd.randint(1, 5)
+                if movimentar_estoque(conn, "produtos", codigo, tipo, qtd, usuario=f"proc{numero}") is not None:
+                    liquido[codigo] = liquido.get(codigo, 0) + (qtd if tipo == "entrada" else -qtd)
+            else:
+                listar_produtos_pagina(conn, "produtos", limite=50)
+        except sqlite3.OperationalError as e:
+            print(f"proc{numero}: {e}")
+            erros += 1
+    conn.close()
+    return erros, liquido
+
+def executar_estresse(caminho, processos=4, operacoes=500, itens=20, inicial=50):
+    """Cria `itens` produtos com saldo `inicial` no banco `caminho`, dispara os
+    processos e devolve o que foi conferido: erros (de lock), negativos, divergentes
+    (saldo diferente da soma das movimentações), perdidas (saldo diferente do
+    inicial mais o que os processos viram confirmado) e duracao."""
+    conn = conectar_banco(caminho)
+    for i in range(itens):
+        inserir_produto(conn, "produtos", f"E{i:03d}", f"Item estresse {i}", inicial)
+    inicio = time.perf_counter()
+    with multiprocessing.Pool(processos) as pool:
+        resultados = pool.starmap(_estresse_processo, [(caminho, n, operacoes, itens) for n in range(processos)])
+    duracao = time.perf_counter() - inicio
+    esperado = {f"E{i:03d}": inicial for i in range(itens)}
+    for _, liquido in resultados:
+        for codigo, delta in liquido.items(): esperado[codigo] += delta
+    saldos = dict(conn.execute("SELECT codigo, quantidade FROM produtos"))
+    negativos = conn.execute("SELECT COUNT(*) FROM produtos WHERE quantidade < 0").fetchone()[0]
+    divergentes = conn.execute("""
+        SELECT COUNT(*) FROM produtos p
+        LEFT JOIN (SELECT codigo, SUM(quantidade) AS s FROM movimentacoes WHERE tabela = 'produtos' GROUP BY codigo) m
+          ON m.codigo = p.codigo
+        WHERE p.quantidade <> COALESCE(m.s, 0)""").fetchone()[0]
+    conn.close()
+    return {"erros": sum(e for e, _ in resultados), "negativos": negativos, "divergentes": divergentes,
+            "perdidas": sum(1 for codigo, saldo in esperado.items() if saldos.get(codigo) != saldo), "duracao": duracao}
+
+def estressar_banco(diretorio=".", processos=4, operacoes=500, itens=20):
+    """Dispara `processos` processos escrevendo no mesmo banco (criado num arquivo
+    temporário em `diretorio`, para testar o mesmo sistema de arquivos do banco real)
+    e confere: nenhum "database is locked", nenhum saldo negativo, cada saldo igual
+    à soma das suas movimentações e nenhuma atualização perdida. Devolve True se tudo bateu."""
+    fd, caminho = tempfile.mkstemp(prefix="estresse_", suffix=".db", dir=diretorio)
+    os.close(fd)
+    try:
+        r = executar_estresse(caminho, processos, operacoes, itens)
+        total = processos * operacoes
+        print(f"{processos} processos, {total} operações em {r['duracao']:.2f}s ({total / r['duracao']:.0f} op/s) — "
+              f"erros de lock: {r['erros']}, saldos negativos: {r['negativos']}, saldos divergentes: {r['divergentes']}, "
+              f"atualizações perdidas: {r['perdidas']}")
+        return r["erros"] == r["negativos"] == r["divergentes"] == r["perdidas"] == 0
+    finally:
+        for sufixo in ("", "-wal", "-shm"):
+            if os.path.exists(caminho + sufixo):
+                os.remove(caminho + sufixo)
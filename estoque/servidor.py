@@ -0,0 +1,270 @@
+"""
+Servidor HTTP/JSON do Sistema de Estoque (python -m estoque servir, ou
+estoque_interface.py --serve).
+"""
+
+import json
+import queue
+import sqlite3
+import traceback
+from itertools import islice
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from .banco import (DB_FILE, COLUNAS_TABELAS, _ALIASES_COLUNAS, _converter_registro, conectar_banco, conectar_leitura,
+                    inserir_produto, buscar_produto, listar_produtos_pagina, atualizar_produto, remover_produto,
+                    inserir_quimico, buscar_quimico, listar_quimicos_pagina, atualizar_quimico, remover_quimico,
+                    buscar_texto, localizar, movimentar_estoque, ler_alteracoes, listar_estoque_baixo)
+
+# Para coletores e o MES, sem Tk. Rotas (tabela = produtos, produtos_epis,
+# produtos_rotulos ou produtos_quimicos):
+#   GET    /<tabela>?filtro=&depois_nome=&depois_codigo=&limite=   lista por (nome, codigo)
+#   GET    /<tabela>?q=texto&limite=                                busca por relevância
+#   GET    /<tabela>/<codigo>
+#   GET    /localizar?q=texto&limite=                               código/nome em todos os estoques
+#   GET    /alteracoes?desde=seq&limite=&compactar=1                mudanças depois de `desde` (ERP)
+#   GET    /estoque_baixo?tabela=                                   itens no ponto de reposição ou abaixo
+#   POST   /<tabela>                      {"codigo", "nome", ...}
+#   PUT    /<tabela>/<codigo>             campos a alterar (nos estoques, também "minimo")
+#   DELETE /<tabela>/<codigo>
+#   POST   /<tabela>/<codigo>/baixa       {"quantidade"}   (também /entrada)
+#   POST   /lote                          {"operacoes": [{"op", "tabela", "codigo", "dados"}, ...]}
+class PoolConexoes:
+    # `tamanho` conexões de leitura e uma única de escrita; cada requisição pega
+    # uma emprestada e devolve. As escritas do servidor fazem fila aqui em vez de
+    # disputar o lock do arquivo. Se a fila demorar mais de `espera` segundos, a
+    # requisição falha.
+    def __init__(self, caminho=DB_FILE, tamanho=4, espera=5.0):
+        self.espera = espera
+        self._escrita = queue.Queue()
+        self._escrita.put(conectar_banco(caminho, check_same_thread=False))
+        self._leitura = queue.Queue()
+        for _ in range(tamanho):
+            self._leitura.put(conectar_leitura(caminho, check_same_thread=False))
+
+    @contextmanager
+    def conexao(self, escrita=False):
+        fila = self._escrita if escrita else self._leitura
+        conn = fila.get(timeout=self.espera)
+        try:
+            yield conn
+        finally:
+            fila.put(conn)
+
+    def fechar(self):
+        for fila in (self._escrita, self._leitura):
+            while not fila.empty():
+                fila.get_nowait().close()
+
+class ErroRequisicao(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+def _inteiro(params, nome, padrao, maximo=None):
+    # parâmetro inteiro >= 0 (limite, desde), cortado em `maximo`; 400 se não for
+    try:
+        valor = int(params.get(nome, padrao))
+    except (TypeError, ValueError):
+        raise ErroRequisicao(400, f"{nome} inválido")
+    if valor < 0:
+        raise ErroRequisicao(400, f"{nome} inválido")
+    return valor if maximo is None else min(valor, maximo)
+
+def _como_dict(tabela, linha):
+    return dict(zip(COLUNAS_TABELAS[tabela], linha)) if linha else None
+
+def executar_operacao(conn, op, tabela, codigo=None, dados=None, params=None):
+    # uma operação da API sobre os helpers do banco; devolve (status, corpo)
+    if not isinstance(tabela, str) or tabela not in COLUNAS_TABELAS:
+        raise ErroRequisicao(404, f"tabela desconhecida: {tabela}")
+    dados = dados or {}
+    params = params or {}
+    if not isinstance(dados, dict):
+        raise ErroRequisicao(400, "os dados devem ser um objeto JSON")
+    quimico = tabela == "produtos_quimicos"
+    if op == "listar":
+        limite = _inteiro(params, "limite", 200, 1000)
+        if params.get("q"):
+            linhas = buscar_texto(conn, tabela, params["q"], limite)
+        else:
+            depois = (params["depois_nome"], params["depois_codigo"]) if "depois_nome" in params and "depois_codigo" in params else None
+            filtro = params.get("filtro") or None
+            linhas = (listar_quimicos_pagina(conn, filtro, depois, None, limite) if quimico
+                      else listar_produtos_pagina(conn, tabela, filtro, depois, None, limite))
+        return 200, [_como_dict(tabela, l) for l in linhas]
+    if op == "buscar":
+        linha = buscar_quimico(conn, codigo) if quimico else buscar_produto(conn, tabela, codigo)
+        if not linha:
+            raise ErroRequisicao(404, "produto não encontrado")
+        return 200, _como_dict(tabela, linha)
+    if op == "inserir":
+        try:
+            valores = _converter_registro(tabela, dados)
+        except ValueError as e:
+            raise ErroRequisicao(400, str(e))
+        ok = inserir_quimico(conn, *valores) if quimico else inserir_produto(conn, tabela, *valores)
+        if not ok:
+            raise ErroRequisicao(409, "código já cadastrado")
+        return 201, _como_dict(tabela, valores)
+    if op == "atualizar":
+        executar_operacao(conn, "buscar", tabela, codigo)
+        try:
+            if quimico:
+                campos = {"nome": "nome", "densidade_kg_l": "densidade", "unidade_origem": "unidade", "litros": "litros",
+                          "kilos": "kilos", "local_armazenamento": "local", "lote": "lote", "validade": "validade"}
+                r = {_ALIASES_COLUNAS.get(k, k): v for k, v in dados.items()}
+                kwargs = {campos[k]: (float(v) if k in ("densidade_kg_l", "litros", "kilos") else v)
+                          for k, v in r.items() if k in campos and v is not None}
+                atualizar_quimico(conn, codigo, **kwargs)
+            else:
+                qtd, minimo = dados.get("quantidade"), dados.get("minimo")
+                if qtd is not None and int(qtd) < 0:
+                    raise ValueError("quantidade negativa")
+                if minimo is not None and int(minimo) < 0:
+                    raise ValueError("mínimo negativo")
+                atualizar_produto(conn, tabela, codigo, nome=dados.get("nome"), quantidade=None if qtd is None else int(qtd),
+                                  usuario=dados.get("usuario"), minimo=None if minimo is None else int(minimo))
+        except (TypeError, ValueError) as e:
+            raise ErroRequisicao(400, str(e))
+        return executar_operacao(conn, "buscar", tabela, codigo)
+    if op == "remover":
+        executar_operacao(conn, "buscar", tabela, codigo)
+        if quimico:
+            remover_quimico(conn, codigo)
+        else:
+            remover_produto(conn, tabela, codigo, usuario=dados.get("usuario"))
+        return 200, {"removido": codigo}
+    if op in ("baixa", "entrada"):
+        if quimico:
+            raise ErroRequisicao(400, "movimentação só existe para estoques com quantidade")
+        try:
+            qtd = int(dados.get("quantidade"))
+            novo = movimentar_estoque(conn, tabela, codigo, op, qtd, usuario=dados.get("usuario"))
+        except (TypeError, ValueError):
+            raise ErroRequisicao(400, "quantidade inválida")
+        if novo is None:
+            executar_operacao(conn, "buscar", tabela, codigo)
+            raise ErroRequisicao(409, "saldo insuficiente")
+        return 200, {"codigo": codigo, "quantidade": novo}
+    raise ErroRequisicao(400, f"operação desconhecida: {op}")
+
+def executar_lote(conn, operacoes):
+    # cada item responde com seu próprio status; um erro não interrompe o lote
+    respostas = []
+    for item in operacoes:
+        if not isinstance(item, dict):
+            respostas.append({"status": 400, "resultado": {"erro": "cada operação deve ser um objeto JSON"}}); continue
+        try:
+            status, corpo = executar_operacao(conn, item.get("op"), item.get("tabela"), item.get("codigo"), item.get("dados"), item)
+        except ErroRequisicao as e:
+            status, corpo = e.status, {"erro": str(e)}
+        respostas.append({"status": status, "resultado": corpo})
+    return 200, respostas
+
+class _ManipuladorHTTP(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive: o coletor reaproveita a conexão TCP
+    disable_nagle_algorithm = True  # cabeçalho e corpo saem em writes separados
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _corpo(self):
+        try:
+            tamanho = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            raise ErroRequisicao(400, "Content-Length inválido")
+        if not tamanho:
+            return {}
+        try:
+            corpo = json.loads(self.rfile.read(tamanho).decode("utf-8"))
+        except (UnicodeDecodeError, ValueError):
+            raise ErroRequisicao(400, "JSON inválido")
+        if not isinstance(corpo, dict):
+            raise ErroRequisicao(400, "o corpo deve ser um objeto JSON")
+        return corpo
+
+    def _rota(self, metodo):
+        try:
+            url = urlsplit(self.path)
+            partes = [unquote(p) for p in url.path.split("/") if p]
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            corpo = self._corpo() if metodo in ("POST", "PUT") else {}
+            escrita = metodo != "GET"
+            if partes == ["lote"]:
+                operacoes = corpo.get("operacoes", [])
+                if not isinstance(operacoes, list):
+                    raise ErroRequisicao(400, "operacoes deve ser uma lista")
+                escrita = any(isinstance(item, dict) and item.get("op") not in ("listar", "buscar") for item in operacoes)
+            with self.server.pool.conexao(escrita) as conn:
+                if metodo == "POST" and partes == ["lote"]:
+                    resposta = executar_lote(conn, operacoes)
+                elif metodo == "GET" and partes == ["localizar"]:
+                    resposta = 200, [dict(zip(("tabela", "codigo", "nome", "quantidade"), linha))
+                                     for linha in localizar(conn, params.get("q", ""), _inteiro(params, "limite", 50, 1000))]
+                elif metodo == "GET" and partes == ["alteracoes"]:
+                    desde = _inteiro(params, "desde", 0)
+                    itens = list(islice(ler_alteracoes(conn, desde, compactar=params.get("compactar") == "1"),
+                                        _inteiro(params, "limite", 1000, 10000)))
+                    # `ate` é o desde da próxima chamada; lista vazia = nada novo
+                    resposta = 200, {"alteracoes": itens, "ate": itens[-1]["seq"] if itens else desde}
+                elif metodo == "GET" and partes == ["estoque_baixo"]:
+                    tabela = params.get("tabela") or None
+                    if tabela and (tabela not in COLUNAS_TABELAS or tabela == "produtos_quimicos"):
+                        raise ErroRequisicao(404, f"tabela desconhecida: {tabela}")
+                    resposta = 200, [dict(zip(("tabela", "codigo", "nome", "quantidade", "minimo", "desde"), linha))
+                                     for linha in listar_estoque_baixo(conn, tabela)]
+                elif len(partes) == 1:
+                    op = {"GET": "listar", "POST": "inserir"}.get(metodo)
+                    if not op: raise ErroRequisicao(405, "método não permitido")
+                    resposta = executar_operacao(conn, op, partes[0], dados=corpo, params=params)
+                elif len(partes) == 2:
+                    op = {"GET": "buscar", "PUT": "atualizar", "DELETE": "remover"}.get(metodo)
+                    if not op: raise ErroRequisicao(405, "método não permitido")
+                    resposta = executar_operacao(conn, op, partes[0], partes[1], corpo)
+                elif len(partes) == 3 and metodo == "POST":
+                    resposta = executar_operacao(conn, partes[2], partes[0], partes[1], corpo)
+                else:
+                    raise ErroRequisicao(404, "rota não encontrada")
+            self._responder(*resposta)
+        except ErroRequisicao as e:
+            self._responder(e.status, {"erro": str(e)})
+        except queue.Empty:
+            self._responder(503, {"erro": "servidor ocupado"})
+        except sqlite3.Error as e:
+            self._responder(500, {"erro": f"banco de dados: {e}"})
+        except Exception as e:
+            # o cliente recebe uma resposta em vez de ver a conexão cair; o detalhe vai para o stderr
+            traceback.print_exc()
+            self._responder(500, {"erro": f"erro interno: {e}"})
+
+    def do_GET(self): self._rota("GET")
+    def do_POST(self): self._rota("POST")
+    def do_PUT(self): self._rota("PUT")
+    def do_DELETE(self): self._rota("DELETE")
+
+    def log_message(self, formato, *args):
+        pass  # centenas de leituras por segundo: sem log por requisição
+
+def criar_servidor(host="127.0.0.1", porta=8080, caminho=DB_FILE, conexoes=4):
+    servidor = ThreadingHTTPServer((host, porta), _ManipuladorHTTP)
+    servidor.daemon_threads = True
+    servidor.pool = PoolConexoes(caminho, conexoes)
+    return servidor
+
+def servir(host="127.0.0.1", porta=8080, caminho=DB_FILE, conexoes=4):
+    servidor = criar_servidor(host, porta, caminho, conexoes)
+    print(f"Servidor de estoque em http://{host}:{porta} (banco: {caminho})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servidor.pool.fechar()
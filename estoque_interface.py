@@ -1,211 +1,331 @@
 """
 Sistema de Estoque — BR Brasil
+
+Janela (Tk). O banco fica no pacote estoque (estoque/banco.py), que também
+atende o servidor HTTP e a linha de comando: python -m estoque --help
 """
 
-import sqlite3
 import tkinter as tk
-from tkinter import ttk, messagebox
-from datetime import datetime, date
+from tkinter import ttk, messagebox, filedialog
+from datetime import datetime
 import os
-
-DB_FILE = "estoque.db"
-VALIDADE_ALERT_DIAS = 10
-
-# -----------------------
-# Banco
-# -----------------------
-def conectar_banco(path=DB_FILE):
-    conn = sqlite3.connect(path)
-    # tabelas de estoques
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS produtos (
-            codigo TEXT PRIMARY KEY,
-            nome TEXT NOT NULL,
-            quantidade INTEGER NOT NULL
-        )""")
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS produtos_epis (
-            codigo TEXT PRIMARY KEY,
-            nome TEXT NOT NULL,
-            quantidade INTEGER NOT NULL
-        )""")
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS produtos_rotulos (
-            codigo TEXT PRIMARY KEY,
-            nome TEXT NOT NULL,
-            quantidade INTEGER NOT NULL
-        )""")
-    # cria a tabela produtos_quimicos com colunas mínimas — as colunas completas
-    # serão garantidas pela função de correção automática (sem popup).
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS produtos_quimicos (
-            codigo TEXT PRIMARY KEY,
-            nome TEXT NOT NULL
-        )""")
-    conn.commit()
-    return conn
-
-# -----------------------
-# Corrigir colunas ausentes 
-# -----------------------
-def corrigir_tabela_quimicos_silencioso(conn):
-    cur = conn.cursor()
-    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='produtos_quimicos';")
-    if not cur.fetchone():
-        return
-    colunas_necessarias = {
-        "densidade_kg_l": "REAL",
-        "unidade_origem": "TEXT",
-        "litros": "REAL",
-        "kilos": "REAL",
-        "local_armazenamento": "TEXT",
-        "lote": "TEXT",
-        "validade": "TEXT"
-    }
-    cur.execute("PRAGMA table_info(produtos_quimicos);")
-    existentes = [r[1] for r in cur.fetchall()]
-    adicionadas = []
-    for nome_col, tipo_col in colunas_necessarias.items():
-        if nome_col not in existentes:
-            cur.execute(f"ALTER TABLE produtos_quimicos ADD COLUMN {nome_col} {tipo_col};")
-            adicionadas.append(nome_col)
-    conn.commit()
-    if adicionadas:
-        # sem messagebox — apenas log no terminal
-        print("Banco atualizado automaticamente. Colunas adicionadas:", ", ".join(adicionadas))
-
-# -----------------------
-# Helpers estoques
-# -----------------------
-def inserir_produto(conn, tabela, codigo, nome, quantidade):
-    try:
-        with conn:
-            conn.execute(f"INSERT INTO {tabela} (codigo, nome, quantidade) VALUES (?, ?, ?)",
-                         (codigo, nome, quantidade))
-        return True
-    except sqlite3.IntegrityError:
-        return False
-
-def listar_produtos(conn, tabela, filtro=None):
-    cur = conn.cursor()
-    if filtro:
-        chave = f"%{filtro}%"
-        cur.execute(f"SELECT codigo, nome, quantidade FROM {tabela} WHERE codigo LIKE ? OR nome LIKE ? ORDER BY nome",
-                    (chave, chave))
-    else:
-        cur.execute(f"SELECT codigo, nome, quantidade FROM {tabela} ORDER BY nome")
-    return cur.fetchall()
-
-def buscar_produto(conn, tabela, codigo):
-    cur = conn.cursor()
-    cur.execute(f"SELECT codigo, nome, quantidade FROM {tabela} WHERE codigo = ?", (codigo,))
-    return cur.fetchone()
-
-def atualizar_produto(conn, tabela, codigo, nome=None, quantidade=None):
-    with conn:
-        if nome is not None and quantidade is not None:
-            conn.execute(f"UPDATE {tabela} SET nome=?, quantidade=? WHERE codigo=?", (nome, quantidade, codigo))
-        elif nome is not None:
-            conn.execute(f"UPDATE {tabela} SET nome=? WHERE codigo=?", (nome, codigo))
-        elif quantidade is not None:
-            conn.execute(f"UPDATE {tabela} SET quantidade=? WHERE codigo=?", (quantidade, codigo))
-
-def remover_produto(conn, tabela, codigo):
-    with conn:
-        conn.execute(f"DELETE FROM {tabela} WHERE codigo=?", (codigo,))
-
-# -----------------------
-# Helpers formulação (químicos)
-# -----------------------
-def converter_para_kg_por_l(dens_val, unidade):
-    # conversões simples; internamente armazenamos kg/L
-    if unidade == "kg/L": return dens_val
-    if unidade == "g/cm³": return dens_val
-    if unidade == "kg/m³": return dens_val * 0.001
-    return dens_val
-
-def inserir_quimico(conn, codigo, nome, densidade_kg_l, unidade_origem, litros, kilos, local, lote, validade):
-    try:
-        with conn:
-            conn.execute("""
-                INSERT INTO produtos_quimicos
-                (codigo, nome, densidade_kg_l, unidade_origem, litros, kilos, local_armazenamento, lote, validade)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (codigo, nome, densidade_kg_l, unidade_origem, litros, kilos, local, lote, validade))
-        return True
-    except sqlite3.IntegrityError:
-        return False
-
-def listar_quimicos(conn, filtro=None):
-    cur = conn.cursor()
-    base = """SELECT codigo, nome, densidade_kg_l, unidade_origem, litros, kilos, local_armazenamento, lote, validade
-              FROM produtos_quimicos"""
-    if filtro:
-        chave = f"%{filtro}%"
-        base += " WHERE codigo LIKE ? OR nome LIKE ? ORDER BY nome"
-        cur.execute(base, (chave, chave))
-    else:
-        base += " ORDER BY nome"
-        cur.execute(base)
-    return cur.fetchall()
-
-def atualizar_quimico(conn, codigo, nome=None, densidade=None, unidade=None, litros=None, kilos=None, local=None, lote=None, validade=None):
-    with conn:
-        if all(v is not None for v in (nome, densidade, unidade, litros, kilos)):
-            conn.execute("""UPDATE produtos_quimicos SET
-                            nome=?, densidade_kg_l=?, unidade_origem=?, litros=?, kilos=?, local_armazenamento=?, lote=?, validade=?
-                            WHERE codigo=?""",
-                         (nome, densidade, unidade, litros, kilos, local, lote, validade, codigo))
-        else:
-            if nome is not None:
-                conn.execute("UPDATE produtos_quimicos SET nome=? WHERE codigo=?", (nome, codigo))
-            if densidade is not None:
-                conn.execute("UPDATE produtos_quimicos SET densidade_kg_l=? WHERE codigo=?", (densidade, codigo))
-            if unidade is not None:
-                conn.execute("UPDATE produtos_quimicos SET unidade_origem=? WHERE codigo=?", (unidade, codigo))
-            if litros is not None:
-                conn.execute("UPDATE produtos_quimicos SET litros=? WHERE codigo=?", (litros, codigo))
-            if kilos is not None:
-                conn.execute("UPDATE produtos_quimicos SET kilos=? WHERE codigo=?", (kilos, codigo))
-            if local is not None:
-                conn.execute("UPDATE produtos_quimicos SET local_armazenamento=? WHERE codigo=?", (local, codigo))
-            if lote is not None:
-                conn.execute("UPDATE produtos_quimicos SET lote=? WHERE codigo=?", (lote, codigo))
-            if validade is not None:
-                conn.execute("UPDATE produtos_quimicos SET validade=? WHERE codigo=?", (validade, codigo))
-
-def remover_quimico(conn, codigo):
-    with conn:
-        conn.execute("DELETE FROM produtos_quimicos WHERE codigo = ?", (codigo,))
+import time
+import queue
+import threading
+import itertools
+import bisect
+import argparse
+
+from estoque.banco import (DB_FILE, VALIDADE_ALERT_DIAS, INSTRUMENTAR, RASTREAR_SQL, PERFIL_DIR, RELATORIOS, metricas,
+                           medir, registrar_desde, medido_interface, nome_funcao, cache_leitura, conectar_banco,
+                           inserir_produto, buscar_produto, listar_produtos_pagina, atualizar_produto, remover_produto,
+                           converter_para_kg_por_l, inserir_quimico, buscar_quimico, listar_quimicos_pagina,
+                           atualizar_quimico, remover_quimico, tag_validade, verificar_validade_quimicos, localizar,
+                           movimentar_estoque, movimentar_lote, listar_movimentacoes, registrar_snapshot_saldos,
+                           importar_arquivo, exportar_arquivo, ler_relatorio, resumo_tabela, exportar_relatorio,
+                           nome_unidade, consolidar_bancos, exportar_consolidado, planejar_producao_arquivo,
+                           listar_lotes, dar_entrada_lote, baixar_quimico, listar_minimos, listar_estoque_baixo,
+                           BACKUP_DIR, fazer_backup, restaurar_backup, listar_backups, manter_banco, manter_se_pendente,
+                           listar_manutencoes)
 
 # -----------------------
-# Validade (verificação)
+# Interface
 # -----------------------
-def verificar_validade_quimicos(conn):
-    hoje = date.today()
-    vencidos = []
-    proximos = []
-    cur = conn.cursor()
-    cur.execute("SELECT codigo, nome, validade FROM produtos_quimicos WHERE validade IS NOT NULL AND validade != ''")
-    for codigo, nome, validade in cur.fetchall():
+class TrabalhadorBanco:
+    # roda as funções de banco numa thread própria, com conexão própria, para o
+    # mainloop do Tk nunca esperar pelo SQLite. Os resultados voltam para a thread
+    # do Tk por polling com root.after, junto com as linhas que cada pedido alterou
+    # (CacheLeitura.alteracoes), repassadas a quem chamou ouvir_alteracoes.
+    def __init__(self, root, caminho=DB_FILE, intervalo_ms=30):
+        self.root = root
+        self.intervalo_ms = intervalo_ms
+        self._pedidos = queue.Queue()
+        self._respostas = queue.Queue()
+        self._ids = itertools.count(1)
+        self._mais_recente = {}  # chave -> id do último pedido com essa chave
+        self._ouvintes = []
+        self._thread = threading.Thread(target=self._executar, args=(caminho,), daemon=True)
+        self._thread.start()
+        root.after(intervalo_ms, self._verificar)
+
+    def enviar(self, funcao, *args, ao_concluir=None, ao_falhar=None, chave=None, **kwargs):
+        # agenda funcao(conn, *args, **kwargs); ao_concluir(resultado) / ao_falhar(erro)
+        # rodam na thread do Tk. Pedidos com a mesma chave se substituem: um pedido
+        # antigo ainda na fila nem executa, e um que já executou é descartado.
+        id_pedido = next(self._ids)
+        if chave is not None:
+            self._mais_recente[chave] = id_pedido
+        self._pedidos.put((id_pedido, chave, funcao, args, kwargs, ao_concluir, ao_falhar, time.perf_counter()))
+        return id_pedido
+
+    def ouvir_alteracoes(self, funcao):
+        # funcao(tabela, codigo, antes, depois) na thread do Tk a cada linha gravada
+        self._ouvintes.append(funcao)
+
+    def parar_de_ouvir(self, funcao):
+        if funcao in self._ouvintes: self._ouvintes.remove(funcao)
+
+    def fechar(self):
+        self._pedidos.put(None)
+
+    def _obsoleto(self, id_pedido, chave):
+        return chave is not None and self._mais_recente.get(chave) != id_pedido
+
+    def _executar(self, caminho):
         try:
-            vdate = datetime.strptime(validade, "%Y-%m-%d").date()
-            dias = (vdate - hoje).days
-            if dias < 0:
-                vencidos.append((nome, validade))
-            elif dias <= VALIDADE_ALERT_DIAS:
-                proximos.append((nome, validade, dias))
-        except:
-            continue
-    return vencidos, proximos
+            conn = conectar_banco(caminho)
+        except Exception as e:
+            self._sem_conexao(e); return
+        cache = cache_leitura(conn)
+        cache.alteracoes = []
+        while True:
+            pedido = self._pedidos.get()
+            if pedido is None: break
+            id_pedido, chave, funcao, args, kwargs, ao_concluir, ao_falhar, enviado = pedido
+            if self._obsoleto(id_pedido, chave): continue
+            registrar_desde("trabalhador", "espera na fila", enviado)
+            try:
+                with medir("trabalhador", nome_funcao(funcao)):
+                    resultado = funcao(conn, *args, **kwargs)
+                resposta = (id_pedido, chave, ao_concluir, resultado, None)
+            except Exception as e:
+                resposta = (id_pedido, chave, ao_falhar, None, e)
+            alteracoes, cache.alteracoes = cache.alteracoes, []
+            self._respostas.put(resposta + (alteracoes,))
+        # ao fechar, como recomenda o SQLite: refaz só as estatísticas que as consultas
+        # desta sessão mostraram estar velhas (a passada completa é manter_banco)
+        conn.execute("PRAGMA optimize")
+        conn.close()
+
+    def _sem_conexao(self, erro):
+        # banco travado, inexistente ou migração com erro: a interface fica sabendo uma
+        # vez (resposta sem callback = messagebox) e cada pedido seguinte falha na hora,
+        # em vez de esperar para sempre numa fila que ninguém atende
+        self._respostas.put((None, None, None, None, erro, []))
+        while True:
+            pedido = self._pedidos.get()
+            if pedido is None: break
+            id_pedido, chave, _, _, _, _, ao_falhar, _ = pedido
+            self._respostas.put((id_pedido, chave, ao_falhar or (lambda e: None), None, erro, []))
+
+    def _verificar(self):
+        self.root.after(self.intervalo_ms, self._verificar)
+        while True:
+            try:
+                id_pedido, chave, callback, resultado, erro, alteracoes = self._respostas.get_nowait()
+            except queue.Empty:
+                return
+            # a escrita aconteceu mesmo que ninguém espere mais pela resposta
+            for alteracao in alteracoes:
+                for ouvinte in list(self._ouvintes): ouvinte(*alteracao)
+            if self._obsoleto(id_pedido, chave):
+                continue
+            if chave is not None and self._mais_recente.get(chave) == id_pedido:
+                del self._mais_recente[chave]
+            if erro is not None:
+                if callback: callback(erro)
+                else: messagebox.showerror("Erro", f"Falha no banco de dados: {erro}")
+            elif callback:
+                with medir("interface", nome_funcao(callback)):
+                    callback(resultado)
+
+# a consolidação abre os bancos das unidades por conta própria; a conexão do
+# trabalhador (o banco local) não é usada
+def _consolidar(conn, caminhos):
+    return consolidar_bancos(caminhos)
+
+def _exportar_consolidado(conn, consolidado, tabela, caminho, progresso=None):
+    return exportar_consolidado(consolidado, tabela, caminho, progresso=progresso)
+
+def _quimico_e_lotes(conn, codigo):
+    # a janela de edição precisa saber se o químico tem mais de um lote
+    return buscar_quimico(conn, codigo), len(listar_lotes(conn, codigo))
+
+class TreeviewPaginada:
+    # Treeview com janela deslizante: as páginas vêm do banco por keyset conforme a
+    # rolagem e o widget guarda no máximo max_paginas * tamanho_pagina linhas.
+    # As páginas são lidas pelo TrabalhadorBanco; uma recarga descarta páginas pendentes.
+    # buscar_pagina(conn, filtro, depois, antes, limite) -> linhas ordenadas por (nome, codigo)
+    # formatar(linha) -> (values, tags); nome identifica a lista nas métricas
+    # O iid de cada item é o código. Com `tabela`, as linhas gravadas por qualquer
+    # pedido do trabalhador nessa tabela são aplicadas direto no widget, uma a uma.
+    def __init__(self, master, trabalhador, colunas, buscar_pagina, formatar, tamanho_pagina=200, max_paginas=3, nome="lista",
+                 tabela=None, **kw):
+        self.frame = tk.Frame(master, bg=master.cget("bg"))
+        self.tree = ttk.Treeview(self.frame, columns=colunas, show="headings", **kw)
+        self.scroll = ttk.Scrollbar(self.frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_rolagem)
+        self.scroll.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.trabalhador = trabalhador
+        self.buscar_pagina = buscar_pagina
+        self.formatar = formatar
+        self.nome = nome
+        self._inicio = None
+        self.tamanho_pagina = tamanho_pagina
+        self.max_linhas = tamanho_pagina * max_paginas
+        self.filtro = None
+        self._linhas = {}  # iid (= codigo) -> linha do banco
+        self._mais_acima = self._mais_abaixo = False
+        self._carregando = False
+        self.tabela = tabela
+        if tabela:
+            trabalhador.ouvir_alteracoes(self._on_alteracao)
+            self.frame.bind("<Destroy>", lambda e: trabalhador.parar_de_ouvir(self._on_alteracao) if e.widget is self.frame else None)
+
+    def pack(self, **kw):
+        self.frame.pack(**kw)
+
+    def recarregar(self, filtro=None):
+        # com o mesmo filtro e a janela no começo da lista, relê as linhas carregadas e
+        # aplica só a diferença (seleção e rolagem ficam); senão volta à primeira página
+        diferenca = bool(self._linhas) and filtro == self.filtro and not self._mais_acima
+        limite = max(self.tamanho_pagina, len(self._linhas)) if diferenca else self.tamanho_pagina
+        self.filtro = filtro
+        self._carregando = True
+        self._inicio = time.perf_counter()
+        self.trabalhador.enviar(self.buscar_pagina, filtro, None, None, limite,
+                                ao_concluir=lambda linhas: self._aplicar_recarga(linhas, limite, diferenca),
+                                ao_falhar=self._falhou, chave=self)
+
+    def _aplicar_recarga(self, linhas, limite, diferenca):
+        self._carregando = False
+        if not self.tree.winfo_exists(): return
+        if diferenca:
+            self._aplicar_diferenca(linhas)
+        else:
+            self.tree.delete(*self.tree.get_children()); self._linhas.clear()
+            self._inserir(linhas, "end")
+            self.tree.yview_moveto(0)
+        self._mais_acima = False
+        self._mais_abaixo = len(linhas) == limite
+        # do pedido até a lista preenchida (fila + consulta + Treeview)
+        registrar_desde("interface", f"atualizar {self.nome}", self._inicio)
+
+    def _aplicar_diferenca(self, linhas):
+        # só remove, insere, move ou altera os itens que mudaram
+        novas = {str(linha[0]) for linha in linhas}
+        saem = [iid for iid in self._linhas if iid not in novas]
+        if saem: self._remover(saem)
+        ficam = [str(linha[0]) for linha in linhas if str(linha[0]) in self._linhas]
+        if list(self.tree.get_children()) != ficam:  # algum nome mudou de posição
+            for i, iid in enumerate(ficam): self.tree.move(iid, "", i)
+        for i, linha in enumerate(linhas):
+            iid = str(linha[0])
+            if iid not in self._linhas:
+                self._inserir([linha], i)
+            elif self._linhas[iid] != linha:
+                self._alterar_item(linha)
+
+    def _on_alteracao(self, tabela, codigo, antes, depois):
+        if tabela != self.tabela or not self.tree.winfo_exists(): return
+        iid = str(codigo)
+        if depois is None:
+            if iid in self._linhas: self._remover([iid])
+            return
+        if iid in self._linhas and self._linhas[iid][1] == depois[1]:
+            self._alterar_item(depois)  # mesmo nome, mesma posição
+            return
+        if self.filtro:
+            # não dá para saber aqui se a linha nova ou renomeada passa no filtro
+            self.recarregar(self.filtro); return
+        if iid in self._linhas: self._remover([iid])
+        filhos = self.tree.get_children()
+        pos = bisect.bisect([self._chave(f) for f in filhos], (depois[1], iid))
+        # fora da janela carregada: aparece quando a página dela for lida
+        if (pos == 0 and self._mais_acima) or (pos == len(filhos) and self._mais_abaixo): return
+        self._inserir([depois], pos)
+
+    def _falhou(self, erro):
+        self._carregando = False
+        messagebox.showerror("Erro", f"Falha ao carregar a lista: {erro}")
+
+    def _inserir(self, linhas, pos):
+        for i, linha in enumerate(linhas):
+            iid = str(linha[0])
+            if iid in self._linhas: continue  # já chegou por _on_alteracao
+            values, tags = self.formatar(linha)
+            self.tree.insert("", "end" if pos == "end" else pos + i, iid=iid, values=values, tags=tags)
+            self._linhas[iid] = linha
+
+    def _alterar_item(self, linha):
+        values, tags = self.formatar(linha)
+        self.tree.item(str(linha[0]), values=values, tags=tags)
+        self._linhas[str(linha[0])] = linha
+
+    def reformatar(self, codigos=None):
+        # reaplica formatar() sem reler o banco (algo fora da linha mudou, ex.: o mínimo)
+        for iid in (self._linhas if codigos is None else [str(c) for c in codigos if str(c) in self._linhas]):
+            self._alterar_item(self._linhas[iid])
+
+    def _remover(self, iids):
+        self.tree.delete(*iids)
+        for iid in iids:
+            self._linhas.pop(iid, None)
+
+    def _chave(self, iid):
+        return (self._linhas[iid][1], iid)
+
+    def _topo_visivel(self):
+        filhos = self.tree.get_children()
+        if not filhos: return None
+        return filhos[min(int(self.tree.yview()[0] * len(filhos)), len(filhos) - 1)]
+
+    def _manter_topo(self, iid):
+        # depois de inserir/remover nas pontas, volta a mostrar a mesma linha no topo
+        filhos = self.tree.get_children()
+        if iid and self.tree.exists(iid):
+            self.tree.yview_moveto(filhos.index(iid) / len(filhos))
+
+    def _on_rolagem(self, primeiro, ultimo):
+        self.scroll.set(primeiro, ultimo)
+        if self._carregando: return
+        if float(ultimo) >= 0.98 and self._mais_abaixo:
+            self._pedir_pagina(abaixo=True)
+        elif float(primeiro) <= 0.02 and self._mais_acima:
+            self._pedir_pagina(abaixo=False)
+
+    def _pedir_pagina(self, abaixo):
+        filhos = self.tree.get_children()
+        if not filhos: return
+        self._carregando = True
+        if abaixo:
+            args = (self.filtro, self._chave(filhos[-1]), None, self.tamanho_pagina)
+        else:
+            args = (self.filtro, None, self._chave(filhos[0]), self.tamanho_pagina)
+        self._inicio = time.perf_counter()
+        self.trabalhador.enviar(self.buscar_pagina, *args, ao_concluir=lambda linhas: self._aplicar_pagina(linhas, abaixo),
+                                ao_falhar=self._falhou, chave=self)
+
+    def _aplicar_pagina(self, linhas, abaixo):
+        self._carregando = False
+        if not self.tree.winfo_exists(): return
+        topo = self._topo_visivel()
+        if abaixo:
+            self._mais_abaixo = len(linhas) == self.tamanho_pagina
+            self._inserir(linhas, "end")
+            filhos = self.tree.get_children()
+            if len(filhos) > self.max_linhas:
+                self._remover(filhos[:len(filhos) - self.max_linhas]); self._mais_acima = True
+        else:
+            self._mais_acima = len(linhas) == self.tamanho_pagina
+            self._inserir(linhas, 0)
+            filhos = self.tree.get_children()
+            if len(filhos) > self.max_linhas:
+                self._remover(filhos[self.max_linhas:]); self._mais_abaixo = True
+        self._manter_topo(topo)
+        registrar_desde("interface", f"página {self.nome}", self._inicio)
 
-# -----------------------
-# Interface
-# -----------------------
 class SistemaEstoque:
-    def __init__(self, root, conn):
+    def __init__(self, root, caminho=DB_FILE):
         self.root = root
-        self.conn = conn
+        # todo acesso ao banco feito pela interface passa pelo trabalhador, que abre
+        # a própria conexão (e cria ou migra o esquema)
+        self.db = TrabalhadorBanco(root, caminho)
+        # exportações longas vão para um segundo trabalhador (criado no primeiro uso),
+        # para não segurar a fila das listas e cadastros
+        self.caminho_db = caminho
+        self.db_exportacao = None
 
         self.COR_BG = "#07153a"
         self.COR_CARD = "#0f2b5f"
@@ -223,6 +343,26 @@ class SistemaEstoque:
         self.style.configure("TNotebook.Tab", background=self.COR_CARD, foreground=self.COR_TEXT, padding=[12,8])
         self.style.map("TNotebook.Tab", background=[("selected", self.COR_PRIMARY)])
 
+        # localizar um código/nome sem saber em qual estoque ele está
+        barra = tk.Frame(root, bg=self.COR_BG); barra.pack(fill="x", padx=12, pady=(12, 0))
+        tk.Label(barra, text="Localizar em todos os estoques:", bg=self.COR_BG, fg=self.COR_ACCENT).pack(side="left")
+        entry_localizar = tk.Entry(barra, width=36); entry_localizar.pack(side="left", padx=6)
+        def localizar_tudo(event=None):
+            termo = entry_localizar.get().strip()
+            if termo:
+                self._abrir_com_dados("localizar", lambda achados: self._janela_localizar(termo, achados), localizar, termo)
+        tk.Button(barra, text="Localizar", bg=self.COR_PRIMARY, fg="white", command=localizar_tudo).pack(side="left", padx=6)
+        entry_localizar.bind("<Return>", localizar_tudo)
+        tk.Button(barra, text="Estoque Baixo", bg="#E65100", fg="white",
+                  command=lambda: self.db.enviar(listar_estoque_baixo, ao_concluir=self._mostrar_alerta_estoque_baixo)).pack(side="right", padx=6)
+        self.ir_para = {}  # tabela -> função(codigo) que mostra o item na aba
+        self.atualizar_abas = {}  # tabela -> função que recarrega a lista da aba
+        # ponto de reposição: tabela -> {codigo: minimo}, relido a cada atualização da
+        # aba; serve para marcar as linhas e avisar quando uma escrita cruza o mínimo
+        self.minimos = {}
+        self.listas_estoque = {}
+        self._criticos_novos = []
+
         self.notebook = ttk.Notebook(root)
         self.notebook.pack(fill="both", expand=True, padx=12, pady=12)
 
@@ -235,25 +375,57 @@ class SistemaEstoque:
             ("Relatórios", None)
         ]
         self.frames = {}
+        self._aba_do_frame = {}  # caminho do frame (notebook.select()) -> chave da aba
         for titulo, tabela in self.abas:
             f = tk.Frame(self.notebook, bg=self.COR_BG)
             self.notebook.add(f, text=titulo)
-            if tabela:
-                self.frames[tabela] = f
-            else:
-                self.frames["relatorios"] = f
+            self.frames[tabela or "relatorios"] = f
+            self._aba_do_frame[str(f)] = tabela or "relatorios"
 
-        # montar abas
-        for titulo, tabela in self.abas:
-            if tabela is None:
-                self._montar_aba_relatorios(self.frames["relatorios"])
-            elif tabela == "produtos_quimicos":
-                self._montar_aba_formulacao(self.frames[tabela])
-            else:
-                self._montar_aba_estoque_com_cadastro(self.frames[tabela], tabela, titulo)
-
-        # bind troca de aba para alerta de validade (apenas Formulação)
+        # cada aba só ganha widgets e dados na primeira vez que é mostrada
+        # (_garantir_aba): a janela abre sem esperar pelas outras abas, e o custo da
+        # partida não depende do tamanho do banco
+        self._abas_montadas = set()
         self.notebook.bind("<<NotebookTabChanged>>", self._on_tab_changed)
+        self.db.ouvir_alteracoes(self._on_item_alterado)
+        root.after_idle(self._depois_de_abrir)
+
+        self._manutencao_rodando = False
+        self._mostrar_ultima_manutencao = None  # definido quando a aba Relatórios é montada
+        self._registrar_atividade()
+        root.bind_all("<Any-KeyPress>", self._registrar_atividade, add="+")
+        root.bind_all("<Any-ButtonPress>", self._registrar_atividade, add="+")
+        root.after(self.VERIFICAR_OCIOSO_MS, self._verificar_ociosidade)
+
+    def _depois_de_abrir(self):
+        # roda com a janela já de pé: primeiro a aba visível, depois o resto na fila
+        self._garantir_aba(self._aba_do_frame[self.notebook.select()])
+        # foto diária dos saldos (consulta de estoque em data passada)
+        self.db.enviar(registrar_snapshot_saldos, ao_concluir=lambda _: None)
+        # itens já abaixo do mínimo ao abrir; depois, só os que cruzarem o mínimo
+        self.db.enviar(listar_estoque_baixo, ao_concluir=lambda itens: itens and self._mostrar_alerta_estoque_baixo(itens))
+
+    def _garantir_aba(self, chave):
+        # monta a aba na primeira chamada; devolve True se montou agora
+        if chave in self._abas_montadas: return False
+        self._abas_montadas.add(chave)
+        inicio = time.perf_counter()
+        frame = self.frames[chave]
+        if chave == "relatorios":
+            self._montar_aba_relatorios(frame)
+        elif chave == "produtos_quimicos":
+            self._montar_aba_formulacao(frame)
+        else:
+            titulo = next(t for t, tabela in self.abas if tabela == chave)
+            self._montar_aba_estoque_com_cadastro(frame, chave, titulo)
+        registrar_desde("interface", f"montar aba {chave}", inicio)
+        return True
+
+    def _mostrar_item(self, tabela, codigo):
+        # seleciona a aba do estoque (montando-a se preciso) e filtra pelo código
+        self.notebook.select(self.frames[tabela])
+        self._garantir_aba(tabela)
+        self.ir_para[tabela](codigo)
 
     # ---- Aba estoque com cadastro (reaproveitável) ----
     def _montar_aba_estoque_com_cadastro(self, frame, tabela, titulo):
@@ -281,13 +453,13 @@ class SistemaEstoque:
             except ValueError:
                 messagebox.showerror("Erro", "Quantidade inválida.")
                 return
-            ok = inserir_produto(self.conn, tabela, cod, nome, qi)
-            if not ok:
-                messagebox.showerror("Erro", "Código já cadastrado.")
-                return
-            # limpa campos e atualiza tabela
-            entry_cod.delete(0, tk.END); entry_nome.delete(0, tk.END); entry_qtd.delete(0, tk.END)
-            atualizar()
+            def concluido(ok):
+                if not ok:
+                    messagebox.showerror("Erro", "Código já cadastrado.")
+                    return
+                # limpa campos; a linha nova entra na lista pelo aviso do trabalhador
+                entry_cod.delete(0, tk.END); entry_nome.delete(0, tk.END); entry_qtd.delete(0, tk.END)
+            self.db.enviar(inserir_produto, tabela, cod, nome, qi, ao_concluir=concluido)
 
         def limpar():
             entry_cod.delete(0, tk.END); entry_nome.delete(0, tk.END); entry_qtd.delete(0, tk.END)
@@ -308,25 +480,43 @@ class SistemaEstoque:
         tk.Button(barra, text="Pesquisar", bg=self.COR_PRIMARY, fg="white", command=pesquisar).pack(side="left", padx=6)
         tk.Button(barra, text="Mostrar Todos", bg="#607D8B", fg="white", command=lambda: atualizar()).pack(side="left", padx=6)
         entry_busca.bind("<Return>", pesquisar)
-
-        # Treeview
-        tree = ttk.Treeview(frame, columns=("codigo","nome","quantidade"), show="headings", height=16)
+        self._busca_incremental(entry_busca, pesquisar)
+        self.ir_para[tabela] = lambda codigo: self._filtrar_por(entry_busca, codigo, pesquisar)
+
+        # Treeview (paginada: só a janela visível fica no widget)
+        minimos = self.minimos.setdefault(tabela, {})
+        def formatar(linha):
+            minimo = minimos.get(linha[0])
+            return linha + (minimo or "",), ("baixo",) if minimo and linha[2] <= minimo else ()
+        lista = TreeviewPaginada(frame, self.db, ("codigo","nome","quantidade","minimo"),
+                                 lambda conn, *a: listar_produtos_pagina(conn, tabela, *a),
+                                 formatar, nome=tabela, tabela=tabela, height=16)
+        tree = lista.tree
         tree.heading("codigo", text="Código"); tree.heading("nome", text="Nome"); tree.heading("quantidade", text="Quantidade")
-        tree.column("codigo", width=160); tree.column("nome", width=620); tree.column("quantidade", width=120, anchor="center")
-        tree.pack(fill="both", expand=True, padx=12, pady=8)
-
-        # ações: editar, baixar, remover, atualizar
+        tree.heading("minimo", text="Mínimo")
+        tree.column("codigo", width=160); tree.column("nome", width=540); tree.column("quantidade", width=110, anchor="center")
+        tree.column("minimo", width=90, anchor="center")
+        tree.tag_configure("baixo", background="#FFE0B2")
+        lista.pack(fill="both", expand=True, padx=12, pady=8)
+        self.listas_estoque[tabela] = lista
+
+        # ações: editar, baixar, remover, atualizar. As escritas não recarregam a lista:
+        # a TreeviewPaginada recebe do trabalhador só a linha alterada.
         def atualizar(filtro=None):
-            tree.delete(*tree.get_children())
-            for cod, nome, qtd in listar_produtos(self.conn, tabela, filtro):
-                tree.insert("", "end", values=(cod, nome, qtd))
+            def carregar_minimos(novos):
+                minimos.clear(); minimos.update(novos)
+                lista.reformatar()
+            # o trabalhador responde em ordem: os mínimos chegam antes da página
+            self.db.enviar(listar_minimos, tabela, ao_concluir=carregar_minimos, chave=("minimos", tabela))
+            lista.recarregar(filtro)
+        self.atualizar_abas[tabela] = atualizar
 
         def editar():
             sel = tree.selection()
             if not sel:
                 messagebox.showwarning("Atenção", "Selecione um produto."); return
             codigo = tree.item(sel[0], "values")[0]
-            self._abrir_janela_edicao_estoque(codigo, tabela, atualizar)
+            self._abrir_janela_edicao_estoque(codigo, tabela)
 
         def remover():
             sel = tree.selection()
@@ -334,69 +524,258 @@ class SistemaEstoque:
                 messagebox.showwarning("Atenção", "Selecione um produto."); return
             codigo, nome = tree.item(sel[0], "values")[:2]
             if messagebox.askyesno("Confirmar", f"Remover '{nome}' (código {codigo})?"):
-                remover_produto(self.conn, tabela, codigo); atualizar()
+                self.db.enviar(remover_produto, tabela, codigo)
 
-        def baixar():
+        def baixar(tipo="baixa"):
             sel = tree.selection()
             if not sel:
                 messagebox.showwarning("Atenção", "Selecione um produto."); return
             codigo = tree.item(sel[0], "values")[0]
-            self._abrir_janela_baixa_estoque(codigo, tabela, atualizar)
+            self._abrir_janela_baixa_estoque(codigo, tabela, tipo=tipo)
+
+        def historico():
+            sel = tree.selection()
+            if not sel:
+                messagebox.showwarning("Atenção", "Selecione um produto."); return
+            codigo = tree.item(sel[0], "values")[0]
+            self._abrir_com_dados("histórico", lambda movs: self._janela_historico(codigo, movs), listar_movimentacoes, tabela, codigo)
 
         bar = tk.Frame(frame, bg=self.COR_BG); bar.pack(fill="x", padx=12, pady=6)
         tk.Button(bar, text="Editar", bg="#4CAF50", fg="white", command=editar).pack(side="left", padx=6)
         tk.Button(bar, text="Baixar Estoque", bg=self.COR_ACCENT, fg="black", command=baixar).pack(side="left", padx=6)
+        tk.Button(bar, text="Entrada", bg=self.COR_PRIMARY, fg="white", command=lambda: baixar("entrada")).pack(side="left", padx=6)
+        tk.Button(bar, text="Histórico", bg="#607D8B", fg="white", command=historico).pack(side="left", padx=6)
+        tk.Button(bar, text="Leitura em Lote", bg=self.COR_PRIMARY, fg="white", command=lambda: self._janela_lote(tabela, titulo)).pack(side="left", padx=6)
         tk.Button(bar, text="Remover", bg="#D32F2F", fg="white", command=remover).pack(side="left", padx=6)
         tk.Button(bar, text="Atualizar", bg="#607D8B", fg="white", command=lambda: atualizar()).pack(side="right", padx=6)
 
         atualizar()
 
+    def _busca_incremental(self, entry, pesquisar, atraso_ms=250):
+        # pesquisa enquanto digita, mas só depois de uma pausa na digitação
+        estado = {"after": None, "texto": entry.get().strip()}
+        def agendar(event=None):
+            if estado["after"]:
+                entry.after_cancel(estado["after"])
+            estado["after"] = entry.after(atraso_ms, disparar)
+        def disparar():
+            estado["after"] = None
+            texto = entry.get().strip()
+            if texto != estado["texto"]:
+                estado["texto"] = texto; pesquisar()
+        entry.bind("<KeyRelease>", agendar, add="+")
+
+    def _filtrar_por(self, entry, texto, pesquisar):
+        entry.delete(0, "end"); entry.insert(0, texto); pesquisar()
+
+    @medido_interface
+    def _janela_localizar(self, termo, achados):
+        nomes = {tabela: titulo for titulo, tabela in self.abas if tabela}
+        j = tk.Toplevel(self.root); j.title(f"Localizar — {termo}"); j.geometry("760x360"); j.configure(bg=self.COR_BG)
+        if not achados:
+            tk.Label(j, text=f"Nada encontrado para \"{termo}\".", bg=self.COR_BG, fg=self.COR_TEXT).pack(padx=12, pady=20)
+            tk.Button(j, text="Fechar", bg="#999", fg="white", command=j.destroy).pack(pady=8); return
+        cols = ("estoque", "codigo", "nome", "quantidade")
+        tree = ttk.Treeview(j, columns=cols, show="headings")
+        for col, txt, larg in zip(cols, ("Estoque", "Código", "Nome", "Quantidade"), (140, 130, 340, 110)):
+            tree.heading(col, text=txt); tree.column(col, width=larg, anchor="center" if col == "quantidade" else "w")
+        for i, (tabela, codigo, nome, qtd) in enumerate(achados):
+            qtd = f"{qtd or 0:,.3f} kg" if tabela == "produtos_quimicos" else qtd
+            tree.insert("", "end", iid=str(i), values=(nomes[tabela], codigo, nome, qtd))
+        tree.pack(fill="both", expand=True, padx=12, pady=8)
+        def abrir(event=None):
+            sel = tree.selection()
+            if not sel: return
+            tabela, codigo = achados[int(sel[0])][:2]
+            self._mostrar_item(tabela, codigo)
+        tree.bind("<Double-1>", abrir); tree.bind("<Return>", abrir)
+        tk.Label(j, text="Duplo clique abre o item na aba do estoque.", bg=self.COR_BG, fg=self.COR_ACCENT).pack(anchor="w", padx=12)
+        tk.Button(j, text="Fechar", bg="#999", fg="white", command=j.destroy).pack(pady=8)
+
     # ---- Janela editar / baixa para estoques ----
-    def _abrir_janela_edicao_estoque(self, codigo, tabela, callback):
-        prod = buscar_produto(self.conn, tabela, codigo)
+    def _abrir_com_dados(self, nome, montar, funcao, *args):
+        # busca os dados no trabalhador e monta a janela; mede do clique até a janela pronta
+        inicio = time.perf_counter()
+        def concluido(dados):
+            montar(dados)
+            registrar_desde("interface", f"abrir {nome}", inicio)
+        self.db.enviar(funcao, *args, ao_concluir=concluido)
+
+    def _abrir_janela_edicao_estoque(self, codigo, tabela, callback=None):
+        self._abrir_com_dados("edição", lambda prod: self._janela_edicao_estoque(prod, tabela, callback), buscar_produto, tabela, codigo)
+
+    @medido_interface
+    def _janela_edicao_estoque(self, prod, tabela, callback=None):
         if not prod:
             messagebox.showerror("Erro", "Produto não encontrado."); return
         cod, nome, qtd = prod
-        j = tk.Toplevel(self.root); j.title(f"Editar — {cod}"); j.geometry("420x240"); j.configure(bg=self.COR_BG)
+        minimo = self.minimos.get(tabela, {}).get(cod, 0)
+        j = tk.Toplevel(self.root); j.title(f"Editar — {cod}"); j.geometry("420x300"); j.configure(bg=self.COR_BG)
         tk.Label(j, text="Código:", bg=self.COR_BG, fg=self.COR_ACCENT).pack(anchor="w", padx=12, pady=(12,4))
         tk.Label(j, text=cod, bg=self.COR_BG, fg=self.COR_TEXT).pack(anchor="w", padx=12)
         tk.Label(j, text="Nome:", bg=self.COR_BG, fg=self.COR_TEXT).pack(anchor="w", padx=12, pady=(8,4))
         entry_nome = tk.Entry(j, width=48); entry_nome.insert(0, nome); entry_nome.pack(padx=12)
         tk.Label(j, text="Quantidade:", bg=self.COR_BG, fg=self.COR_TEXT).pack(anchor="w", padx=12, pady=(8,4))
         entry_qtd = tk.Entry(j, width=12); entry_qtd.insert(0, str(qtd)); entry_qtd.pack(padx=12)
+        tk.Label(j, text="Estoque mínimo (0 = sem alerta):", bg=self.COR_BG, fg=self.COR_TEXT).pack(anchor="w", padx=12, pady=(8,4))
+        entry_min = tk.Entry(j, width=12); entry_min.insert(0, str(minimo)); entry_min.pack(padx=12)
         def salvar(event=None):
             novo_nome = entry_nome.get().strip(); qtd_str = entry_qtd.get().strip()
             if not novo_nome or not qtd_str:
                 messagebox.showwarning("Atenção", "Preencha todos os campos."); return
             try:
-                nova_qtd = int(qtd_str)
-                if nova_qtd < 0: raise ValueError
+                nova_qtd = int(qtd_str); novo_min = int(entry_min.get().strip() or 0)
+                if nova_qtd < 0 or novo_min < 0: raise ValueError
             except ValueError:
                 messagebox.showerror("Erro", "Quantidade inválida."); return
-            atualizar_produto(self.conn, tabela, cod, nome=novo_nome, quantidade=nova_qtd)
-            messagebox.showinfo("Sucesso", "Produto atualizado."); j.destroy(); callback()
+            def concluido(_):
+                minimos = self.minimos.setdefault(tabela, {})
+                if novo_min: minimos[cod] = novo_min
+                else: minimos.pop(cod, None)
+                if tabela in self.listas_estoque: self.listas_estoque[tabela].reformatar([cod])
+                messagebox.showinfo("Sucesso", "Produto atualizado."); j.destroy()
+                if callback: callback()
+            self.db.enviar(atualizar_produto, tabela, cod, nome=novo_nome, quantidade=nova_qtd, minimo=novo_min, ao_concluir=concluido)
         tk.Button(j, text="Salvar", bg="#4CAF50", fg="white", command=salvar).pack(pady=10)
-        entry_qtd.bind("<Return>", salvar)
+        entry_qtd.bind("<Return>", salvar); entry_min.bind("<Return>", salvar)
 
-    def _abrir_janela_baixa_estoque(self, codigo, tabela, callback):
-        prod = buscar_produto(self.conn, tabela, codigo)
+    def _abrir_janela_baixa_estoque(self, codigo, tabela, callback=None, tipo="baixa"):
+        self._abrir_com_dados(tipo, lambda prod: self._janela_baixa_estoque(prod, tabela, callback, tipo), buscar_produto, tabela, codigo)
+
+    @medido_interface
+    def _janela_baixa_estoque(self, prod, tabela, callback=None, tipo="baixa"):
         if not prod:
             messagebox.showerror("Erro", "Produto não encontrado."); return
         cod, nome, qtd_atual = prod
-        j = tk.Toplevel(self.root); j.title(f"Dar Baixa — {cod}"); j.geometry("360x200"); j.configure(bg=self.COR_BG)
+        titulo = "Dar Baixa" if tipo == "baixa" else "Entrada"
+        j = tk.Toplevel(self.root); j.title(f"{titulo} — {cod}"); j.geometry("360x200"); j.configure(bg=self.COR_BG)
         tk.Label(j, text=f"{nome} (Atual: {qtd_atual})", bg=self.COR_BG, fg=self.COR_ACCENT).pack(pady=10)
         entry_baixa = tk.Entry(j, width=12); entry_baixa.pack(pady=6)
         def confirmar(event=None):
             try:
-                baixa = int(entry_baixa.get())
-                if baixa <= 0 or baixa > qtd_atual: raise ValueError
+                qtd = int(entry_baixa.get())
+                if qtd <= 0: raise ValueError
             except ValueError:
                 messagebox.showerror("Erro", "Quantidade inválida."); return
-            atualizar_produto(self.conn, tabela, cod, quantidade=qtd_atual - baixa)
-            messagebox.showinfo("Sucesso", f"Baixa aplicada. Novo estoque: {qtd_atual - baixa}"); j.destroy(); callback()
+            def concluido(novo):
+                # o saldo é conferido no UPDATE: outro operador pode ter baixado antes
+                if novo is None:
+                    messagebox.showerror("Erro", "Saldo insuficiente (ou produto removido)."); return
+                msg = "Baixa aplicada" if tipo == "baixa" else "Entrada registrada"
+                messagebox.showinfo("Sucesso", f"{msg}. Novo estoque: {novo}"); j.destroy()
+                if callback: callback()
+            self.db.enviar(movimentar_estoque, tabela, cod, tipo, qtd, ao_concluir=concluido)
         tk.Button(j, text="Confirmar", bg=self.COR_ACCENT, fg="black", command=confirmar).pack(pady=8)
         entry_baixa.bind("<Return>", confirmar)
 
+    @medido_interface
+    def _janela_historico(self, codigo, movimentos):
+        j = tk.Toplevel(self.root); j.title(f"Histórico — {codigo}"); j.geometry("720x420"); j.configure(bg=self.COR_BG)
+        cols = ("momento", "tipo", "quantidade", "saldo", "usuario")
+        tree = ttk.Treeview(j, columns=cols, show="headings")
+        for col, txt in zip(cols, ("Data/Hora", "Tipo", "Quantidade", "Saldo", "Usuário")):
+            tree.heading(col, text=txt); tree.column(col, width=130, anchor="center")
+        for mov in movimentos:
+            tree.insert("", "end", values=mov)
+        tree.pack(fill="both", expand=True, padx=12, pady=8)
+        tk.Button(j, text="Fechar", bg="#999", fg="white", command=j.destroy).pack(pady=8)
+
+    # ---- Leitura em lote (leitor de código de barras) ----
+    @medido_interface
+    def _janela_lote(self, tabela, titulo):
+        # cada leitura entra numa fila em memória (códigos repetidos somam); nada vai
+        # ao banco até Confirmar, que grava o lote inteiro numa transação. As linhas
+        # com erro ficam na fila, marcadas, para corrigir e confirmar de novo.
+        j = tk.Toplevel(self.root); j.title(f"Leitura em lote — {titulo}"); j.geometry("760x520"); j.configure(bg=self.COR_BG)
+        fila = {}   # codigo -> quantidade
+        topo = tk.Frame(j, bg=self.COR_BG); topo.pack(fill="x", padx=12, pady=(12, 4))
+        tipo = tk.StringVar(value="baixa")
+        for valor, texto in (("baixa", "Baixa"), ("entrada", "Entrada")):
+            tk.Radiobutton(topo, text=texto, variable=tipo, value=valor, bg=self.COR_BG, fg=self.COR_TEXT, selectcolor=self.COR_PRIMARY,
+                           activebackground=self.COR_BG).pack(side="left", padx=4)
+        tk.Label(topo, text="Qtd:", bg=self.COR_BG, fg=self.COR_TEXT).pack(side="left", padx=(16, 4))
+        entry_qtd = tk.Entry(topo, width=6); entry_qtd.insert(0, "1"); entry_qtd.pack(side="left")
+        tk.Label(topo, text="Código:", bg=self.COR_BG, fg=self.COR_TEXT).pack(side="left", padx=(16, 4))
+        entry_cod = tk.Entry(topo, width=28); entry_cod.pack(side="left")
+        tk.Label(j, text="Leia os códigos (Enter a cada leitura; \"5*CÓDIGO\" lê 5 unidades). F12 confirma o lote.",
+                 bg=self.COR_BG, fg=self.COR_ACCENT).pack(anchor="w", padx=12)
+
+        cols = ("codigo", "nome", "quantidade", "saldo", "situacao")
+        tree = ttk.Treeview(j, columns=cols, show="headings", height=14)
+        for col, txt, larg in zip(cols, ("Código", "Nome", "Qtd", "Saldo", "Situação"), (130, 280, 60, 70, 180)):
+            tree.heading(col, text=txt); tree.column(col, width=larg, anchor="w" if col in ("nome", "situacao") else "center")
+        tree.tag_configure("erro", background="#b71c1c", foreground="white")
+        tree.pack(fill="both", expand=True, padx=12, pady=8)
+        lbl_status = tk.Label(j, text="", bg=self.COR_BG, fg=self.COR_TEXT, anchor="w"); lbl_status.pack(fill="x", padx=12)
+
+        def resumo():
+            lbl_status.config(text=f"{len(fila)} itens, {sum(fila.values())} unidades na fila")
+
+        def mostrar_produto(codigo, prod):
+            # nome e saldo só informativos: a conferência vale é a do Confirmar
+            if not tree.exists(codigo): return
+            if prod is None:
+                tree.set(codigo, "situacao", "código não cadastrado"); tree.item(codigo, tags=("erro",)); j.bell()
+            else:
+                tree.set(codigo, "nome", prod[1]); tree.set(codigo, "saldo", prod[2])
+
+        def ler(event=None):
+            texto = entry_cod.get().strip(); entry_cod.delete(0, "end")
+            if not texto: return
+            qtd_txt = entry_qtd.get().strip()
+            if "*" in texto:
+                qtd_txt, texto = (t.strip() for t in texto.split("*", 1))
+            try:
+                qtd = int(qtd_txt)
+                if qtd <= 0: raise ValueError
+            except ValueError:
+                lbl_status.config(text=f"Quantidade inválida: {qtd_txt}"); j.bell(); return
+            fila[texto] = fila.get(texto, 0) + qtd
+            if tree.exists(texto):
+                tree.set(texto, "quantidade", fila[texto]); tree.set(texto, "situacao", ""); tree.item(texto, tags=())
+            else:
+                tree.insert("", "end", iid=texto, values=(texto, "…", fila[texto], "", ""))
+                self.db.enviar(buscar_produto, tabela, texto, ao_concluir=lambda prod, c=texto: mostrar_produto(c, prod))
+            tree.see(texto); resumo()
+
+        def remover_linha():
+            for iid in tree.selection():
+                fila.pop(iid, None); tree.delete(iid)
+            resumo()
+
+        def limpar():
+            fila.clear(); tree.delete(*tree.get_children()); resumo()
+
+        def confirmar(event=None):
+            if not fila: return
+            def concluido(r):
+                for codigo, _, novo in r["aplicados"]:
+                    fila.pop(codigo, None)
+                    if tree.exists(codigo): tree.delete(codigo)
+                for codigo, msg in r["erros"]:
+                    if tree.exists(codigo):
+                        tree.set(codigo, "situacao", msg); tree.item(codigo, tags=("erro",))
+                texto = f"{len(r['aplicados'])} itens gravados"
+                if r["erros"]:
+                    texto += f", {len(r['erros'])} com erro (continuam na fila)"; j.bell()
+                lbl_status.config(text=texto); btn_confirmar.config(state="normal")
+            def falhou(erro):
+                btn_confirmar.config(state="normal")
+                messagebox.showerror("Erro", f"Falha ao gravar o lote: {erro}", parent=j)
+            btn_confirmar.config(state="disabled"); lbl_status.config(text="Gravando…")
+            self.db.enviar(movimentar_lote, tabela, tipo.get(), dict(fila), ao_concluir=concluido, ao_falhar=falhou)
+
+        bar = tk.Frame(j, bg=self.COR_BG); bar.pack(fill="x", padx=12, pady=8)
+        btn_confirmar = tk.Button(bar, text="Confirmar Lote (F12)", bg=self.COR_ACCENT, fg="black", command=confirmar)
+        btn_confirmar.pack(side="left", padx=6)
+        tk.Button(bar, text="Remover Linha", bg="#D32F2F", fg="white", command=remover_linha).pack(side="left", padx=6)
+        tk.Button(bar, text="Limpar", bg="#607D8B", fg="white", command=limpar).pack(side="left", padx=6)
+        tk.Button(bar, text="Fechar", bg="#999", fg="white", command=j.destroy).pack(side="right", padx=6)
+        entry_cod.bind("<Return>", ler)
+        tree.bind("<Delete>", lambda e: remover_linha())
+        j.bind("<F12>", confirmar)
+        entry_cod.focus_set(); resumo()
+
     # ---- Aba Formulação ----
     def _montar_aba_formulacao(self, frame):
         tk.Label(frame, text="Formulação", bg=self.COR_BG, fg=self.COR_ACCENT, font=("Arial", 12, "bold")).pack(anchor="w", padx=10, pady=6)
@@ -458,15 +837,15 @@ class SistemaEstoque:
             dk = converter_para_kg_por_l(dv, u); kilos = dk * lv
             if not codigo or not nome:
                 messagebox.showwarning("Atenção", "Preencha todos os campos obrigatórios."); return
-            ok = inserir_quimico(self.conn, codigo, nome, dk, u, lv, kilos, local, lote, validade)
-            if not ok:
-                messagebox.showerror("Erro", "Código já cadastrado."); return
-            messagebox.showinfo("Sucesso", f"Formulação '{nome}' cadastrada.")
-            # limpar
-            entry_cod.delete(0, tk.END); entry_nome.delete(0, tk.END); entry_dens.delete(0, tk.END)
-            entry_litros.delete(0, tk.END); entry_local.delete(0, tk.END); entry_lote.delete(0, tk.END); entry_validade.delete(0, tk.END)
-            lbl_kilos.config(text="Peso (Kg): —")
-            atualizar()
+            def concluido(ok):
+                if not ok:
+                    messagebox.showerror("Erro", "Código já cadastrado."); return
+                messagebox.showinfo("Sucesso", f"Formulação '{nome}' cadastrada.")
+                # limpar
+                entry_cod.delete(0, tk.END); entry_nome.delete(0, tk.END); entry_dens.delete(0, tk.END)
+                entry_litros.delete(0, tk.END); entry_local.delete(0, tk.END); entry_lote.delete(0, tk.END); entry_validade.delete(0, tk.END)
+                lbl_kilos.config(text="Peso (Kg): —")
+            self.db.enviar(inserir_quimico, codigo, nome, dk, u, lv, kilos, local, lote, validade, ao_concluir=concluido)
 
         tk.Button(card, text="Salvar", bg=self.COR_ACCENT, fg="black", command=salvar_formulacao).grid(row=5, column=0, pady=8)
         for e in (entry_cod, entry_nome, entry_dens, entry_litros, entry_local, entry_lote, entry_validade):
@@ -481,31 +860,27 @@ class SistemaEstoque:
         tk.Button(barra, text="Pesquisar", bg=self.COR_PRIMARY, fg="white", command=pesquisar).pack(side="left", padx=6)
         tk.Button(barra, text="Mostrar Todos", bg="#607D8B", fg="white", command=lambda: atualizar()).pack(side="left", padx=6)
         entry_busca.bind("<Return>", pesquisar)
+        self._busca_incremental(entry_busca, pesquisar)
+        self.ir_para["produtos_quimicos"] = lambda codigo: self._filtrar_por(entry_busca, codigo, pesquisar)
+
+        def formatar(linha):
+            cod, nome, dens, unidade, litros, kilos, local, lote, validade = linha
+            return (cod, nome, f"{dens:.4f}", f"{litros:.3f}", f"{kilos:.3f}", validade or ""), (tag_validade(validade),)
 
-        tree = ttk.Treeview(frame, columns=("codigo","nome","densidade","litros","kilos","validade"), show="headings", height=14)
+        lista = TreeviewPaginada(frame, self.db, ("codigo","nome","densidade","litros","kilos","validade"),
+                                 listar_quimicos_pagina, formatar, nome="produtos_quimicos", tabela="produtos_quimicos", height=14)
+        tree = lista.tree
         for c, n in [("codigo","Código"),("nome","Nome"),("densidade","Dens (kg/L)"),("litros","Litros"),("kilos","Kilos"),("validade","Validade")]:
             tree.heading(c, text=n)
         tree.column("codigo", width=140); tree.column("nome", width=360); tree.column("densidade", width=120, anchor="center")
         tree.column("litros", width=100, anchor="center"); tree.column("kilos", width=100, anchor="center"); tree.column("validade", width=120, anchor="center")
-        tree.pack(fill="both", expand=True, padx=12, pady=8)
+        lista.pack(fill="both", expand=True, padx=12, pady=8)
 
         tree.tag_configure("vencido", background="#FFCDD2")
         tree.tag_configure("proximo", background="#FFF9C4")
 
         def atualizar(filtro=None):
-            tree.delete(*tree.get_children())
-            for cod, nome, dens, unidade, litros, kilos, local, lote, validade in listar_quimicos(self.conn, filtro):
-                tag = ""
-                if validade:
-                    try:
-                        dias = (datetime.strptime(validade, "%Y-%m-%d").date() - date.today()).days
-                        if dias < 0:
-                            tag = "vencido"
-                        elif dias <= VALIDADE_ALERT_DIAS:
-                            tag = "proximo"
-                    except:
-                        tag = ""
-                tree.insert("", "end", values=(cod, nome, f"{dens:.4f}", f"{litros:.3f}", f"{kilos:.3f}", validade or ""), tags=(tag,))
+            lista.recarregar(filtro)
 
         # ações editar/remover para formulação
         def editar_formulacao():
@@ -513,7 +888,7 @@ class SistemaEstoque:
             if not sel:
                 messagebox.showwarning("Atenção", "Selecione uma formulação."); return
             codigo = tree.item(sel[0], "values")[0]
-            self._janela_editar_formulacao(codigo, atualizar)
+            self._janela_editar_formulacao(codigo)
 
         def remover_formulacao():
             sel = tree.selection()
@@ -521,22 +896,140 @@ class SistemaEstoque:
                 messagebox.showwarning("Atenção", "Selecione uma formulação."); return
             codigo, nome = tree.item(sel[0], "values")[0], tree.item(sel[0], "values")[1]
             if messagebox.askyesno("Confirmar", f"Remover '{nome}' (código {codigo})?"):
-                remover_quimico(self.conn, codigo); atualizar()
+                self.db.enviar(remover_quimico, codigo)
+
+        def lotes():
+            sel = tree.selection()
+            if not sel:
+                messagebox.showwarning("Atenção", "Selecione uma formulação."); return
+            codigo, nome = tree.item(sel[0], "values")[0], tree.item(sel[0], "values")[1]
+            self._abrir_com_dados("lotes", lambda linhas: self._janela_lotes(codigo, nome, linhas), listar_lotes, codigo)
 
         bar = tk.Frame(frame, bg=self.COR_BG); bar.pack(fill="x", padx=12, pady=6)
         tk.Button(bar, text="Editar", bg="#4CAF50", fg="white", command=editar_formulacao).pack(side="left", padx=6)
         tk.Button(bar, text="Remover", bg="#D32F2F", fg="white", command=remover_formulacao).pack(side="left", padx=6)
+        tk.Button(bar, text="Lotes…", bg=self.COR_PRIMARY, fg="white", command=lotes).pack(side="left", padx=6)
+        tk.Button(bar, text="Planejar Produção…", bg=self.COR_PRIMARY, fg="white", command=self._planejar_producao).pack(side="left", padx=6)
         tk.Button(bar, text="Atualizar", bg="#607D8B", fg="white", command=lambda: atualizar()).pack(side="right", padx=6)
 
         # salvar função atualizar para uso externo (quando abrir aba)
-        self.atualizar_formulacao = atualizar
+        self.atualizar_formulacao = self.atualizar_abas["produtos_quimicos"] = atualizar
         atualizar()
 
-    def _janela_editar_formulacao(self, codigo, callback):
-        prod = None
-        cur = self.conn.cursor()
-        cur.execute("SELECT codigo, nome, densidade_kg_l, unidade_origem, litros, kilos, local_armazenamento, lote, validade FROM produtos_quimicos WHERE codigo = ?", (codigo,))
-        row = cur.fetchone()
+    @medido_interface
+    def _janela_lotes(self, codigo, nome, linhas):
+        # lotes na ordem de saída; a baixa em kg é distribuída pelo banco (FEFO)
+        j = tk.Toplevel(self.root); j.title(f"Lotes — {codigo}"); j.geometry("780x480"); j.configure(bg=self.COR_BG)
+        tk.Label(j, text=f"{codigo} — {nome}", bg=self.COR_BG, fg=self.COR_ACCENT, font=("Arial", 12, "bold")).pack(anchor="w", padx=12, pady=8)
+        cols = ("lote", "validade", "litros", "kilos", "local")
+        tree = ttk.Treeview(j, columns=cols, show="headings", height=10)
+        for col, txt, larg in zip(cols, ("Lote", "Validade", "Litros", "Kilos", "Local"), (150, 110, 100, 100, 240)):
+            tree.heading(col, text=txt); tree.column(col, width=larg, anchor="w" if col in ("lote", "local") else "center")
+        tree.tag_configure("vencido", background="#FFCDD2"); tree.tag_configure("proximo", background="#FFF9C4")
+        tree.tag_configure("vazio", foreground="#9E9E9E")
+        tree.pack(fill="both", expand=True, padx=12, pady=4)
+
+        def mostrar(linhas):
+            if not tree.winfo_exists(): return
+            tree.delete(*tree.get_children())
+            for lote, validade, litros, kilos, local in linhas:
+                tag = "vazio" if kilos <= 0 else tag_validade(validade)
+                tree.insert("", "end", values=(lote or "", validade or "", f"{litros:.3f}", f"{kilos:.3f}", local or ""), tags=(tag,))
+
+        def recarregar(_=None):
+            self.db.enviar(listar_lotes, codigo, ao_concluir=mostrar)
+
+        form = tk.Frame(j, bg=self.COR_BG); form.pack(fill="x", padx=12, pady=4)
+        entradas = {}
+        for i, (chave, rotulo, largura) in enumerate((("lote", "Lote:", 14), ("validade", "Validade:", 12), ("kilos", "Kg:", 10), ("local", "Local:", 18))):
+            tk.Label(form, text=rotulo, bg=self.COR_BG, fg=self.COR_TEXT).grid(row=0, column=2 * i, sticky="w", padx=4)
+            entradas[chave] = tk.Entry(form, width=largura); entradas[chave].grid(row=0, column=2 * i + 1, padx=4)
+
+        def receber(event=None):
+            lote, validade = entradas["lote"].get().strip(), entradas["validade"].get().strip() or None
+            try:
+                kilos = float(entradas["kilos"].get().replace(",", "."))
+                if validade: datetime.strptime(validade, "%Y-%m-%d")
+            except ValueError:
+                messagebox.showerror("Erro", "Informe os kg e a validade (YYYY-MM-DD).", parent=j); return
+            if not lote:
+                messagebox.showwarning("Atenção", "Informe o lote.", parent=j); return
+            def concluido(_):
+                for e in entradas.values(): e.delete(0, tk.END)
+                recarregar()
+            self.db.enviar(dar_entrada_lote, codigo, lote, validade, kilos=kilos, local=entradas["local"].get().strip() or None,
+                           ao_concluir=concluido, ao_falhar=lambda e: messagebox.showerror("Erro", str(e), parent=j))
+
+        tk.Button(form, text="Receber Lote", bg="#4CAF50", fg="white", command=receber).grid(row=0, column=8, padx=8)
+        for e in entradas.values(): e.bind("<Return>", receber)
+
+        barra = tk.Frame(j, bg=self.COR_BG); barra.pack(fill="x", padx=12, pady=4)
+        tk.Label(barra, text="Baixa (kg):", bg=self.COR_BG, fg=self.COR_TEXT).pack(side="left", padx=4)
+        entry_baixa = tk.Entry(barra, width=10); entry_baixa.pack(side="left", padx=4)
+        vencidos = tk.BooleanVar(value=False)
+
+        def baixar(event=None):
+            try:
+                kilos = float(entry_baixa.get().replace(",", "."))
+            except ValueError:
+                messagebox.showerror("Erro", "Quantidade inválida.", parent=j); return
+            def concluido(alocacao):
+                entry_baixa.delete(0, tk.END); recarregar()
+                messagebox.showinfo("Baixa registrada", "\n".join(f"lote {lote or '(sem lote)'} ({validade or 'sem validade'}): {kg:.3f} kg"
+                                                                   for lote, validade, kg, _ in alocacao), parent=j)
+            self.db.enviar(baixar_quimico, codigo, kilos, incluir_vencidos=vencidos.get(), ao_concluir=concluido,
+                           ao_falhar=lambda e: messagebox.showerror("Erro", str(e), parent=j))
+
+        tk.Button(barra, text="Baixar (FEFO)", bg="#D32F2F", fg="white", command=baixar).pack(side="left", padx=8)
+        tk.Checkbutton(barra, text="Incluir lotes vencidos", variable=vencidos, bg=self.COR_BG, fg=self.COR_TEXT,
+                       selectcolor=self.COR_CARD, activebackground=self.COR_BG).pack(side="left", padx=4)
+        entry_baixa.bind("<Return>", baixar)
+        tk.Button(barra, text="Fechar", bg="#999", fg="white", command=j.destroy).pack(side="right", padx=4)
+        mostrar(linhas)
+
+    def _planejar_producao(self):
+        caminho = filedialog.askopenfilename(title="Ordem de produção (receita, volume_l, codigo, quantidade, unidade)",
+                                             filetypes=[("CSV / JSON", "*.csv *.json *.jsonl"), ("Todos", "*.*")])
+        if not caminho: return
+        self.db.enviar(planejar_producao_arquivo, caminho, ao_concluir=lambda r: self._janela_planejamento(caminho, r),
+                       ao_falhar=lambda e: messagebox.showerror("Erro", f"Falha ao ler o arquivo: {e}"))
+
+    @medido_interface
+    def _janela_planejamento(self, caminho, r):
+        j = tk.Toplevel(self.root); j.title("Planejamento de produção"); j.geometry("980x540"); j.configure(bg=self.COR_BG)
+        texto = f"{os.path.basename(caminho)} — {len(r['linhas'])} químicos, {len(r['faltas'])} em falta"
+        tk.Label(j, text=texto, bg=self.COR_BG, fg=self.COR_ACCENT, font=("Arial", 12, "bold")).pack(anchor="w", padx=12, pady=8)
+        so_faltas = tk.BooleanVar(value=bool(r["faltas"]))
+        cols = ("codigo", "nome", "necessario", "disponivel", "falta", "necessario_l", "disponivel_l")
+        tree = ttk.Treeview(j, columns=cols, show="headings")
+        for col, txt, larg in zip(cols, ("Código", "Nome", "Necessário (kg)", "Disponível (kg)", "Falta (kg)", "Necessário (L)", "Disponível (L)"),
+                                  (120, 300, 110, 110, 100, 110, 110)):
+            tree.heading(col, text=txt); tree.column(col, width=larg, anchor="w" if col in ("codigo", "nome") else "e")
+        tree.tag_configure("falta", background="#FFCDD2")
+
+        def mostrar():
+            tree.delete(*tree.get_children())
+            for linha in (r["faltas"] if so_faltas.get() else r["linhas"]):
+                tree.insert("", "end", values=[f"{v:,.3f}" if isinstance(v, float) else ("" if v is None else v) for v in linha],
+                            tags=("falta",) if linha[4] > 0 else ())
+
+        tk.Checkbutton(j, text="Só os químicos em falta", variable=so_faltas, command=mostrar, bg=self.COR_BG, fg=self.COR_TEXT,
+                       selectcolor=self.COR_CARD, activebackground=self.COR_BG).pack(anchor="w", padx=12)
+        tree.pack(fill="both", expand=True, padx=12, pady=8)
+        erros = [f"linha {n}: {m}" for n, m in r["erros_arquivo"]]
+        erros += [f"{receita + ': ' if receita else ''}{codigo}: {m}" for receita, codigo, m in r["erros"]]
+        if erros:
+            texto = "\n".join(erros[:8]) + (f"\n… e mais {len(erros) - 8}" if len(erros) > 8 else "")
+            tk.Label(j, text=texto, bg=self.COR_BG, fg="#FF8A80", anchor="w", justify="left").pack(fill="x", padx=12)
+        tk.Button(j, text="Fechar", bg="#999", fg="white", command=j.destroy).pack(pady=8)
+        mostrar()
+
+    def _janela_editar_formulacao(self, codigo, callback=None):
+        self._abrir_com_dados("edição formulação", lambda dados: self._janela_edicao_formulacao(*dados, callback=callback),
+                              _quimico_e_lotes, codigo)
+
+    @medido_interface
+    def _janela_edicao_formulacao(self, row, n_lotes=0, callback=None):
         if not row:
             messagebox.showerror("Erro", "Formulação não encontrada."); return
         cod, nome, dens, unidade, litros, kilos, local, lote, validade = row
@@ -568,6 +1061,12 @@ class SistemaEstoque:
 
         lbl_kilos = tk.Label(frame, text=f"Peso (Kg): {kilos:.3f}", bg=self.COR_BG, fg=self.COR_ACCENT)
         lbl_kilos.grid(row=7, column=0, columnspan=3, pady=8, sticky="w")
+        # com vários lotes, quantidades, lote, validade e local são a soma/o primeiro lote
+        # (_projecao_lotes) e só mudam pela janela de lotes
+        if n_lotes > 1:
+            for e in (entry_litros, entry_local, entry_lote, entry_validade): e.config(state="disabled")
+            tk.Label(frame, text=f"{n_lotes} lotes: quantidades, lote, validade e local mudam pela janela Lotes.",
+                     bg=self.COR_BG, fg=self.COR_TEXT).grid(row=9, column=0, columnspan=3, sticky="w")
 
         def calcular_local(event=None):
             try:
@@ -586,15 +1085,32 @@ class SistemaEstoque:
                 dv = float(entry_dens.get()); u = unit_combo.get(); lv = float(entry_litros.get())
             except:
                 messagebox.showerror("Erro", "Densidade e Litros inválidos."); return
-            nk = converter_para_kg_por_l(dv, u) * lv
-            localv = entry_local.get().strip() or None; lotev = entry_lote.get().strip() or None; validadev = entry_validade.get().strip() or None
+            localv = entry_local.get().strip(); lotev = entry_lote.get().strip(); validadev = entry_validade.get().strip()
             if validadev:
                 try:
                     datetime.strptime(validadev, "%Y-%m-%d")
                 except:
                     messagebox.showerror("Erro", "Validade deve estar no formato YYYY-MM-DD."); return
-            atualizar_quimico(self.conn, cod, nome=novo_nome, densidade=converter_para_kg_por_l(dv, u), unidade=u, litros=lv, kilos=nk, local=localv, lote=lotev, validade=validadev)
-            messagebox.showinfo("Sucesso", "Formulação atualizada."); j.destroy(); callback()
+            # só o que mudou, comparado com o texto mostrado (os números aparecem arredondados);
+            # "" apaga local, lote ou validade
+            alterados = {}
+            if novo_nome != nome: alterados["nome"] = novo_nome
+            dens_mudou = entry_dens.get().strip() != f"{dens:.4f}" or u != (unidade or "kg/L")
+            litros_mudou = entry_litros.get().strip() != f"{litros:.3f}"
+            if dens_mudou: alterados.update(densidade=converter_para_kg_por_l(dv, u), unidade=u)
+            if n_lotes <= 1:
+                if litros_mudou: alterados["litros"] = lv
+                if dens_mudou or litros_mudou:
+                    alterados["kilos"] = alterados.get("densidade", dens) * alterados.get("litros", litros)
+                for campo, novo, atual in (("local", localv, local), ("lote", lotev, lote), ("validade", validadev, validade)):
+                    if novo != (atual or ""): alterados[campo] = novo
+            if not alterados:
+                j.destroy(); return
+            def concluido(_):
+                messagebox.showinfo("Sucesso", "Formulação atualizada."); j.destroy()
+                if callback: callback()
+            self.db.enviar(atualizar_quimico, cod, **alterados, ao_concluir=concluido,
+                           ao_falhar=lambda e: messagebox.showerror("Erro", f"Formulação não atualizada: {e}", parent=j))
 
         tk.Button(frame, text="Salvar", bg="#4CAF50", fg="white", command=salvar_edit).grid(row=8, column=0, pady=10)
 
@@ -610,45 +1126,446 @@ class SistemaEstoque:
         for tabela, nome in boxes:
             box = tk.LabelFrame(frame, text=nome, bg=self.COR_BG, fg=self.COR_TEXT, padx=8, pady=8); box.pack(fill="x", padx=12, pady=6)
             tk.Button(box, text="Visualizar Relatório", bg="#607D8B", fg="white", command=lambda t=tabela: self._abrir_relatorio(t)).pack(side="left", padx=8)
+            tk.Button(box, text="Importar…", bg=self.COR_PRIMARY, fg="white", command=lambda t=tabela: self._importar(t)).pack(side="left", padx=8)
+            tk.Button(box, text="Exportar…", bg=self.COR_PRIMARY, fg="white", command=lambda t=tabela: self._exportar(t)).pack(side="left", padx=8)
+        self._montar_relatorios_agregados(frame, boxes)
+        self._montar_consolidacao(frame, boxes)
+        self._montar_backups(frame)
+        self._montar_manutencao(frame)
+        self._montar_painel_desempenho(frame)
+
+    def _montar_relatorios_agregados(self, frame, boxes):
+        box = tk.LabelFrame(frame, text="Relatórios agregados", bg=self.COR_BG, fg=self.COR_TEXT, padx=8, pady=8)
+        box.pack(fill="x", padx=12, pady=6)
+        nomes = {titulo: chave for chave, titulo in RELATORIOS.items()}
+        combo = ttk.Combobox(box, values=list(nomes), width=36, state="readonly"); combo.current(0); combo.pack(side="left", padx=6)
+        tabelas = {nome: tabela for tabela, nome in boxes}
+        combo_tabela = ttk.Combobox(box, values=list(tabelas), width=18, state="disabled"); combo_tabela.current(0)
+        combo_tabela.pack(side="left", padx=6)
+        combo.bind("<<ComboboxSelected>>", lambda e: combo_tabela.config(
+            state="readonly" if nomes[combo.get()] == "detalhe" else "disabled"))
+
+        def visualizar():
+            relatorio, tabela = nomes[combo.get()], tabelas[combo_tabela.get()]
+            if relatorio == "detalhe":
+                self._abrir_relatorio(tabela); return
+            self.db.enviar(ler_relatorio, relatorio, ao_concluir=lambda r: self._janela_relatorio_agregado(*r))
+
+        def exportar():
+            relatorio, tabela = nomes[combo.get()], tabelas[combo_tabela.get()]
+            nome = f"{relatorio}_{tabela}" if relatorio == "detalhe" else relatorio
+            caminho = filedialog.asksaveasfilename(title=f"Exportar — {combo.get()}", initialfile=f"{nome}.xlsx", defaultextension=".xlsx",
+                                                   filetypes=[("Excel", "*.xlsx"), ("PDF", "*.pdf"), ("CSV", "*.csv")])
+            if not caminho: return
+            self._exportar_em_segundo_plano(caminho, exportar_relatorio, relatorio, caminho, tabela=tabela)
+
+        tk.Button(box, text="Visualizar", bg="#607D8B", fg="white", command=visualizar).pack(side="left", padx=8)
+        tk.Button(box, text="Exportar…", bg=self.COR_PRIMARY, fg="white", command=exportar).pack(side="left", padx=8)
+        self.lbl_exportacao = tk.Label(box, text="", bg=self.COR_BG, fg=self.COR_ACCENT)
+        self.lbl_exportacao.pack(side="left", padx=8)
+
+    def _janela_relatorio_agregado(self, titulo, colunas, linhas):
+        j = tk.Toplevel(self.root); j.title(titulo); j.geometry("820x420"); j.configure(bg=self.COR_BG)
+        tk.Label(j, text=titulo, bg=self.COR_BG, fg=self.COR_ACCENT, font=("Arial", 12, "bold")).pack(anchor="w", padx=12, pady=8)
+        tree = ttk.Treeview(j, columns=colunas, show="headings")
+        for col in colunas:
+            tree.heading(col, text=col.replace("_", " ").capitalize())
+            tree.column(col, width=260 if col == colunas[0] else 120, anchor="w" if col == colunas[0] else "e")
+        for linha in linhas:
+            tree.insert("", "end", values=[f"{v:,.3f}" if isinstance(v, float) else ("" if v is None else v) for v in linha])
+        tree.pack(fill="both", expand=True, padx=12, pady=8)
+        tk.Button(j, text="Fechar", bg="#999", fg="white", command=j.destroy).pack(pady=8)
 
+    def _montar_consolidacao(self, frame, boxes):
+        # bancos de outras unidades, abertos só para leitura no trabalhador de exportação
+        box = tk.LabelFrame(frame, text="Consolidação de unidades", bg=self.COR_BG, fg=self.COR_TEXT, padx=8, pady=8)
+        box.pack(fill="x", padx=12, pady=6)
+        bancos = []
+        lbl = tk.Label(box, text="Nenhum banco escolhido", bg=self.COR_BG, fg=self.COR_TEXT, anchor="w")
+
+        def escolher():
+            caminhos = filedialog.askopenfilenames(title="Bancos das unidades", filetypes=[("SQLite", "*.db"), ("Todos", "*.*")])
+            if not caminhos: return
+            bancos[:] = caminhos
+            lbl.config(text=", ".join(nome_unidade(c) for c in caminhos))
+
+        def consolidar():
+            if not bancos: escolher()
+            if not bancos: return
+            lbl.config(text=f"Lendo {len(bancos)} banco(s)…")
+            def concluido(r):
+                lbl.config(text=", ".join(nome_unidade(c) for c in bancos))
+                if not r["unidades"]:
+                    messagebox.showerror("Erro", "Nenhum banco pôde ser lido:\n" + "\n".join(f"{u}: {m}" for u, m in r["erros"])); return
+                self._janela_consolidado(r, boxes)
+            self._trabalhador_exportacao().enviar(_consolidar, list(bancos), ao_concluir=concluido)
+
+        tk.Button(box, text="Escolher bancos…", bg=self.COR_PRIMARY, fg="white", command=escolher).pack(side="left", padx=8)
+        tk.Button(box, text="Consolidar", bg="#607D8B", fg="white", command=consolidar).pack(side="left", padx=8)
+        lbl.pack(side="left", fill="x", padx=8)
+
+    @medido_interface
+    def _janela_consolidado(self, r, boxes):
+        j = tk.Toplevel(self.root); j.title("Consolidado das unidades"); j.geometry("980x560"); j.configure(bg=self.COR_BG)
+        texto = "Unidades: " + ", ".join(r["unidades"])
+        if r["erros"]: texto += "\nNão lidos: " + "; ".join(f"{u} ({m})" for u, m in r["erros"])
+        tk.Label(j, text=texto, bg=self.COR_BG, fg=self.COR_ACCENT, anchor="w", justify="left").pack(fill="x", padx=12, pady=8)
+        abas = ttk.Notebook(j); abas.pack(fill="both", expand=True, padx=12)
+        conteudo = {tabela: r["tabelas"][tabela] for tabela, _ in boxes}
+        conteudo["validade"] = (("unidade", "situacao", "validade", "nome"), r["validade"])
+        titulos = dict(boxes, validade=f"Validade ({len(r['validade'])})")
+        preenchidas, arvores = set(), {}
+        for tabela, (colunas, _) in conteudo.items():
+            aba = tk.Frame(abas, bg=self.COR_BG); abas.add(aba, text=titulos[tabela])
+            tree = ttk.Treeview(aba, columns=colunas, show="headings")
+            for col in colunas:
+                tree.heading(col, text=col.replace("_", " ").capitalize())
+                tree.column(col, width=260 if col == "nome" else 110, anchor="w" if col in ("codigo", "nome", "unidade", "situacao") else "e")
+            sb = ttk.Scrollbar(aba, orient="vertical", command=tree.yview); tree.configure(yscrollcommand=sb.set)
+            tree.pack(side="left", fill="both", expand=True); sb.pack(side="right", fill="y")
+            arvores[str(aba)] = (tabela, tree)
+
+        def preencher(event=None):
+            # cada aba só é preenchida quando aberta: são milhares de linhas por tabela
+            tabela, tree = arvores[abas.select()]
+            if tabela in preenchidas: return
+            preenchidas.add(tabela)
+            for linha in conteudo[tabela][1]:
+                tree.insert("", "end", values=[f"{v:,.3f}" if isinstance(v, float) else ("" if v is None else v) for v in linha])
+
+        def exportar():
+            tabela = arvores[abas.select()][0]
+            caminho = filedialog.asksaveasfilename(parent=j, title="Exportar consolidado", initialfile=f"consolidado_{tabela}.xlsx",
+                                                   defaultextension=".xlsx", filetypes=[("Excel", "*.xlsx"), ("PDF", "*.pdf"), ("CSV", "*.csv")])
+            if not caminho: return
+            self._exportar_em_segundo_plano(caminho, _exportar_consolidado, r, tabela, caminho)
+
+        abas.bind("<<NotebookTabChanged>>", preencher)
+        barra = tk.Frame(j, bg=self.COR_BG); barra.pack(fill="x", pady=8)
+        tk.Button(barra, text="Fechar", bg="#999", fg="white", command=j.destroy).pack(side="right", padx=12)
+        tk.Button(barra, text="Exportar aba…", bg=self.COR_PRIMARY, fg="white", command=exportar).pack(side="right", padx=6)
+
+    def _montar_backups(self, frame):
+        # cópia online pelo trabalhador de exportação: a fila das telas não espera por ela
+        box = tk.LabelFrame(frame, text="Cópias de segurança", bg=self.COR_BG, fg=self.COR_TEXT, padx=8, pady=8)
+        box.pack(fill="x", padx=12, pady=6)
+        comprimir = tk.BooleanVar(value=True)
+        lbl = tk.Label(box, text="", bg=self.COR_BG, fg=self.COR_TEXT, anchor="w")
+
+        def mostrar_ultimo():
+            base = os.path.splitext(os.path.basename(self.caminho_db))[0]
+            copias = listar_backups(BACKUP_DIR, base)
+            lbl.config(text=f"Último: {copias[0][1]} — {len(copias)} cópia(s) em {os.path.abspath(BACKUP_DIR)}" if copias
+                       else "Nenhuma cópia ainda")
+
+        def em_segundo_plano(descricao, funcao, *args, ao_concluir, **kwargs):
+            # progresso por polling, como em _exportar_em_segundo_plano
+            estado = {"feitas": 0, "total": 0, "fim": False}
+            def mostrar():
+                if estado["fim"]: return
+                if estado["total"]:
+                    lbl.config(text=f"{descricao}… {estado['feitas'] * 100 // estado['total']}% ({estado['feitas']} de {estado['total']} páginas)")
+                self.root.after(200, mostrar)
+            def concluido(r):
+                estado["fim"] = True; mostrar_ultimo(); ao_concluir(r)
+            def falhou(erro):
+                estado["fim"] = True; mostrar_ultimo()
+                messagebox.showerror("Erro", f"{descricao} falhou: {erro}")
+            kwargs["progresso"] = lambda feitas, total: estado.update(feitas=feitas, total=total)
+            lbl.config(text=f"{descricao}…")
+            self._trabalhador_exportacao().enviar(funcao, *args, ao_concluir=concluido, ao_falhar=falhou, **kwargs)
+            mostrar()
+
+        def copiar():
+            em_segundo_plano("Cópia", fazer_backup, BACKUP_DIR, comprimir=comprimir.get(), ao_concluir=lambda r: messagebox.showinfo(
+                "Cópia concluída", f"{r['arquivo']}\n{r['paginas']} páginas, {r['bytes'] / 1048576:.1f} MB em {r['segundos']:.1f} s"))
+
+        def restaurar():
+            arquivo = filedialog.askopenfilename(title="Restaurar cópia", initialdir=BACKUP_DIR if os.path.isdir(BACKUP_DIR) else None,
+                                                 filetypes=[("Cópias", "*.db *.db.gz"), ("Todos", "*.*")])
+            if not arquivo: return
+            if not messagebox.askyesno("Restaurar", f"Substituir todo o banco por\n{arquivo}?\n\nO estado atual é guardado numa cópia antes."):
+                return
+            def concluido(r):
+                for atualizar in self.atualizar_abas.values(): atualizar()
+                messagebox.showinfo("Restauração concluída", f"Banco restaurado e conferido em {r['segundos']:.1f} s.\n"
+                                                             f"Estado anterior: {r['copia_antes']}")
+            em_segundo_plano("Restauração", restaurar_backup, arquivo, ao_concluir=concluido)
+
+        tk.Button(box, text="Fazer Cópia Agora", bg=self.COR_PRIMARY, fg="white", command=copiar).pack(side="left", padx=8)
+        tk.Checkbutton(box, text="Comprimir (.gz)", variable=comprimir, bg=self.COR_BG, fg=self.COR_TEXT, selectcolor=self.COR_CARD,
+                       activebackground=self.COR_BG).pack(side="left", padx=4)
+        tk.Button(box, text="Restaurar…", bg="#D32F2F", fg="white", command=restaurar).pack(side="left", padx=8)
+        lbl.pack(side="left", fill="x", padx=8)
+        mostrar_ultimo()
+
+    def _montar_manutencao(self, frame):
+        # ANALYZE, VACUUM incremental e quick_check (manter_banco) pelo trabalhador de exportação
+        box = tk.LabelFrame(frame, text="Manutenção do banco", bg=self.COR_BG, fg=self.COR_TEXT, padx=8, pady=8)
+        box.pack(fill="x", padx=12, pady=6)
+        lbl = tk.Label(box, text="", bg=self.COR_BG, fg=self.COR_TEXT, anchor="w")
+
+        def mostrar_ultima(registros):
+            if not registros:
+                lbl.config(text="Nenhuma manutenção ainda"); return
+            r = registros[0]
+            lbl.config(text=f"Última: {r['inicio']} — {r['paginas_antes']} -> {r['paginas_depois']} páginas, "
+                            f"{r['livres_depois']} livres, {r['segundos']:.1f} s, verificação: {r['verificacao']}")
+        self._mostrar_ultima_manutencao = lambda: self._trabalhador_exportacao().enviar(listar_manutencoes, 1, ao_concluir=mostrar_ultima)
+
+        def executar():
+            if self._manutencao_rodando: return
+            self._manutencao_rodando = True
+            lbl.config(text="Manutenção em andamento…")
+            def concluido(r):
+                self._manutencao_rodando = False; mostrar_ultima([r])
+                if r["verificacao"] != "ok":
+                    messagebox.showwarning("Manutenção", f"A verificação do banco encontrou problemas:\n{r['verificacao']}")
+            def falhou(erro):
+                self._manutencao_rodando = False; self._mostrar_ultima_manutencao()
+                messagebox.showerror("Erro", f"Manutenção falhou: {erro}")
+            self._trabalhador_exportacao().enviar(manter_banco, origem="janela", ao_concluir=concluido, ao_falhar=falhou)
+
+        def historico():
+            self._trabalhador_exportacao().enviar(listar_manutencoes, ao_concluir=self._janela_manutencoes)
+
+        tk.Button(box, text="Executar Agora", bg=self.COR_PRIMARY, fg="white", command=executar).pack(side="left", padx=8)
+        tk.Button(box, text="Histórico…", bg="#607D8B", fg="white", command=historico).pack(side="left", padx=8)
+        lbl.pack(side="left", fill="x", padx=8)
+        self._mostrar_ultima_manutencao()
+
+    def _janela_manutencoes(self, registros):
+        j = tk.Toplevel(self.root); j.title("Manutenções do banco"); j.geometry("900x380"); j.configure(bg=self.COR_BG)
+        cols = ("inicio", "origem", "vacuum", "paginas", "livres", "segundos", "verificacao")
+        tree = ttk.Treeview(j, columns=cols, show="headings")
+        for col, txt, larg in zip(cols, ("Início", "Origem", "Vacuum", "Páginas", "Livres", "Segundos", "Verificação"),
+                                  (150, 80, 90, 130, 100, 80, 220)):
+            tree.heading(col, text=txt); tree.column(col, width=larg, anchor="center")
+        for r in registros:
+            tree.insert("", "end", values=(r["inicio"], r["origem"] or "", r["vacuum"] or "—",
+                                           f"{r['paginas_antes']} -> {r['paginas_depois']}",
+                                           f"{r['livres_antes']} -> {r['livres_depois']}", f"{r['segundos']:.2f}", r["verificacao"]))
+        tree.pack(fill="both", expand=True, padx=12, pady=8)
+        tk.Button(j, text="Fechar", bg="#999", fg="white", command=j.destroy).pack(pady=8)
+
+    # manutenção agendada: com a janela parada há OCIOSO_MS, roda manter_se_pendente
+    # (no máximo uma vez por MANUTENCAO_INTERVALO_HORAS, contado pelo próprio banco).
+    # Nunca o VACUUM completo: as outras estações continuam escrevendo
+    OCIOSO_MS = 10 * 60 * 1000
+    VERIFICAR_OCIOSO_MS = 5 * 60 * 1000
+
+    def _registrar_atividade(self, event=None):
+        self._ultima_atividade = time.monotonic()
+
+    def _verificar_ociosidade(self):
+        self.root.after(self.VERIFICAR_OCIOSO_MS, self._verificar_ociosidade)
+        if self._manutencao_rodando or (time.monotonic() - self._ultima_atividade) * 1000 < self.OCIOSO_MS: return
+        self._manutencao_rodando = True
+        def concluido(r):
+            self._manutencao_rodando = False
+            if r and self._mostrar_ultima_manutencao: self._mostrar_ultima_manutencao()
+        def falhou(erro):
+            # sem janela de erro: o usuário não estava usando o sistema; tenta de novo na próxima
+            self._manutencao_rodando = False
+        self._trabalhador_exportacao().enviar(manter_se_pendente, origem="agenda", ao_concluir=concluido, ao_falhar=falhou)
+
+    def _trabalhador_exportacao(self):
+        if self.db_exportacao is None:
+            self.db_exportacao = TrabalhadorBanco(self.root, self.caminho_db)
+        return self.db_exportacao
+
+    def _exportar_em_segundo_plano(self, caminho, funcao, *args, **kwargs):
+        # roda no trabalhador de exportação; o progresso é escrito pela thread dele
+        # num dict e lido aqui por polling, como as respostas do TrabalhadorBanco
+        self._trabalhador_exportacao()
+        estado = {"linhas": 0, "fim": False}
+        nome = os.path.basename(caminho)
+        def mostrar():
+            if estado["fim"]: return
+            self.lbl_exportacao.config(text=f"Exportando {nome}… {estado['linhas']:,} linhas".replace(",", "."))
+            self.root.after(250, mostrar)
+        def concluido(total):
+            estado["fim"] = True; self.lbl_exportacao.config(text="")
+            messagebox.showinfo("Exportação concluída", f"{total} registros exportados para\n{caminho}")
+        def falhou(erro):
+            estado["fim"] = True; self.lbl_exportacao.config(text="")
+            messagebox.showerror("Erro", f"Falha ao gravar o arquivo: {erro}")
+        kwargs["progresso"] = lambda n: estado.__setitem__("linhas", n)
+        self.db_exportacao.enviar(funcao, *args, ao_concluir=concluido, ao_falhar=falhou, **kwargs)
+        mostrar()
+
+    def _montar_painel_desempenho(self, frame):
+        # tempos medidos nesta sessão (ver "Instrumentação"); SQL só tem contagem
+        box = tk.LabelFrame(frame, text="Desempenho", bg=self.COR_BG, fg=self.COR_TEXT, padx=8, pady=8)
+        box.pack(fill="both", expand=True, padx=12, pady=6)
+        barra = tk.Frame(box, bg=self.COR_BG); barra.pack(fill="x")
+        lbl = tk.Label(barra, bg=self.COR_BG, fg=self.COR_TEXT); lbl.pack(side="left", padx=6)
+        cols = ("categoria", "nome", "chamadas", "media", "p95", "max")
+        tree = ttk.Treeview(box, columns=cols, show="headings", height=8)
+        for col, txt, larg in zip(cols, ("Categoria", "Operação / comando", "Chamadas", "Média (ms)", "p95 (ms)", "Máx (ms)"),
+                                  (100, 520, 80, 90, 90, 90)):
+            tree.heading(col, text=txt); tree.column(col, width=larg, anchor="w" if col == "nome" else "center")
+        tree.tag_configure("lento", background="#FFCDD2")
+        tree.pack(fill="both", expand=True, pady=4)
+
+        def atualizar():
+            if not INSTRUMENTAR:
+                lbl.config(text="Métricas desligadas (ESTOQUE_METRICAS=0)"); return
+            r = metricas.resumo()
+            tree.delete(*tree.get_children())
+            for t in r["tempos"]:
+                tags = ("lento",) if t["p95_ms"] >= 500 else ()
+                tree.insert("", "end", values=(t["categoria"], t["nome"], t["chamadas"], f"{t['media_ms']:.1f}",
+                                               t["p95_ms"], f"{t['max_ms']:.1f}"), tags=tags)
+            for c in r["sql"][:100]:
+                tree.insert("", "end", values=("sql", c["comando"], c["execucoes"], "", "", ""))
+            texto = f"Desde {r['desde']}"
+            if not RASTREAR_SQL: texto += " — comandos SQL não contados (ESTOQUE_METRICAS=sql)"
+            if r["perfis"]: texto += f" — {len(r['perfis'])} perfil(is) em {os.path.abspath(PERFIL_DIR)}"
+            lbl.config(text=texto)
+
+        def zerar():
+            metricas.limpar(); atualizar()
+
+        def exportar():
+            caminho = filedialog.asksaveasfilename(title="Exportar métricas", initialfile="metricas.json", defaultextension=".json",
+                                                   filetypes=[("JSON", "*.json")])
+            if not caminho: return
+            try:
+                metricas.exportar_json(caminho)
+            except OSError as e:
+                messagebox.showerror("Erro", f"Falha ao gravar o arquivo: {e}"); return
+            messagebox.showinfo("Exportação concluída", f"Métricas exportadas para\n{caminho}")
+
+        tk.Button(barra, text="Exportar JSON…", bg=self.COR_PRIMARY, fg="white", command=exportar).pack(side="right", padx=6)
+        tk.Button(barra, text="Zerar", bg="#D32F2F", fg="white", command=zerar).pack(side="right", padx=6)
+        tk.Button(barra, text="Atualizar", bg="#607D8B", fg="white", command=atualizar).pack(side="right", padx=6)
+        self.atualizar_desempenho = atualizar
+        atualizar()
+
+    def _importar(self, tabela):
+        caminho = filedialog.askopenfilename(title=f"Importar — {tabela}",
+                                             filetypes=[("CSV / JSON", "*.csv *.json *.jsonl"), ("Todos", "*.*")])
+        if not caminho: return
+        upsert = messagebox.askyesnocancel("Importar", "Atualizar os códigos que já existem?\n(Não = registrar como erro)")
+        if upsert is None: return
+        self.db.enviar(importar_arquivo, tabela, caminho, upsert=upsert, ao_concluir=lambda r: self._importacao_concluida(tabela, r),
+                       ao_falhar=lambda e: messagebox.showerror("Erro", f"Falha ao ler o arquivo: {e}"))
+
+    def _importacao_concluida(self, tabela, r):
+        # a importação grava em lotes sem passar por cache.alterar (não há linha a linha
+        # para aplicar no widget): a aba da tabela, se já montada, é relida inteira
+        if r["gravados"] and tabela in self.atualizar_abas: self.atualizar_abas[tabela]()
+        msg = f"Lidos: {r['lidos']}\nGravados: {r['gravados']}\nErros: {len(r['erros'])}"
+        if r["erros"]:
+            msg += "\n\n" + "\n".join(f"registro {n}: {m}" for n, m in r["erros"][:15])
+            if len(r["erros"]) > 15: msg += "\n…"
+        messagebox.showinfo("Importação concluída", msg)
+
+    def _exportar(self, tabela):
+        caminho = filedialog.asksaveasfilename(title=f"Exportar — {tabela}", initialfile=f"{tabela}.csv", defaultextension=".csv",
+                                               filetypes=[("CSV", "*.csv"), ("JSON", "*.json"), ("JSON Lines", "*.jsonl"),
+                                                          ("Excel", "*.xlsx"), ("PDF", "*.pdf")])
+        if not caminho: return
+        if caminho.lower().endswith((".xlsx", ".pdf")):
+            self._exportar_em_segundo_plano(caminho, exportar_relatorio, "detalhe", caminho, tabela=tabela)
+        else:
+            self._exportar_em_segundo_plano(caminho, exportar_arquivo, tabela, caminho)
+
+    @medido_interface
     def _abrir_relatorio(self, tabela):
         j = tk.Toplevel(self.root); j.title(f"Relatório — {tabela}"); j.geometry("920x520"); j.configure(bg=self.COR_BG)
         tk.Label(j, text=f"Relatório — {tabela}", bg=self.COR_BG, fg=self.COR_ACCENT, font=("Arial", 12, "bold")).pack(anchor="w", padx=12, pady=8)
+        lbl_totais = tk.Label(j, text="Calculando totais…", bg=self.COR_BG, fg=self.COR_TEXT, anchor="w", justify="left")
+        lbl_totais.pack(fill="x", padx=12)
+        def mostrar_totais(r):
+            if not lbl_totais.winfo_exists(): return
+            if tabela == "produtos_quimicos":
+                texto = f"{r['itens']} itens — {r['litros'] or 0:,.3f} L — {r['kilos'] or 0:,.3f} kg\n"
+                texto += "   ".join(f"{faixa}: {itens}" for faixa, itens in r["validade"])
+            else:
+                texto = f"{r['itens']} itens — {r['unidades'] or 0} unidades"
+            lbl_totais.config(text=texto)
+        self.db.enviar(resumo_tabela, tabela, ao_concluir=mostrar_totais)
         if tabela == "produtos_quimicos":
+            def formatar(linha):
+                codigo, nome, dens, unidade, litros, kilos, local, lote, validade = linha
+                tag = tag_validade(validade)
+                return (codigo, nome, f"{dens:.4f}", unidade, f"{litros:.3f}", f"{kilos:.3f}", local or "", lote or "", validade or ""), (tag,)
             cols = ("codigo","nome","densidade","unidade","litros","kilos","local","lote","validade")
-            tree = ttk.Treeview(j, columns=cols, show="headings")
+            lista = TreeviewPaginada(j, self.db, cols, listar_quimicos_pagina, formatar, nome=f"relatório {tabela}", tabela=tabela)
+            tree = lista.tree
             for col, txt in [("codigo","Código"),("nome","Nome"),("densidade","Dens (kg/L)"),("unidade","Unid"),("litros","Litros"),("kilos","Kilos"),("local","Local"),("lote","Lote"),("validade","Validade")]:
                 tree.heading(col, text=txt)
             tree.tag_configure('vencido', background='#FFCDD2'); tree.tag_configure('proximo', background='#FFF9C4')
-            for codigo, nome, dens, unidade, litros, kilos, local, lote, validade in listar_quimicos(self.conn):
-                tag = ""
-                if validade:
-                    try:
-                        dias = (datetime.strptime(validade, "%Y-%m-%d").date() - date.today()).days
-                        if dias < 0: tag = 'vencido'
-                        elif dias <= VALIDADE_ALERT_DIAS: tag = 'proximo'
-                    except:
-                        tag = ""
-                tree.insert("", "end", values=(codigo, nome, f"{dens:.4f}", unidade, f"{litros:.3f}", f"{kilos:.3f}", local or "", lote or "", validade or ""), tags=(tag,))
         else:
-            cols = ("codigo","nome","quantidade"); tree = ttk.Treeview(j, columns=cols, show="headings")
+            cols = ("codigo","nome","quantidade")
+            lista = TreeviewPaginada(j, self.db, cols, lambda conn, *a: listar_produtos_pagina(conn, tabela, *a), lambda linha: (linha, ()),
+                                     nome=f"relatório {tabela}", tabela=tabela)
+            tree = lista.tree
             tree.heading("codigo", text="Código"); tree.heading("nome", text="Nome"); tree.heading("quantidade", text="Quantidade")
-            for cod, nome, qtd in listar_produtos(self.conn, tabela=tabela):
-                tree.insert("", "end", values=(cod, nome, qtd))
-        tree.pack(fill="both", expand=True, padx=12, pady=8)
+        lista.pack(fill="both", expand=True, padx=12, pady=8)
+        lista.recarregar()
         tk.Button(j, text="Fechar", bg="#999", fg="white", command=j.destroy).pack(pady=8)
 
-    # ---- Evento: troca de aba (alerta de validade apenas na aba Formulação) ----
+    # ---- Evento: troca de aba (montagem na primeira vez; alerta de validade na Formulação) ----
     def _on_tab_changed(self, event):
-        aba_text = self.notebook.tab(self.notebook.select(), "text")
-        if aba_text == "Formulação":
-            vencidos, proximos = verificar_validade_quimicos(self.conn)
-            if vencidos or proximos:
-                self._mostrar_alerta_validade(vencidos, proximos)
-            # atualizar tabela de formulação caso exista
-            if hasattr(self, "atualizar_formulacao"):
+        chave = self._aba_do_frame.get(self.notebook.select())
+        if chave is None: return
+        montada_agora = self._garantir_aba(chave)  # a montagem já carrega a lista
+        if chave == "produtos_quimicos":
+            def concluido(resultado):
+                vencidos, proximos = resultado
+                if vencidos or proximos:
+                    self._mostrar_alerta_validade(vencidos, proximos)
+            self.db.enviar(verificar_validade_quimicos, ao_concluir=concluido, chave="validade")
+            if not montada_agora:
                 self.atualizar_formulacao()
+        elif chave == "relatorios":
+            self.atualizar_desempenho()
+
+    def _on_item_alterado(self, tabela, codigo, antes, depois):
+        # avisa quando uma escrita (baixa, edição, leitura em lote...) leva o item ao
+        # mínimo ou abaixo; as linhas de um mesmo pedido saem num alerta só
+        minimo = self.minimos.get(tabela, {}).get(codigo)
+        if not minimo or depois is None or depois[2] > minimo: return
+        if antes is not None and antes[2] <= minimo: return  # já estava crítico
+        self._criticos_novos.append((tabela, codigo, depois[1], depois[2], minimo, datetime.now().isoformat(timespec="seconds")))
+        if len(self._criticos_novos) == 1:
+            self.root.after_idle(self._alertar_criticos_novos)
+
+    def _alertar_criticos_novos(self):
+        itens, self._criticos_novos = self._criticos_novos, []
+        if itens: self._mostrar_alerta_estoque_baixo(itens, "Chegaram ao estoque mínimo")
+
+    @medido_interface
+    def _mostrar_alerta_estoque_baixo(self, itens, titulo="Itens no estoque mínimo ou abaixo"):
+        nomes = {tabela: t for t, tabela in self.abas if tabela}
+        j = tk.Toplevel(self.root); j.title("Alerta de Estoque Baixo"); j.geometry("760x420"); j.configure(bg=self.COR_BG)
+        tk.Label(j, text="⚠️ Alerta de Estoque Baixo", bg=self.COR_PRIMARY, fg=self.COR_ACCENT, font=("Arial", 14, "bold")).pack(fill="x", pady=8)
+        if not itens:
+            tk.Label(j, text="Nenhum item abaixo do ponto de reposição.", bg=self.COR_BG, fg=self.COR_TEXT).pack(padx=12, pady=20)
+            tk.Button(j, text="Fechar", bg="#607D8B", fg="white", command=j.destroy).pack(pady=8); return
+        tk.Label(j, text=f"{titulo} ({len(itens)})", bg=self.COR_BG, fg=self.COR_TEXT).pack(anchor="w", padx=12)
+        cols = ("estoque", "codigo", "nome", "quantidade", "minimo", "desde")
+        tree = ttk.Treeview(j, columns=cols, show="headings")
+        for col, txt, larg in zip(cols, ("Estoque", "Código", "Nome", "Qtd.", "Mínimo", "Desde"), (120, 110, 260, 60, 60, 130)):
+            tree.heading(col, text=txt); tree.column(col, width=larg, anchor="center" if col in ("quantidade", "minimo") else "w")
+        tree.tag_configure("zerado", background="#FFCDD2")
+        for i, (tabela, codigo, nome, qtd, minimo, desde) in enumerate(itens):
+            tree.insert("", "end", iid=str(i), values=(nomes[tabela], codigo, nome, qtd, minimo, desde.replace("T", " ")),
+                        tags=("zerado",) if qtd <= 0 else ())
+        tree.pack(fill="both", expand=True, padx=12, pady=8)
+        def abrir(event=None):
+            sel = tree.selection()
+            if not sel: return
+            tabela, codigo = itens[int(sel[0])][:2]
+            self._mostrar_item(tabela, codigo)
+        tree.bind("<Double-1>", abrir); tree.bind("<Return>", abrir)
+        tk.Label(j, text="Duplo clique abre o item na aba do estoque.", bg=self.COR_BG, fg=self.COR_ACCENT).pack(anchor="w", padx=12)
+        tk.Button(j, text="Fechar", bg="#607D8B", fg="white", command=j.destroy).pack(pady=8)
 
+    @medido_interface
     def _mostrar_alerta_validade(self, vencidos, proximos):
         j = tk.Toplevel(self.root); j.title("Alerta de Validade — Formulação"); j.geometry("540x420"); j.configure(bg=self.COR_BG)
         tk.Label(j, text="⚠️ Alerta de Validade", bg=self.COR_PRIMARY, fg=self.COR_ACCENT, font=("Arial", 14, "bold")).pack(fill="x", pady=8)
@@ -669,13 +1586,29 @@ class SistemaEstoque:
 # main()
 # -----------------------
 def main():
-    conn = conectar_banco()
-    # corrige colunas ausentes sem popup
-    corrigir_tabela_quimicos_silencioso(conn)
+    parser = argparse.ArgumentParser(description="Sistema de Estoque — BR Brasil")
+    parser.add_argument("--serve", action="store_true", help="roda o servidor HTTP/JSON em vez da janela")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db", default=DB_FILE, help="arquivo do banco")
+    parser.add_argument("--conexoes", type=int, default=4, help="tamanho do pool de conexões do servidor")
+    parser.add_argument("--estresse", type=int, metavar="PROCESSOS",
+                        help="testa escrita concorrente com N processos num banco temporário ao lado de --db")
+    parser.add_argument("--operacoes", type=int, default=500, help="operações por processo no --estresse")
+    args = parser.parse_args()
+    if args.estresse:
+        from estoque.estresse import estressar_banco
+        ok = estressar_banco(os.path.dirname(os.path.abspath(args.db)), args.estresse, args.operacoes)
+        raise SystemExit(0 if ok else 1)
+    if args.serve:
+        from estoque.servidor import servir
+        servir(args.host, args.port, args.db, args.conexoes)
+        return
     root = tk.Tk()
-    app = SistemaEstoque(root, conn)
+    app = SistemaEstoque(root, args.db)
     root.mainloop()
-    conn.close()
+    app.db.fechar()
+    if app.db_exportacao: app.db_exportacao.fechar()
 
 if __name__ == "__main__":
     main()
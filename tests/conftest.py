@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+import threading
+import http.client
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from estoque import banco
+
+@pytest.fixture
+def caminho(tmp_path):
+    return str(tmp_path / "estoque.db")
+
+@pytest.fixture
+def conn(caminho):
+    conn = banco.conectar_banco(caminho)
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def servidor(caminho):
+    conn = banco.conectar_banco(caminho)
+    banco.inserir_produto(conn, "produtos_epis", "E1", "Luva nitrílica", 10)
+    conn.close()
+    from estoque.servidor import criar_servidor
+    srv = criar_servidor(porta=0, caminho=caminho, conexoes=2)
+    threading.Thread(target=srv.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    yield srv
+    srv.shutdown(); srv.server_close(); srv.pool.fechar()
+
+@pytest.fixture
+def pedir(servidor):
+    # pedir(metodo, rota, corpo) -> (status, JSON da resposta); corpo em bytes vai como está
+    def pedir(metodo, rota, corpo=None):
+        c = http.client.HTTPConnection(*servidor.server_address, timeout=5)
+        dados = corpo if isinstance(corpo, (bytes, type(None))) else json.dumps(corpo).encode()
+        c.request(metodo, rota, body=dados, headers={"Content-Type": "application/json"})
+        r = c.getresponse()
+        status, resposta = r.status, json.loads(r.read() or b"null")
+        c.close()
+        return status, resposta
+    return pedir
@@ -0,0 +1,55 @@
+from estoque import banco
+
+def _estado(conn):
+    itens = conn.execute("SELECT categoria, codigo, nome, quantidade, minimo FROM itens ORDER BY categoria, codigo").fetchall()
+    lotes = conn.execute("SELECT codigo, lote, validade, litros, kilos FROM lotes_quimicos ORDER BY codigo, lote").fetchall()
+    return itens, lotes
+
+def _popular(conn):
+    banco.inserir_produto(conn, "produtos_epis", "E1", "Luva", 10)
+    banco.inserir_produto(conn, "produtos", "P1", "Caixa", 5)
+    banco.inserir_quimico(conn, "Q1", "Solvente", 0.8, "kg/L", 0, 0, None, None, None)
+    banco.dar_entrada_lote(conn, "Q1", "L1", "2030-01-01", kilos=4)
+
+def test_log_registra_cada_mudanca(conn):
+    inicio = banco.ultima_alteracao(conn)
+    banco.inserir_produto(conn, "produtos_epis", "E1", "Luva", 10)
+    banco.movimentar_estoque(conn, "produtos_epis", "E1", "baixa", 3)
+    banco.atualizar_produto(conn, "produtos_epis", "E1", nome="Luva")   # não muda nada: sem registro
+    banco.remover_produto(conn, "produtos_epis", "E1")
+    log = list(banco.ler_alteracoes(conn, inicio))
+    assert [(a["tabela"], a["chave"], a["operacao"]) for a in log] == [
+        ("produtos_epis", "E1", "inserir"), ("produtos_epis", "E1", "alterar"), ("produtos_epis", "E1", "remover")]
+    assert log[1]["dados"]["quantidade"] == 7
+    assert list(banco.ler_alteracoes(conn, inicio, compactar=True))[0]["operacao"] == "remover"
+
+def test_log_desde_zero_reconstroi_o_banco(conn, tmp_path):
+    _popular(conn)
+    banco.baixar_quimico(conn, "Q1", 1)
+    banco.remover_produto(conn, "produtos", "P1")
+    arquivo = str(tmp_path / "delta.jsonl")
+    n, ultimo = banco.exportar_alteracoes(conn, arquivo)
+    assert ultimo == banco.ultima_alteracao(conn) and n > 0
+    copia = banco.conectar_banco(str(tmp_path / "copia.db"))
+    banco.aplicar_alteracoes(copia, banco.ler_arquivo_alteracoes(arquivo))
+    assert _estado(copia) == _estado(conn)
+    copia.close()
+
+def test_sincronizar_duas_estacoes_sem_eco(tmp_path):
+    a_caminho, b_caminho = str(tmp_path / "a.db"), str(tmp_path / "b.db")
+    a, b = banco.conectar_banco(a_caminho), banco.conectar_banco(b_caminho)
+    _popular(a)
+    r = banco.sincronizar(b, a_caminho, origem="a")
+    assert r["aplicadas"] > 0 and _estado(b) == _estado(a)
+    banco.movimentar_estoque(b, "produtos_epis", "E1", "baixa", 2)
+    # de volta para a: só a baixa feita em b, não o que b recebeu de a
+    r = banco.sincronizar(a, b_caminho, origem="b")
+    assert r["aplicadas"] == 1 and _estado(a) == _estado(b)
+    assert banco.sincronizar(b, a_caminho, origem="a")["aplicadas"] == 0
+    a.close(); b.close()
+
+def test_rota_alteracoes(pedir):
+    status, corpo = pedir("GET", "/alteracoes?desde=0&limite=1")
+    assert status == 200 and len(corpo["alteracoes"]) == 1 and corpo["ate"] == corpo["alteracoes"][0]["seq"]
+    for rota in ("/alteracoes?desde=x", "/alteracoes?desde=-3", "/alteracoes?limite=1.5"):
+        assert pedir("GET", rota)[0] == 400
@@ -0,0 +1,42 @@
+import os
+from datetime import date, timedelta
+
+import pytest
+
+from estoque import banco
+
+def test_backup_e_restauracao(conn, tmp_path):
+    pasta = str(tmp_path / "backups")
+    banco.inserir_produto(conn, "produtos_epis", "E1", "Luva", 10)
+    r = banco.fazer_backup(conn, pasta, comprimir=True)
+    assert r["arquivo"].endswith(".db.gz") and os.path.exists(r["arquivo"])
+    banco.movimentar_estoque(conn, "produtos_epis", "E1", "baixa", 4)
+    banco.inserir_produto(conn, "produtos_epis", "E2", "Bota", 1)
+    assert banco.buscar_produto(conn, "produtos_epis", "E1")[2] == 6   # em cache
+    restaurado = banco.restaurar_backup(conn, r["arquivo"], diretorio=pasta)
+    assert banco.buscar_produto(conn, "produtos_epis", "E1")[2] == 10
+    assert banco.buscar_produto(conn, "produtos_epis", "E2") is None
+    # o estado de antes da restauração virou uma cópia
+    assert os.path.exists(restaurado["copia_antes"]) and len(banco.listar_backups(pasta)) == 2
+
+def test_restauracao_recusa_arquivo_que_nao_e_banco(conn, tmp_path):
+    lixo = tmp_path / "lixo.db"
+    lixo.write_bytes(b"isto nao e sqlite" * 100)
+    banco.inserir_produto(conn, "produtos_epis", "E1", "Luva", 10)
+    with pytest.raises(banco.sqlite3.DatabaseError):
+        banco.restaurar_backup(conn, str(lixo), diretorio=str(tmp_path / "backups"))
+    assert banco.buscar_produto(conn, "produtos_epis", "E1")[2] == 10
+
+def test_restauracao_nao_repete_versao_em_cache(caminho, tmp_path):
+    a, b = banco.conectar_banco(caminho), banco.conectar_banco(caminho)
+    banco.inserir_quimico(a, "Q1", "Ácido", 1.0, "kg/L", 0, 0, None, None, None)
+    r = banco.fazer_backup(a, str(tmp_path / "backups"))
+    # b guarda em cache a validade com um lote vencendo; depois a cópia (sem o lote) volta
+    banco.dar_entrada_lote(a, "Q1", "L1", (date.today() + timedelta(days=3)).isoformat(), kilos=1)
+    assert len(banco.verificar_validade_quimicos(b)[1]) == 1
+    banco.restaurar_backup(a, r["arquivo"], copia_antes=False)
+    # uma escrita depois da restauração: sem seguir adiante, o contador voltaria
+    # exatamente à versão que b tem em cache
+    banco.atualizar_quimico(a, "Q1", nome="Ácido sulfúrico")
+    assert banco.verificar_validade_quimicos(b) == ([], [])
+    a.close(); b.close()
@@ -0,0 +1,50 @@
+from estoque import banco
+
+def _codigos(linhas):
+    return [l[0] for l in linhas]
+
+def test_indice_acompanha_insert_update_delete(conn):
+    banco.inserir_produto(conn, "produtos", "P1", "Parafuso sextavado", 10)
+    banco.inserir_quimico(conn, "Q1", "Solvente", 0.8, "kg/L", 1, 0.8, "Galpão B", "LT77", None)
+    assert _codigos(banco.buscar_texto(conn, "produtos", "sextavado")) == ["P1"]
+    assert _codigos(banco.buscar_texto(conn, "produtos_quimicos", "galpao")) == ["Q1"]
+    banco.atualizar_produto(conn, "produtos", "P1", nome="Porca borboleta")
+    banco.atualizar_quimico(conn, "Q1", local="Depósito")
+    assert banco.buscar_texto(conn, "produtos", "sextavado") == []
+    assert _codigos(banco.buscar_texto(conn, "produtos", "borboleta")) == ["P1"]
+    assert banco.buscar_texto(conn, "produtos_quimicos", "galpao") == []
+    assert _codigos(banco.buscar_texto(conn, "produtos_quimicos", "deposito")) == ["Q1"]
+    banco.remover_produto(conn, "produtos", "P1")
+    assert banco.buscar_texto(conn, "produtos", "borboleta") == []
+
+def test_prefixo_acento_e_categoria(conn):
+    banco.inserir_produto(conn, "produtos_epis", "E1", "Óculos de proteção", 5)
+    banco.inserir_produto(conn, "produtos_epis", "E2", "Protetor auricular", 5)
+    banco.inserir_produto(conn, "produtos", "P1", "Protetor de rosca", 5)
+    assert _codigos(banco.buscar_texto(conn, "produtos_epis", "oculos protecao")) == ["E1"]
+    assert _codigos(banco.buscar_texto(conn, "produtos_epis", "ÓCU")) == ["E1"]
+    # prefixo, e só a categoria pedida
+    assert sorted(_codigos(banco.buscar_texto(conn, "produtos_epis", "prot"))) == ["E1", "E2"]
+    assert _codigos(banco.listar_produtos(conn, "produtos", "prot")) == ["P1"]
+    assert banco.buscar_texto(conn, "produtos_epis", "  ") == []
+
+def test_relevancia_bm25(conn):
+    banco.inserir_produto(conn, "produtos", "P1", "Fita isolante preta rolo grande de vinil para uso geral", 1)
+    banco.inserir_produto(conn, "produtos", "P2", "Fita isolante", 1)
+    banco.inserir_produto(conn, "produtos", "P3", "Fita dupla face", 1)
+    assert _codigos(banco.buscar_texto(conn, "produtos", "isolante")) == ["P2", "P1"]
+    assert _codigos(banco.buscar_texto(conn, "produtos", "fita", limite=2)) == ["P2", "P3"]
+
+def test_empate_de_nome_ordena_por_codigo(conn):
+    for codigo in ("Q3", "Q1", "Q2"):
+        banco.inserir_quimico(conn, codigo, "Thinner", 0.9, "kg/L", 1, 0.9, None, None, None)
+    assert _codigos(banco.listar_quimicos(conn)) == ["Q1", "Q2", "Q3"]
+    assert _codigos(banco.listar_quimicos(conn, "thin")) == ["Q1", "Q2", "Q3"]
+
+def test_localizar_codigo_exato_primeiro(conn):
+    banco.inserir_produto(conn, "produtos", "AB1", "Cabo AB10", 3)
+    banco.inserir_produto(conn, "produtos_rotulos", "AB10", "Etiqueta", 7)
+    banco.inserir_quimico(conn, "AB100", "Removedor", 1.0, "kg/L", 2, 2, None, None, None)
+    r = banco.localizar(conn, "AB10")
+    assert r[0] == ("produtos_rotulos", "AB10", "Etiqueta", 7)
+    assert {t for t, *_ in r[1:]} == {"produtos", "produtos_quimicos"}
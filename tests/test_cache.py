@@ -0,0 +1,35 @@
+import gc
+import weakref
+from datetime import date, timedelta
+
+from estoque import banco
+
+def test_cache_preso_a_conexao(caminho):
+    a = banco.conectar_banco(caminho)
+    cache = banco.cache_leitura(a)
+    assert banco.cache_leitura(a) is cache
+    banco.inserir_produto(a, "produtos_epis", "E1", "Luva", 10)
+    assert banco.buscar_produto(a, "produtos_epis", "E1") == ("E1", "Luva", 10)
+    ref = weakref.ref(cache)
+    a.close(); del a, cache; gc.collect()
+    assert ref() is None          # o cache some com a conexão
+    b = banco.conectar_banco(caminho)
+    assert b.cache_leitura is None and b.cache_validade is None
+    b.close()
+
+def test_leitura_ve_escrita_de_outra_conexao(caminho):
+    a, b = banco.conectar_banco(caminho), banco.conectar_banco(caminho)
+    banco.inserir_produto(a, "produtos_epis", "E1", "Luva", 10)
+    assert banco.buscar_produto(b, "produtos_epis", "E1")[2] == 10
+    banco.movimentar_estoque(a, "produtos_epis", "E1", "baixa", 4)
+    assert banco.buscar_produto(b, "produtos_epis", "E1")[2] == 6
+    a.close(); b.close()
+
+def test_cache_de_validade_invalida_com_escrita(caminho):
+    a, b = banco.conectar_banco(caminho), banco.conectar_banco(caminho)
+    banco.inserir_quimico(a, "Q1", "Ácido", 1.0, "kg/L", 0, 0, None, None, None)
+    assert banco.verificar_validade_quimicos(b) == ([], [])
+    banco.dar_entrada_lote(a, "Q1", "L1", (date.today() + timedelta(days=3)).isoformat(), kilos=1)
+    vencidos, proximos = banco.verificar_validade_quimicos(b)
+    assert vencidos == [] and [nome for nome, *_ in proximos] == ["Ácido — lote L1"]
+    a.close(); b.close()
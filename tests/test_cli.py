@@ -0,0 +1,22 @@
+from datetime import date, timedelta
+
+from estoque import banco
+from estoque.__main__ import main
+
+def test_quimico_exige_quantidade(caminho, conn, capsys):
+    banco.inserir_quimico(conn, "Q1", "Solvente", 0.8, "kg/L", 0, 0, None, None, None)
+    validade = (date.today() + timedelta(days=30)).isoformat()
+    assert main(["--db", caminho, "entrada", "quimicos", "Q1", "--lote", "L1", "--validade", validade]) == 1
+    assert main(["--db", caminho, "entrada", "quimicos", "Q1", "10", "--lote", "L1", "--validade", validade]) == 0
+    assert main(["--db", caminho, "baixa", "quimicos", "Q1"]) == 1
+    assert "informe CÓDIGO KG" in capsys.readouterr().err
+    assert main(["--db", caminho, "baixa", "quimicos", "Q1", "0"]) == 1
+    assert main(["--db", caminho, "baixa", "quimicos", "Q1", "2.5"]) == 0
+    assert banco.buscar_quimico(conn, "Q1")[5] == 7.5
+
+def test_estoque_sem_quantidade_e_uma_unidade(caminho, conn, capsys):
+    banco.inserir_produto(conn, "produtos_epis", "E1", "Luva", 10)
+    assert main(["--db", caminho, "baixa", "epis", "E1"]) == 0
+    assert main(["--db", caminho, "baixa", "epis", "E1", "3"]) == 0
+    assert main(["--db", caminho, "baixa", "epis", "E1", "1.5"]) == 1
+    assert capsys.readouterr().out.split("\n")[:2] == ["E1\t1\t9", "E1\t3\t6"]
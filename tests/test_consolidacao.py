@@ -0,0 +1,69 @@
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+from estoque import banco
+
+def _unidade(tmp_path, nome, produtos=(), quimicos=()):
+    caminho = str(tmp_path / nome / "estoque.db")
+    (tmp_path / nome).mkdir()
+    conn = banco.conectar_banco(caminho)
+    for tabela, codigo, descricao, qtd in produtos:
+        banco.inserir_produto(conn, tabela, codigo, descricao, qtd)
+    for codigo, descricao, kilos, validade in quimicos:
+        banco.inserir_quimico(conn, codigo, descricao, 1.0, "kg/L", 0, 0, None, None, None)
+        banco.dar_entrada_lote(conn, codigo, "L1", validade, kilos=kilos)
+    conn.close()
+    return caminho
+
+def _versao(caminho, versao):
+    conn = sqlite3.connect(caminho)
+    conn.execute(f"PRAGMA user_version = {versao}")
+    conn.close()
+
+@pytest.fixture
+def unidades(tmp_path):
+    vence = (date.today() + timedelta(days=3)).isoformat()
+    sp = _unidade(tmp_path, "sp", [("produtos_epis", "E1", "Luva", 10), ("produtos_epis", "E2", "Bota", 1)],
+                  [("Q1", "Solvente", 5, "2040-01-01")])
+    rj = _unidade(tmp_path, "rj", [("produtos_epis", "E1", "Luva", 4), ("produtos", "P1", "Parafuso", 7)],
+                  [("Q1", "Solvente", 2, vence)])
+    return sp, rj, vence
+
+def test_junta_por_codigo(unidades):
+    sp, rj, vence = unidades
+    r = banco.consolidar_bancos([sp, rj])
+    assert r["unidades"] == ["sp", "rj"] and r["erros"] == []
+    assert r["tabelas"]["produtos_epis"] == (("codigo", "nome", "total", "sp", "rj"),
+                                             [("E2", "Bota", 1, 1, None), ("E1", "Luva", 14, 10, 4)])
+    assert r["tabelas"]["produtos"][1] == [("P1", "Parafuso", 7, None, 7)]
+    assert r["tabelas"]["produtos_quimicos"][1] == [("Q1", "Solvente", 7, 7, vence, 5, 2)]
+    assert r["validade"] == [("rj", "vence em 3 dias", vence, "Solvente — lote L1")]
+    assert banco.consolidar_bancos([sp, rj], filtro="luva")["tabelas"]["produtos_epis"][1] == [("E1", "Luva", 14, 10, 4)]
+
+def test_leitura_em_blocos(unidades, monkeypatch):
+    monkeypatch.setattr(banco, "BLOCO_CONSOLIDACAO", 1)
+    sp, rj, _ = unidades
+    assert banco.consolidar_bancos([sp, rj], max_paralelo=2)["tabelas"]["produtos_epis"][1][1] == ("E1", "Luva", 14, 10, 4)
+
+def test_versao_anterior_compativel_e_lida(unidades):
+    sp, rj, _ = unidades
+    _versao(rj, banco.VERSAO_MINIMA_LEITURA)
+    r = banco.consolidar_bancos([sp, rj])
+    assert r["erros"] == [] and r["unidades"] == ["sp", "rj"]
+
+def test_versoes_incompativeis_viram_erro_da_unidade(unidades, tmp_path):
+    sp, rj, _ = unidades
+    _versao(rj, banco.VERSAO_MINIMA_LEITURA - 1)
+    novo = _unidade(tmp_path, "bh", [("produtos_epis", "E1", "Luva", 1)])
+    _versao(novo, len(banco.MIGRACOES) + 1)
+    r = banco.consolidar_bancos([sp, rj, novo, str(tmp_path / "nao_existe.db")])
+    assert r["unidades"] == ["sp"]
+    erros = dict(r["erros"])
+    assert "abra-o uma vez no sistema da unidade" in erros["rj"]
+    assert "mais nova que a deste sistema" in erros["bh"]
+    assert "arquivo não encontrado" in erros["nao_existe"]
+    # só a unidade lida aparece nas colunas e nos totais
+    assert r["tabelas"]["produtos_epis"] == (("codigo", "nome", "total", "sp"), [("E2", "Bota", 1, 1), ("E1", "Luva", 10, 10)])
+    assert r["tabelas"]["produtos"][1] == []
@@ -0,0 +1,53 @@
+import pytest
+
+from estoque import banco
+
+def _baixos(conn, tabela=None):
+    return [(t, codigo, qtd, minimo) for t, codigo, _, qtd, minimo, _ in banco.listar_estoque_baixo(conn, tabela)]
+
+def test_entra_e_sai_do_alerta_com_a_quantidade(conn):
+    banco.inserir_produto(conn, "produtos_epis", "E1", "Luva", 10)
+    assert banco.definir_minimos(conn, "produtos_epis", {"E1": 5}) == []
+    assert _baixos(conn) == []
+    banco.movimentar_estoque(conn, "produtos_epis", "E1", "baixa", 5)   # no ponto de reposição já alerta
+    assert _baixos(conn) == [("produtos_epis", "E1", 5, 5)]
+    banco.movimentar_estoque(conn, "produtos_epis", "E1", "baixa", 2)
+    assert _baixos(conn) == [("produtos_epis", "E1", 3, 5)]
+    banco.movimentar_lote(conn, "produtos_epis", "entrada", [("E1", 3)])
+    assert _baixos(conn) == []
+
+def test_entra_e_sai_do_alerta_com_o_minimo(conn):
+    banco.inserir_produto(conn, "produtos", "P1", "Parafuso", 4)
+    banco.definir_minimo(conn, "produtos", "P1", 4)
+    desde = banco.listar_estoque_baixo(conn)[0][5]
+    banco.definir_minimo(conn, "produtos", "P1", 6)
+    assert banco.listar_estoque_baixo(conn)[0][4:] == (6, desde)   # continua baixo: mantém o "desde"
+    banco.definir_minimo(conn, "produtos", "P1", 3)
+    assert _baixos(conn) == []
+    banco.definir_minimo(conn, "produtos", "P1", 9)
+    banco.definir_minimo(conn, "produtos", "P1", 0)   # 0 = sem alerta
+    assert _baixos(conn) == []
+    assert banco.listar_minimos(conn, "produtos") == {}
+
+def test_minimo_zero_nunca_alerta(conn):
+    banco.inserir_produto(conn, "produtos", "P0", "Sem saldo", 0)
+    assert _baixos(conn) == []
+
+def test_remocao_renome_e_ordem(conn):
+    banco.inserir_produto(conn, "produtos", "P1", "Parafuso", 1)
+    banco.inserir_produto(conn, "produtos_rotulos", "R1", "Etiqueta", 3)
+    banco.inserir_produto(conn, "produtos_rotulos", "R2", "Fita", 8)
+    assert banco.definir_minimos(conn, "produtos_rotulos", [("R1", 4), ("R2", 10), ("XX", 1)]) == ["XX"]
+    banco.definir_minimo(conn, "produtos", "P1", 10)
+    # do mais crítico (quantidade / mínimo) para o menos
+    assert [c for _, c, *_ in _baixos(conn)] == ["P1", "R1", "R2"]
+    assert [c for _, c, *_ in _baixos(conn, "produtos_rotulos")] == ["R1", "R2"]
+    banco.atualizar_produto(conn, "produtos_rotulos", "R1", nome="Etiqueta térmica")
+    assert banco.listar_estoque_baixo(conn, "produtos_rotulos")[0][2] == "Etiqueta térmica"
+    banco.remover_produto(conn, "produtos_rotulos", "R2")
+    assert [c for _, c, *_ in _baixos(conn)] == ["P1", "R1"]
+
+def test_minimo_negativo(conn):
+    banco.inserir_produto(conn, "produtos", "P1", "Parafuso", 1)
+    with pytest.raises(ValueError):
+        banco.definir_minimos(conn, "produtos", {"P1": -1})
@@ -0,0 +1,10 @@
+from estoque.estresse import executar_estresse
+
+def test_escrita_concorrente_entre_processos(caminho):
+    # quatro processos disputando 10 itens: nada de "database is locked", nenhuma
+    # baixa passando do saldo e nenhuma atualização perdida
+    r = executar_estresse(caminho, processos=4, operacoes=300, itens=10, inicial=20)
+    assert r["erros"] == 0
+    assert r["negativos"] == 0
+    assert r["divergentes"] == 0
+    assert r["perdidas"] == 0
@@ -0,0 +1,91 @@
+import io
+import json
+import sqlite3
+
+import pytest
+
+from estoque import banco
+
+def _arquivo(tmp_path, nome, texto):
+    caminho = tmp_path / nome
+    caminho.write_text(texto, encoding="utf-8")
+    return str(caminho)
+
+def test_csv_com_erros_por_linha(conn, tmp_path):
+    banco.inserir_produto(conn, "produtos_epis", "E1", "Luva", 3)
+    caminho = _arquivo(tmp_path, "epis.csv", "codigo,nome,quantidade\n"
+                       "E1,Luva repetida,5\nE2,Óculos,7\nE3,,1\nE4,Bota,-2\nE5,Capacete,x\nE6,Protetor,4\n")
+    r = banco.importar_arquivo(conn, "produtos_epis", caminho, tamanho_lote=2)
+    assert (r["lidos"], r["gravados"]) == (6, 2)
+    # no CSV o número é a linha do arquivo (o cabeçalho é a linha 1)
+    assert [n for n, _ in r["erros"]] == [2, 4, 5, 6]
+    assert dict(r["erros"])[2] == "código já cadastrado"
+    assert [p[0] for p in banco.listar_produtos(conn, "produtos_epis")] == ["E1", "E6", "E2"]
+    assert banco.buscar_produto(conn, "produtos_epis", "E1")[2] == 3  # o repetido não mexeu no saldo
+    assert banco.listar_movimentacoes(conn, "produtos_epis", "E2")[0][1:3] == ("entrada", 7)
+
+def test_jsonl_e_array_json_em_blocos_pequenos(conn, tmp_path):
+    registros = [{"codigo": f"P{i:03}", "nome": f"Item {{{i}}}, [x]", "quantidade": i} for i in range(50)]
+    jsonl = _arquivo(tmp_path, "a.jsonl", "\n".join(json.dumps(r) for r in registros) + "\n")
+    assert banco.importar_arquivo(conn, "produtos", jsonl)["gravados"] == 50
+    # o array é lido em blocos de 7 caracteres: objetos cortados no meio, chaves e
+    # colchetes dentro das strings
+    texto = json.dumps(registros, indent=1)
+    assert [r["nome"] for r in banco._objetos_json(io.StringIO(texto), bloco=7)] == [r["nome"] for r in registros]
+    with pytest.raises(json.JSONDecodeError):
+        list(banco._objetos_json(io.StringIO('[{"codigo": "A"}, {"codigo": '), bloco=7))
+
+def test_upsert_mantem_valores_vazios(conn, tmp_path):
+    banco.inserir_quimico(conn, "Q1", "Ácido", 1.2, "g/L", 10, 12, "Galpão A", "L1", "2030-01-01")
+    caminho = _arquivo(tmp_path, "q.json", json.dumps([
+        {"codigo": "Q1", "nome": "Ácido sulfúrico", "densidade": 1.8, "litros": 5, "unidade": "", "local": ""},
+        {"codigo": "Q2", "nome": "Soda", "densidade": 2.1, "litros": 2, "validade": "31/12/2031"}]))
+    r = banco.importar_arquivo(conn, "produtos_quimicos", caminho, upsert=True)
+    assert (r["gravados"], r["erros"]) == (2, [])
+    q1 = banco.buscar_quimico(conn, "Q1")
+    assert q1[1:4] == ("Ácido sulfúrico", 1.8, "g/L")  # unidade vazia não vira "kg/L"
+    assert q1[4:9] == (5, pytest.approx(9), "Galpão A", "L1", "2030-01-01")
+    q2 = banco.buscar_quimico(conn, "Q2")
+    assert (q2[3], q2[5], q2[8]) == ("kg/L", pytest.approx(4.2), "2031-12-31")  # insert novo: padrão kg/L
+
+def test_upsert_de_estoque_gera_ajuste(conn, tmp_path):
+    banco.inserir_produto(conn, "produtos", "P1", "Parafuso", 10)
+    caminho = _arquivo(tmp_path, "p.csv", "codigo,nome,quantidade\nP1,Parafuso M6,4\n")
+    assert banco.importar_arquivo(conn, "produtos", caminho, upsert=True)["gravados"] == 1
+    assert banco.buscar_produto(conn, "produtos", "P1")[1:] == ("Parafuso M6", 4)
+    assert banco.listar_movimentacoes(conn, "produtos", "P1")[0][1:3] == ("ajuste", -6)
+
+def test_retentativa_nao_duplica_erros(conn, monkeypatch):
+    monkeypatch.setattr(banco.time, "sleep", lambda s: None)
+    banco.inserir_produto(conn, "produtos", "P1", "Parafuso", 1)
+    sql = "INSERT INTO itens (categoria, codigo, nome, quantidade) VALUES ('principal', ?, ?, ?)"
+    chamadas = []
+    def params(linha):
+        # 1-2: executemany; 3: linha repetida; 4: banco travado uma vez, no meio do lote
+        chamadas.append(linha[0])
+        if len(chamadas) == 4:
+            raise sqlite3.OperationalError("database is locked")
+        return linha
+    erros = []
+    gravados = banco._gravar_lote(conn, [(sql, params)], [(1, ("P1", "x", 1)), (2, ("P2", "y", 2))], erros)
+    assert gravados == 1 and erros == [(1, "código já cadastrado")]
+
+def test_json_legado_ignora_preco(conn, tmp_path):
+    caminho = _arquivo(tmp_path, "estoque.json", json.dumps([
+        {"codigo": "001", "nome": "Caneta", "quantidade": 30, "preco": 1.5},
+        {"codigo": "002", "nome": "Lápis", "quantidade": "12", "preco": 0.8}]))
+    r = banco.importar_estoque_json_legado(conn, caminho)
+    assert (r["lidos"], r["gravados"], r["erros"]) == (2, 2, [])
+    assert banco.buscar_produto(conn, "produtos", "002") == ("002", "Lápis", 12)
+
+def test_exportar_e_reimportar(conn, tmp_path):
+    banco.inserir_quimico(conn, "Q1", "Ácido", 1.2, "g/L", 10, 12, "Galpão A", "L1", "2030-01-01")
+    banco.inserir_quimico(conn, "Q2", "Soda", 2.1, "kg/L", 2, 4.2, None, None, None)
+    for formato in ("csv", "json", "jsonl"):
+        caminho = str(tmp_path / f"q.{formato}")
+        assert banco.exportar_arquivo(conn, "produtos_quimicos", caminho) == 2
+        destino = banco.conectar_banco(str(tmp_path / f"{formato}.db"))
+        r = banco.importar_arquivo(destino, "produtos_quimicos", caminho, formato="csv" if formato == "csv" else "json")
+        assert (r["gravados"], r["erros"]) == (2, [])
+        assert banco.listar_quimicos(destino) == banco.listar_quimicos(conn)
+        destino.close()
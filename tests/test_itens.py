@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+
+from estoque import banco
+
+def _itens(conn):
+    return conn.execute("SELECT categoria, codigo, nome, quantidade FROM itens ORDER BY categoria, codigo").fetchall()
+
+def test_escrita_pelos_nomes_antigos(conn):
+    # planilhas e scripts de fora ainda escrevem em produtos / produtos_epis / produtos_rotulos
+    with conn:
+        conn.execute("INSERT INTO produtos VALUES ('A1', 'Parafuso', 10)")
+        conn.execute("INSERT INTO produtos_epis (codigo, nome, quantidade) VALUES ('A1', 'Luva', 4)")
+        conn.execute("INSERT INTO produtos_rotulos VALUES ('R1', 'Etiqueta', 7)")
+    assert _itens(conn) == [("epis", "A1", "Luva", 4), ("principal", "A1", "Parafuso", 10), ("rotulos", "R1", "Etiqueta", 7)]
+    with conn:
+        conn.execute("UPDATE produtos_epis SET quantidade = quantidade + 1, nome = 'Luva nitrílica' WHERE codigo = 'A1'")
+        conn.execute("DELETE FROM produtos_rotulos WHERE codigo = 'R1'")
+    assert _itens(conn) == [("epis", "A1", "Luva nitrílica", 5), ("principal", "A1", "Parafuso", 10)]
+    assert conn.execute("SELECT * FROM produtos").fetchall() == [("A1", "Parafuso", 10)]
+    # o mesmo código não pode repetir dentro de um estoque
+    with pytest.raises(sqlite3.IntegrityError):
+        with conn:
+            conn.execute("INSERT INTO produtos_epis VALUES ('A1', 'Outra luva', 1)")
+
+def test_escrita_pela_view_chega_na_busca_e_no_alerta(conn):
+    with conn:
+        conn.execute("INSERT INTO produtos_epis VALUES ('E1', 'Óculos de proteção', 2)")
+    banco.definir_minimo(conn, "produtos_epis", "E1", 5)
+    assert [l[0] for l in banco.buscar_texto(conn, "produtos_epis", "oculos")] == ["E1"]
+    assert banco.buscar_texto(conn, "produtos", "oculos") == []
+    assert [c for _, c, *_ in banco.listar_estoque_baixo(conn)] == ["E1"]
+    with conn:
+        conn.execute("UPDATE produtos_epis SET quantidade = 9 WHERE codigo = 'E1'")
+    assert banco.listar_estoque_baixo(conn) == []
+
+def test_localizar_em_todos_os_estoques(conn):
+    banco.inserir_produto(conn, "produtos", "X1", "Cola branca", 3)
+    banco.inserir_produto(conn, "produtos_epis", "X1", "Avental", 2)
+    banco.inserir_produto(conn, "produtos_rotulos", "R9", "Rótulo cola quente", 5)
+    banco.inserir_quimico(conn, "Q1", "Cola de contato", 0.9, "kg/L", 10, 9, None, None, None)
+    # código exato: os dois estoques que têm X1, antes de qualquer resultado por nome
+    r = banco.localizar(conn, "X1")
+    assert sorted(r) == [("produtos", "X1", "Cola branca", 3), ("produtos_epis", "X1", "Avental", 2)]
+    r = banco.localizar(conn, "cola")
+    assert sorted(t for t, *_ in r) == ["produtos", "produtos_quimicos", "produtos_rotulos"]
+    assert ("produtos_quimicos", "Q1", "Cola de contato", 9) in r   # químicos em kg
+    assert len(banco.localizar(conn, "cola", limite=1)) == 1
+    assert banco.localizar(conn, "   ") == []
@@ -0,0 +1,58 @@
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+from estoque import banco
+
+def _dias(n):
+    return (date.today() + timedelta(days=n)).isoformat()
+
+@pytest.fixture
+def quimico(conn):
+    banco.inserir_quimico(conn, "Q1", "Solvente", 0.8, "kg/L", 0, 0, None, None, None)
+    return "Q1"
+
+def test_baixa_fefo_pula_lote_vencido(conn, quimico):
+    banco.dar_entrada_lote(conn, quimico, "VENCIDO", "2020-01-01", kilos=12)
+    banco.dar_entrada_lote(conn, quimico, "PERTO", _dias(10), kilos=5)
+    banco.dar_entrada_lote(conn, quimico, "LONGE", _dias(90), kilos=20)
+    alocacao = banco.baixar_quimico(conn, quimico, 14)
+    assert [(lote, kg) for lote, _, kg, _ in alocacao] == [("PERTO", 5), ("LONGE", 9)]
+    saldos = {lote: kilos for lote, _, _, kilos, _ in banco.listar_lotes(conn, quimico)}
+    assert saldos == {"VENCIDO": 12, "PERTO": 0, "LONGE": 11}
+    assert banco.buscar_quimico(conn, quimico)[5] == pytest.approx(23)
+
+def test_baixa_recusa_quando_so_vencido_cobre(conn, quimico):
+    banco.dar_entrada_lote(conn, quimico, "VENCIDO", "2020-01-01", kilos=12)
+    banco.dar_entrada_lote(conn, quimico, "BOM", _dias(30), kilos=2)
+    with pytest.raises(ValueError, match="vencidos"):
+        banco.baixar_quimico(conn, quimico, 5)
+    assert banco.buscar_quimico(conn, quimico)[5] == pytest.approx(14)  # nada baixado
+
+def test_baixa_com_vencidos_explicito(conn, quimico):
+    banco.dar_entrada_lote(conn, quimico, "VENCIDO", "2020-01-01", kilos=12)
+    banco.dar_entrada_lote(conn, quimico, "BOM", _dias(30), kilos=2)
+    alocacao = banco.baixar_quimico(conn, quimico, 13, incluir_vencidos=True)
+    assert [(lote, kg) for lote, _, kg, _ in alocacao] == [("VENCIDO", 12), ("BOM", 1)]
+
+def test_baixa_litros_proporcionais(conn, quimico):
+    banco.dar_entrada_lote(conn, quimico, "A", _dias(10), kilos=8)   # 10 L pela densidade
+    banco.baixar_quimico(conn, quimico, 2)
+    (_, _, litros, kilos, _), = banco.listar_lotes(conn, quimico)
+    assert (litros, kilos) == (pytest.approx(7.5), pytest.approx(6))
+
+def test_edicao_de_quimico_com_varios_lotes(conn, quimico):
+    banco.dar_entrada_lote(conn, quimico, "A", _dias(10), kilos=4)
+    banco.dar_entrada_lote(conn, quimico, "B", _dias(20), kilos=6)
+    # nome e densidade mudam; quantidades só pelos lotes
+    banco.atualizar_quimico(conn, quimico, nome="Solvente X", densidade=0.9, unidade="kg/L")
+    linha = banco.buscar_quimico(conn, quimico)
+    assert (linha[1], linha[2], linha[5]) == ("Solvente X", 0.9, pytest.approx(10))
+    with pytest.raises(sqlite3.IntegrityError, match="vários lotes"):
+        banco.atualizar_quimico(conn, quimico, litros=1)
+
+def test_edicao_de_quimico_com_um_lote_vai_para_o_lote(conn, quimico):
+    banco.dar_entrada_lote(conn, quimico, "A", _dias(10), kilos=4, local="P1")
+    banco.atualizar_quimico(conn, quimico, litros=10, kilos=8, local="")
+    assert banco.listar_lotes(conn, quimico) == [("A", _dias(10), 10, 8, None)]
@@ -0,0 +1,30 @@
+import sqlite3
+
+from estoque import banco
+
+def _remover_metade(conn, n=3000):
+    with conn:
+        conn.executemany("INSERT INTO itens (categoria, codigo, nome, quantidade) VALUES ('epis', ?, ?, 1)",
+                         [(f"E{i:05d}", "x" * 200) for i in range(n)])
+    with conn:
+        conn.execute("DELETE FROM itens WHERE categoria = 'epis' AND CAST(substr(codigo, 2) AS INTEGER) % 2 = 0")
+
+def test_banco_novo_recupera_paginas_livres(conn):
+    assert banco.vacuum_incremental(conn)
+    _remover_metade(conn)
+    r = banco.manter_banco(conn, origem="teste")
+    assert r["verificacao"] == "ok" and r["vacuum"] == "incremental"
+    assert r["livres_antes"] > 0 and r["livres_depois"] == 0 and r["paginas_depois"] < r["paginas_antes"]
+    assert banco.listar_manutencoes(conn)[0]["origem"] == "teste"
+    assert banco.manter_se_pendente(conn, intervalo_horas=24) is None
+
+def test_banco_antigo_so_converte_com_completo(caminho):
+    sqlite3.connect(caminho).execute("CREATE TABLE antiga (x)").connection.close()  # sem auto_vacuum
+    conn = banco.conectar_banco(caminho)
+    _remover_metade(conn)
+    r = banco.manter_se_pendente(conn)   # o que a janela ociosa e o cron rodam
+    assert r["vacuum"] is None and not banco.vacuum_incremental(conn)
+    r = banco.manter_banco(conn, completo=True)
+    assert r["vacuum"] == "completo" and banco.vacuum_incremental(conn) and r["livres_depois"] == 0
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    conn.close()
@@ -0,0 +1,56 @@
+import sqlite3
+import threading
+
+import pytest
+
+from estoque import banco
+
+def test_banco_novo_fica_na_versao_atual(conn):
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(banco.MIGRACOES)
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+
+def test_banco_da_primeira_versao_migra_com_os_dados(caminho):
+    # o esquema de antes das migrações: uma tabela por estoque, químicos sem lotes
+    velho = sqlite3.connect(caminho)
+    banco._criar_tabelas(velho)
+    banco.corrigir_tabela_quimicos_silencioso(velho)
+    velho.execute("INSERT INTO produtos_epis VALUES ('E1', 'Luva', 10)")
+    velho.execute("INSERT INTO produtos_quimicos (codigo, nome, densidade_kg_l, litros, kilos, lote, validade) "
+                  "VALUES ('Q1', 'Solvente', 0.8, 5, 4, 'L1', '31/12/2030')")
+    velho.commit(); velho.close()
+    conn = banco.conectar_banco(caminho)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(banco.MIGRACOES)
+    assert banco.buscar_produto(conn, "produtos_epis", "E1") == ("E1", "Luva", 10)
+    assert banco.listar_lotes(conn, "Q1") == [("L1", "2030-12-31", 5, 4, None)]
+    # o log de alterações começa com o que já existia
+    assert {(a["tabela"], a["chave"]) for a in banco.ler_alteracoes(conn)} >= {("produtos_epis", "E1"), ("produtos_quimicos", "Q1")}
+    conn.close()
+
+def test_passo_com_erro_desfaz_so_o_passo(caminho, monkeypatch):
+    conn = banco.conectar_banco(caminho)
+    ultimo = len(banco.MIGRACOES)
+    conn.execute(f"PRAGMA user_version = {ultimo - 1}")
+    def quebrado(c):
+        c.execute("CREATE TABLE meio_passo (x)")
+        raise RuntimeError("falhou no meio")
+    monkeypatch.setattr(banco, "MIGRACOES", banco.MIGRACOES[:-1] + [quebrado])
+    with pytest.raises(RuntimeError):
+        banco.migrar_banco(conn)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == ultimo - 1
+    assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'meio_passo'").fetchone()
+    assert not conn.in_transaction
+    conn.close()
+
+def test_duas_conexoes_migrando_ao_mesmo_tempo(caminho):
+    erros, conexoes = [], []
+    def abrir():
+        try:
+            conexoes.append(banco.conectar_banco(caminho, check_same_thread=False))
+        except Exception as e:
+            erros.append(e)
+    threads = [threading.Thread(target=abrir) for _ in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert erros == []
+    assert {c.execute("PRAGMA user_version").fetchone()[0] for c in conexoes} == {len(banco.MIGRACOES)}
+    for c in conexoes: c.close()
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from estoque import banco
+
+def _dias_atras(n, sufixo=""):
+    return (datetime.now() - timedelta(days=n)).isoformat(timespec="seconds") + sufixo
+
+def test_fotos_antigas_sao_podadas_sem_mudar_saldos(conn):
+    banco.inserir_produto(conn, "produtos_epis", "E1", "Luva", 10)
+    with conn:
+        conn.execute("UPDATE snapshots_saldo SET momento = ?", (_dias_atras(400),))
+    # um ano de fotos diárias, com uma entrada antes de cada uma (datas no passado,
+    # gravadas direto: movimentar_estoque usa a hora atual)
+    with conn:
+        for dias in range(365, 1, -1):
+            conn.execute("UPDATE itens SET quantidade = quantidade + 1 WHERE codigo = 'E1'")
+            conn.execute("""INSERT INTO movimentacoes (tabela, codigo, tipo, quantidade, saldo, momento)
+                            SELECT 'produtos_epis', 'E1', 'entrada', 1, quantidade, ? FROM itens WHERE codigo = 'E1'""",
+                         (_dias_atras(dias),))
+            snap = banco._gravar_snapshot(conn)
+            conn.execute("UPDATE snapshots_saldo SET momento = ? WHERE id = ?", (_dias_atras(dias), snap))
+    dias = (300, 200, 100, 30, 2)
+    datas = [_dias_atras(d, "b") for d in dias]
+    antes = [banco.saldo_em(conn, "produtos_epis", "E1", d) for d in datas]
+    assert banco.registrar_snapshot_saldos(conn, manter_dias=90) is not None
+    fotos = [m for (m,) in conn.execute("SELECT momento FROM snapshots_saldo ORDER BY id")]
+    velhas = [m for m in fotos if m < _dias_atras(90)]
+    assert len(velhas) == len({m[:7] for m in velhas}) <= 15   # uma por mês
+    assert len(fotos) - len(velhas) >= 90
+    assert conn.execute("SELECT COUNT(*) FROM saldos_snapshot WHERE snapshot_id NOT IN (SELECT id FROM snapshots_saldo)").fetchone()[0] == 0
+    assert [banco.saldo_em(conn, "produtos_epis", "E1", d) for d in datas] == antes
+    assert antes == [10 + 366 - d for d in dias]
+
+def _saldos(conn, tabela):
+    return {codigo: qtd for codigo, _, qtd in banco.listar_produtos(conn, tabela)}
+
+def test_lote_parcial_grava_so_as_linhas_validas(conn):
+    banco.inserir_produto(conn, "produtos", "P1", "Parafuso", 10)
+    banco.inserir_produto(conn, "produtos", "P2", "Porca", 2)
+    r = banco.movimentar_lote(conn, "produtos", "baixa", [("P1", 3), ("P2", 5), ("P1", 2), ("XX", 1), ("P2", 0)])
+    assert r["aplicados"] == [("P1", 5, 5)]   # códigos repetidos somados
+    assert sorted(r["erros"]) == [("P2", "saldo insuficiente (atual 2)"), ("XX", "código não cadastrado")]
+    assert _saldos(conn, "produtos") == {"P1": 5, "P2": 2}
+    assert banco.listar_movimentacoes(conn, "produtos", "P1")[0][1:4] == ("baixa", -5, 5)
+    assert len(banco.listar_movimentacoes(conn, "produtos", "P2")) == 1   # só a do cadastro
+
+def test_lote_tudo_ou_nada(conn):
+    banco.inserir_produto(conn, "produtos", "P1", "Parafuso", 10)
+    r = banco.movimentar_lote(conn, "produtos", "baixa", {"P1": 3, "XX": 1}, parcial=False)
+    assert r == {"aplicados": [], "erros": [("XX", "código não cadastrado")]}
+    assert _saldos(conn, "produtos") == {"P1": 10}
+    assert len(banco.listar_movimentacoes(conn, "produtos", "P1")) == 1
+    r = banco.movimentar_lote(conn, "produtos", "entrada", {"P1": 3}, parcial=False)
+    assert r == {"aplicados": [("P1", 3, 13)], "erros": []}
+
+def test_lote_consulta_em_partes(conn, monkeypatch):
+    # mais códigos que variáveis por consulta: o IN é dividido, e só na categoria pedida
+    monkeypatch.setattr(banco, "MAX_VARIAVEIS_SQL", 3)
+    for i in range(10):
+        banco.inserir_produto(conn, "produtos_epis", f"E{i}", f"EPI {i}", i)
+    banco.inserir_produto(conn, "produtos", "E9b", "Outro estoque", 1)
+    itens = [(f"E{i}", 1) for i in range(10)] + [("E9b", 1)]
+    r = banco.movimentar_lote(conn, "produtos_epis", "entrada", itens)
+    assert [(c, s) for c, _, s in r["aplicados"]] == [(f"E{i}", i + 1) for i in range(10)]
+    assert r["erros"] == [("E9b", "código não cadastrado")]
+    assert _saldos(conn, "produtos") == {"E9b": 1}
+
+def test_lote_movimento_invalido(conn):
+    with pytest.raises(ValueError):
+        banco.movimentar_lote(conn, "produtos", "ajuste", [("P1", 1)])
@@ -0,0 +1,33 @@
+from estoque import banco
+
+def _popular(conn, n=250):
+    # nomes repetidos de propósito: a chave da página é (nome, codigo)
+    with conn:
+        conn.executemany("INSERT INTO itens (categoria, codigo, nome, quantidade) VALUES ('epis', ?, ?, ?)",
+                         [(f"E{i:04d}", f"Item {i % 7}", i) for i in range(n)])
+    return sorted(((f"E{i:04d}", f"Item {i % 7}", i) for i in range(n)), key=lambda l: (l[1], l[0]))
+
+def test_paginas_para_frente_cobrem_a_tabela_sem_repetir(conn):
+    esperado = _popular(conn)
+    vistas, depois = [], None
+    while True:
+        pagina = banco.listar_produtos_pagina(conn, "produtos_epis", depois=depois, limite=40)
+        if not pagina: break
+        vistas += pagina
+        depois = (pagina[-1][1], pagina[-1][0])
+    assert vistas == esperado
+
+def test_pagina_para_tras_volta_a_anterior(conn):
+    esperado = _popular(conn)
+    primeira = banco.listar_produtos_pagina(conn, "produtos_epis", limite=40)
+    segunda = banco.listar_produtos_pagina(conn, "produtos_epis", depois=(primeira[-1][1], primeira[-1][0]), limite=40)
+    assert segunda == esperado[40:80]
+    assert banco.listar_produtos_pagina(conn, "produtos_epis", antes=(segunda[0][1], segunda[0][0]), limite=40) == primeira
+
+def test_pagina_com_filtro_e_escrita_no_meio(conn):
+    _popular(conn, 30)
+    banco.inserir_produto(conn, "produtos_epis", "L1", "Luva nitrílica", 3)
+    banco.inserir_produto(conn, "produtos_epis", "L2", "Luva de raspa", 3)
+    assert [l[0] for l in banco.listar_produtos_pagina(conn, "produtos_epis", "luva", limite=10)] == ["L2", "L1"]
+    banco.remover_produto(conn, "produtos_epis", "L2")   # a listagem em cache não pode sobreviver
+    assert [l[0] for l in banco.listar_produtos_pagina(conn, "produtos_epis", "luva", limite=10)] == ["L1"]
@@ -0,0 +1,56 @@
+import pytest
+
+from estoque import banco
+
+@pytest.fixture
+def quimicos(conn):
+    # densidade, litros, kilos
+    banco.inserir_quimico(conn, "AC", "Acetona", 1.5, "kg/L", 10, 15, None, None, None)
+    banco.inserir_quimico(conn, "SO", "Solvente", 0.8, "kg/L", 100, 80, None, None, None)
+    banco.inserir_quimico(conn, "PI", "Pigmento", None, "kg/L", None, 2, None, None, None)
+    return conn
+
+def test_fatores_das_unidades():
+    totais, erros = banco.somar_formulacoes([
+        ("R1", 100, [("A", 0.5, "kg/L"), ("A", 20, "g/L"), ("B", 0.25, "L/L"), ("B", 10, "mL/L"), ("C", 5, "%")]),
+        ("R2", 10, [("A", 1, "kg/L"), ("C", 50, "%")])])
+    assert erros == []
+    assert totais["A"] == [0.0, pytest.approx(50 + 2 + 10)]
+    assert totais["B"] == [pytest.approx(25 + 1), 0.0]
+    assert totais["C"] == [pytest.approx(5 + 5), 0.0]  # "%" é volume/volume
+
+def test_erros_de_componente():
+    totais, erros = banco.somar_formulacoes([("R1", 10, [("A", 1, "lb/gal"), ("B", -1, "kg/L"), ("C", 1, "kg/L")])])
+    assert list(totais) == ["C"]
+    assert erros == [("R1", "A", "unidade inválida: lb/gal"), ("R1", "B", "quantidade inválida")]
+
+def test_planejar_soma_receitas_e_aponta_falta(quimicos):
+    r = banco.planejar_producao(quimicos, [
+        ("Tinta", 100, [("AC", 50, "g/L"), ("SO", 40, "%")]),
+        ("Verniz", 50, [("AC", 0.1, "kg/L"), ("SO", 0.5, "L/L")]),
+        ("Base", 10, [("XX", 1, "kg/L"), ("PI", 1, "L/L")])])
+    linhas = {l[0]: l for l in r["linhas"]}
+    # acetona: 5 kg + 5 kg = 10 kg de 15 disponíveis
+    assert linhas["AC"][1:] == ("Acetona", 10, 15, 0, pytest.approx(6.667), 10)
+    # solvente: 40 L + 25 L = 65 L = 52 kg de 80
+    assert linhas["SO"][2:6] == (52, 80, 0, 65)
+    assert r["faltas"] == []
+    assert sorted(r["erros"]) == [(None, "PI", "químico sem densidade: não dá para converter litros em kg"),
+                                  (None, "XX", "químico não cadastrado")]
+    assert [l[0] for l in r["linhas"]] == ["AC", "SO"]  # por nome
+
+def test_planejar_falta(quimicos):
+    r = banco.planejar_producao(quimicos, [("Tinta", 1000, [("AC", 20, "g/L"), ("SO", 0.1, "kg/L")])])
+    assert [(l[0], l[4]) for l in r["faltas"]] == [("AC", 5), ("SO", 20)]
+
+def test_planejar_arquivo(quimicos, tmp_path):
+    caminho = tmp_path / "ordem.csv"
+    caminho.write_text("receita,volume_l,codigo,quantidade,unidade\n"
+                       "Tinta,100,AC,\"50\",g/L\nTinta,100,SO,40,%\n"
+                       "Tinta,cem,SO,1,%\nVerniz,10,AC,,kg/L\nVerniz,10,SO,1,\n", encoding="utf-8")
+    r = banco.planejar_producao_arquivo(quimicos, str(caminho))
+    assert [n for n, _ in r["erros_arquivo"]] == [4, 5]
+    linhas = {l[0]: l for l in r["linhas"]}
+    # sem unidade vale kg/L: 10 kg de solvente a mais
+    assert linhas["SO"][2] == pytest.approx(32 + 10)
+    assert linhas["AC"][2] == pytest.approx(5)
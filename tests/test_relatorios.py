@@ -0,0 +1,81 @@
+import csv
+import zipfile
+import xml.etree.ElementTree as ET
+from datetime import date, timedelta
+
+import pytest
+
+from estoque import banco
+
+NS = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+def _dias(n):
+    return (date.today() + timedelta(days=n)).isoformat()
+
+@pytest.fixture
+def dados(conn):
+    banco.inserir_produto(conn, "produtos", "P1", "Parafuso", 10)
+    banco.inserir_produto(conn, "produtos", "P2", "Porca", 5)
+    banco.inserir_produto(conn, "produtos_epis", "E1", "Luva <nitrílica> & cia", 3)
+    banco.inserir_quimico(conn, "Q1", "Ácido", 1.5, "kg/L", 2, 3, "Galpão A", "L1", _dias(-1))
+    banco.inserir_quimico(conn, "Q2", "Soda", 2.0, "kg/L", 1, 2, "Galpão A", "L2", _dias(5))
+    banco.inserir_quimico(conn, "Q3", "Tiner", 0.8, "kg/L", 10, 8, "Galpão B", "L2", _dias(60))
+    banco.inserir_quimico(conn, "Q4", "Cera", 1.0, "kg/L", 1, 1, None, None, None)
+    banco.inserir_quimico(conn, "Q5", "Verniz", 1.0, "kg/L", 4, 4, None, None, "ao abrir")
+    return conn
+
+def _linhas(conn, relatorio, tabela=None):
+    return [tuple(l) for l in banco.consultar_relatorio(conn, relatorio, tabela)[2]]
+
+def test_totais(dados):
+    assert _linhas(dados, "totais") == [("produtos", 2, 15, None, None), ("produtos_epis", 1, 3, None, None),
+                                        ("produtos_rotulos", 0, None, None, None), ("produtos_quimicos", 5, None, 18, 18)]
+    assert banco.resumo_tabela(dados, "produtos_epis")["unidades"] == 3
+
+def test_locais_e_lotes(dados):
+    # mais kg primeiro; no empate, pelo nome
+    assert _linhas(dados, "locais") == [("Galpão B", 1, 10, 8, _dias(60)), ("(sem local)", 2, 5, 5, "ao abrir"),
+                                        ("Galpão A", 2, 3, 5, _dias(-1))]
+    assert _linhas(dados, "lotes")[0] == ("L2", 2, 11, 10, _dias(5))
+
+def test_faixas_de_validade(dados):
+    faixas = {faixa: (itens, kilos) for faixa, itens, _, kilos in _linhas(dados, "validade")}
+    assert faixas == {"vencido": (1, 3), f"até {banco.VALIDADE_ALERT_DIAS} dias": (1, 2), "até 90 dias": (1, 8),
+                      "sem validade": (1, 1), "data inválida": (1, 4)}
+    assert [f for f, _ in banco.resumo_tabela(dados, "produtos_quimicos")["validade"]][0] == "vencido"
+
+def test_detalhe_com_filtro(dados):
+    titulo, colunas, cur = banco.consultar_relatorio(dados, "detalhe", "produtos", "porca")
+    assert colunas == ("codigo", "nome", "quantidade") and list(cur) == [("P2", "Porca", 5)]
+    with pytest.raises(ValueError):
+        banco.consultar_relatorio(dados, "detalhe", "nao_existe")
+    with pytest.raises(ValueError):
+        banco.consultar_relatorio(dados, "nao_existe")
+
+def test_xlsx_valido(dados, tmp_path):
+    caminho = str(tmp_path / "detalhe.xlsx")
+    assert banco.exportar_relatorio(dados, "detalhe", caminho, tabela="produtos_epis") == 1
+    with zipfile.ZipFile(caminho) as z:
+        assert z.testzip() is None
+        assert {"[Content_Types].xml", "_rels/.rels", "xl/workbook.xml", "xl/_rels/workbook.xml.rels",
+                "xl/worksheets/sheet1.xml"} <= set(z.namelist())
+        aba = ET.fromstring(z.read("xl/workbook.xml")).find("m:sheets/m:sheet", NS).get("name")
+        planilha = ET.fromstring(z.read("xl/worksheets/sheet1.xml"))
+    assert aba == "Listagem completa — produtos_ep"   # 31 caracteres no máximo
+    linhas = [[c.findtext("m:is/m:t", namespaces=NS) or c.findtext("m:v", namespaces=NS) for c in row]
+              for row in planilha.find("m:sheetData", NS)]
+    assert linhas == [["codigo", "nome", "quantidade"], ["E1", "Luva <nitrílica> & cia", "3"]]
+
+def test_csv_e_pdf(dados, tmp_path):
+    progresso = []
+    caminho = str(tmp_path / "totais.csv")
+    assert banco.exportar_relatorio(dados, "totais", caminho, progresso=progresso.append) == 4
+    with open(caminho, encoding="utf-8-sig", newline="") as f:
+        assert next(csv.reader(f)) == ["tabela", "itens", "unidades", "litros", "kilos"]
+    caminho = str(tmp_path / "validade.pdf")
+    assert banco.exportar_relatorio(dados, "validade", caminho) == 5
+    with open(caminho, "rb") as f:
+        pdf = f.read()
+    assert pdf.startswith(b"%PDF-1.4") and pdf.rstrip().endswith(b"%%EOF") and b"/Count 1" in pdf
+    with pytest.raises(ValueError):
+        banco.exportar_relatorio(dados, "totais", str(tmp_path / "x.doc"))
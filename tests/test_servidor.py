@@ -0,0 +1,26 @@
+import pytest
+
+def test_listar_e_baixa(pedir):
+    assert pedir("GET", "/produtos_epis?limite=10") == (200, [{"codigo": "E1", "nome": "Luva nitrílica", "quantidade": 10}])
+    assert pedir("POST", "/produtos_epis/E1/baixa", {"quantidade": 3}) == (200, {"codigo": "E1", "quantidade": 7})
+    assert pedir("POST", "/produtos_epis/E1/baixa", {"quantidade": 30})[0] == 409
+
+@pytest.mark.parametrize("metodo, rota, corpo", [
+    ("GET", "/produtos?limite=abc", None),
+    ("GET", "/produtos?limite=-1", None),
+    ("GET", "/localizar?q=luva&limite=x", None),
+    ("POST", "/lote", [1, 2]),
+    ("POST", "/lote", {"operacoes": "x"}),
+    ("POST", "/produtos", b"{nao e json"),
+    ("PUT", "/produtos_epis/E1", {"quantidade": "muito"}),
+])
+def test_requisicao_invalida_responde_400(pedir, metodo, rota, corpo):
+    status, resposta = pedir(metodo, rota, corpo)
+    assert status == 400 and "erro" in resposta
+
+def test_lote_com_item_invalido(pedir):
+    status, respostas = pedir("POST", "/lote", {"operacoes": [
+        1, {"op": "buscar", "tabela": "produtos_epis", "codigo": "E1"}, {"op": "listar", "tabela": "produtos", "limite": "x"},
+        {"op": "atualizar", "tabela": "produtos_epis", "codigo": "E1", "dados": [1]}, {"op": "listar", "tabela": ["produtos"]}]})
+    assert status == 200
+    assert [r["status"] for r in respostas] == [400, 200, 400, 400, 404]
@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("tkinter")
+from estoque_interface import TrabalhadorBanco
+
+class RaizFalsa:
+    # só o que o TrabalhadorBanco usa do Tk: root.after; o teste chama _verificar
+    def after(self, ms, funcao):
+        pass
+
+def _esperar(trabalhador, respostas):
+    fim = time.monotonic() + 5
+    while trabalhador._respostas.qsize() < respostas:
+        assert time.monotonic() < fim, "o trabalhador não respondeu"
+        time.sleep(0.01)
+
+@pytest.fixture
+def trabalhador(caminho):
+    t = TrabalhadorBanco(RaizFalsa(), caminho)
+    yield t
+    t.fechar(); t._thread.join(5)
+
+def test_pedido_com_mesma_chave_substitui_o_da_fila(trabalhador):
+    liberar, executados, concluidos = threading.Event(), [], []
+    def segurar(conn):
+        liberar.wait(5)
+    def buscar(conn, termo):
+        executados.append(termo); return termo
+    trabalhador.enviar(segurar)
+    for termo in ("p", "pa", "par"):
+        trabalhador.enviar(buscar, termo, chave="busca", ao_concluir=concluidos.append)
+    liberar.set()
+    _esperar(trabalhador, 2)
+    trabalhador._verificar()
+    # os dois primeiros ainda estavam na fila quando o terceiro chegou: nem executam
+    assert executados == ["par"] and concluidos == ["par"]
+    assert trabalhador._mais_recente == {}
+
+def test_resposta_obsoleta_e_descartada_mas_alteracao_chega(trabalhador):
+    from estoque import banco
+    concluidos, alteracoes = [], []
+    trabalhador.ouvir_alteracoes(lambda tabela, codigo, antes, depois: alteracoes.append((codigo, depois)))
+    trabalhador.enviar(banco.inserir_produto, "produtos", "P1", "Parafuso", 1, chave="salvar", ao_concluir=concluidos.append)
+    _esperar(trabalhador, 1)
+    # já executou, mas um pedido mais novo com a mesma chave chegou antes da resposta ser lida
+    trabalhador.enviar(banco.buscar_produto, "produtos", "P1", chave="salvar", ao_concluir=concluidos.append)
+    _esperar(trabalhador, 2)
+    trabalhador._verificar()
+    assert concluidos == [("P1", "Parafuso", 1)]
+    assert alteracoes == [("P1", ("P1", "Parafuso", 1))]
+
+def test_pedidos_sem_chave_nao_se_cancelam(trabalhador):
+    concluidos, erros = [], []
+    trabalhador.enviar(lambda conn: 1, ao_concluir=concluidos.append)
+    trabalhador.enviar(lambda conn: 1 / 0, ao_falhar=erros.append)
+    trabalhador.enviar(lambda conn: 2, ao_concluir=concluidos.append)
+    _esperar(trabalhador, 3)
+    trabalhador._verificar()
+    assert concluidos == [1, 2] and isinstance(erros[0], ZeroDivisionError)
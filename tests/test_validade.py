@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+
+import pytest
+
+from estoque import banco
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("2030-12-31", "2030-12-31"),
+    ("31/12/2030", "2030-12-31"),
+    ("31-12-2030", "2030-12-31"),
+    (" 1/2/2031 ", "2031-02-01"),
+    (date(2030, 5, 4), "2030-05-04"),
+    ("", None), ("   ", None), (None, None),
+    ("indeterminada", "indeterminada"),
+    ("31/02/2030", "31/02/2030"),   # data inexistente fica como foi digitada
+    ("12/2030", "12/2030"),
+])
+def test_normalizar_validade(texto, esperado):
+    assert banco.normalizar_validade(texto) == esperado
+
+def test_tag_validade():
+    hoje = date(2030, 1, 10)
+    assert banco.tag_validade("2030-01-09", hoje) == "vencido"
+    assert banco.tag_validade("2030-01-10", hoje) == "proximo"
+    assert banco.tag_validade((hoje + timedelta(days=banco.VALIDADE_ALERT_DIAS)).isoformat(), hoje) == "proximo"
+    assert banco.tag_validade((hoje + timedelta(days=banco.VALIDADE_ALERT_DIAS + 1)).isoformat(), hoje) == ""
+    assert banco.tag_validade("09/01/2030", hoje) == "" and banco.tag_validade(None, hoje) == ""
+
+def test_gravacao_normaliza(conn):
+    banco.inserir_quimico(conn, "Q1", "Solvente", 0.8, "kg/L", 1, 0.8, None, "L1", "05/03/2031")
+    banco.inserir_quimico(conn, "Q2", "Tiner", 0.8, "kg/L", 1, 0.8, None, "L2", "sem validade")
+    assert banco.buscar_quimico(conn, "Q1")[8] == "2031-03-05"
+    assert banco.buscar_quimico(conn, "Q2")[8] == "sem validade"
+    banco.atualizar_quimico(conn, "Q1", validade="06-03-2031")
+    assert banco.buscar_quimico(conn, "Q1")[8] == "2031-03-06"
+
+def test_cache_segue_a_versao_da_tabela(conn, monkeypatch):
+    versao = lambda: banco._versao_tabela(conn, "produtos_quimicos")
+    inicial = versao()
+    banco.inserir_quimico(conn, "Q1", "Solvente", 0.8, "kg/L", 0, 0, None, None, None)
+    assert versao() > inicial
+    amanha = (date.today() + timedelta(days=1)).isoformat()
+    banco.dar_entrada_lote(conn, "Q1", "L1", amanha, kilos=4)
+    primeiro = banco.verificar_validade_quimicos(conn)
+    assert [v for _, v, _ in primeiro[1]] == [amanha]
+    # sem escrita: o mesmo resultado, sem consultar de novo
+    assert banco.verificar_validade_quimicos(conn) is primeiro
+    # texto irreconhecível na validade não entra em nenhuma lista
+    banco.dar_entrada_lote(conn, "Q1", "L2", "quando abrir", kilos=1)
+    segundo = banco.verificar_validade_quimicos(conn)
+    assert segundo is not primeiro and segundo == primeiro
+    # virada do dia também invalida: depois de amanhã o lote L1 está vencido
+    class Depois(date):
+        @classmethod
+        def today(cls):
+            return date.today() + timedelta(days=2)
+    monkeypatch.setattr(banco, "date", Depois)
+    vencidos, proximos = banco.verificar_validade_quimicos(conn)
+    assert [v for _, v in vencidos] == [amanha] and proximos == []